@@ -0,0 +1,666 @@
+from datetime import datetime, timezone, timedelta
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+import logging
+import math
+import random
+from firebase_db import db
+from sharded_counter import ShardedCounter, combine_totals
+from sketch import SpaceSaving
+from show_metadata import show_metadata_cache, show_facets
+
+logger = logging.getLogger(__name__)
+
+# One sharded counter per show holding its rating count, sum and 1-10
+# histogram, so a show everyone is rating at once isn't held to one document's
+# write rate
+SHOW_RATING_STATS_COLLECTION = "show_rating_stats"
+RATING_VALUES = range(1, 11)
+
+def _combine_show_stats(total, values):
+    """Sum one shard into a show's totals; trending scores kept as of
+    different times are decayed to the later one before adding"""
+    values = dict(values)
+    score, updated_at = values.pop("trending_score", None), values.pop("trending_updated_at", None)
+    combine_totals(total, values)
+    if updated_at is not None:
+        total["trending_score"], total["trending_updated_at"] = combine_trending(
+            total.get("trending_score"), total.get("trending_updated_at"), score, updated_at)
+    return total
+
+show_rating_counter = ShardedCounter(SHOW_RATING_STATS_COLLECTION, combine=_combine_show_stats)
+
+def empty_histogram():
+    return {str(value): 0 for value in RATING_VALUES}
+
+def ratings_delta(changes):
+    """Field increments for a set of rating changes, each (previous_rating or None, new_rating)"""
+    count = 0
+    total = 0
+    histogram = {}
+    for previous_rating, new_rating in changes:
+        if previous_rating is None:
+            count += 1
+            total += new_rating
+            histogram[new_rating] = histogram.get(new_rating, 0) + 1
+        elif previous_rating != new_rating:
+            total += new_rating - previous_rating
+            histogram[previous_rating] = histogram.get(previous_rating, 0) - 1
+            histogram[new_rating] = histogram.get(new_rating, 0) + 1
+
+    delta = {}
+    if count:
+        delta["count"] = firestore.Increment(count)
+    if total:
+        delta["sum"] = firestore.Increment(total)
+    histogram = {str(value): firestore.Increment(change) for value, change in histogram.items() if change}
+    if histogram:
+        delta["histogram"] = histogram
+    return delta
+
+def rating_delta(previous_rating, new_rating):
+    """Field increments for replacing previous_rating (None if new) with new_rating"""
+    return ratings_delta([(previous_rating, new_rating)])
+
+def get_show_rating_stats(show_id):
+    """A show's aggregate summed from its shards, or None if it was never rated"""
+    return show_rating_counter.get(show_id)
+
+# Trending scores halve in value every half-life. Each shard of a show's
+# aggregate stores its score as of trending_updated_at; a write decays the
+# score to the write's time and adds the rating, so no stored value ever grows
+# past the recent rating rate
+TRENDING_HALF_LIFE_SECONDS = 3 * 24 * 60 * 60
+# Origin of the log-scale rank used to order shows; ranks grow by one per
+# half-life, so they stay small for as long as anyone will run this
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+def _as_datetime(timestamp):
+    return datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+
+def _half_lives(later, earlier):
+    return (_as_datetime(later) - _as_datetime(earlier)).total_seconds() / TRENDING_HALF_LIFE_SECONDS
+
+def decayed_trending_score(trending_score, updated_at, now=None):
+    """A score stored as of updated_at in ratings-made-now terms; a score from
+    a clock running ahead is taken as it is rather than scaled up"""
+    if not trending_score or updated_at is None:
+        return 0.0
+    return trending_score * 2 ** -max(0.0, _half_lives(now or datetime.now(timezone.utc), updated_at))
+
+def combine_trending(score, updated_at, other_score, other_updated_at):
+    """Add two scores kept as of different times; returns (score, updated_at)
+    as of the later time, so neither side is ever scaled up"""
+    if updated_at is None:
+        return other_score or 0.0, other_updated_at
+    if other_updated_at is None:
+        return score or 0.0, updated_at
+    if _as_datetime(other_updated_at) > _as_datetime(updated_at):
+        score, updated_at, other_score, other_updated_at = other_score, other_updated_at, score, updated_at
+    return (score or 0.0) + decayed_trending_score(other_score, other_updated_at, updated_at), updated_at
+
+def trending_rank(trending_score, updated_at):
+    """log2 of a score scaled to TRENDING_EPOCH, which orders shows the same
+    way at any time since every score decays at the same rate"""
+    if not trending_score or trending_score <= 0 or updated_at is None:
+        return float("-inf")
+    return math.log2(trending_score) + _half_lives(updated_at, TRENDING_EPOCH)
+
+def read_trending_shards(show_ids, transaction=None):
+    """Pick a shard of each show's aggregate to take its trending update and
+    read it, in the transaction if one is given, as trending updates replace
+    the stored score. Returns {show_id: (shard, trending state)}; pass an entry
+    to apply_show_rating_delta, which keeps the state current for further
+    ratings of the show."""
+    shards = {show_id: random.randrange(show_rating_counter.num_shards) for show_id in dict.fromkeys(show_ids)}
+    refs = [show_rating_counter.shard_ref(show_id, shard) for show_id, shard in shards.items()]
+    states = {}
+    for doc in db.get_all(refs, transaction=transaction):
+        data = doc.to_dict() if doc.exists else {}
+        states[show_rating_counter.counter_id(doc.id)] = {
+            "trending_score": data.get("trending_score") or 0.0,
+            "trending_updated_at": data.get("trending_updated_at")
+        }
+    return {show_id: (shard, states[show_id]) for show_id, shard in shards.items()}
+
+def rating_counted_at(rating_data):
+    """When a rating counts toward popularity and trending: its timestamp, or
+    None for imported history that was never counted"""
+    return rating_data.get("counted_at", rating_data.get("timestamp"))
+
+def apply_show_rating_delta(writer, show_id, previous_rating, new_rating, rated_at, previous_counted_at=None,
+                            counted=True, trending_shard=None):
+    """Add the aggregate update for one rating change to a transaction or batch.
+
+    previous_counted_at is when the previous rating was counted toward
+    trending (see rating_counted_at); pass counted=False for imported history,
+    which adds no trending weight. Trending changes need trending_shard, an
+    entry from read_trending_shards read before any write.
+    """
+    update = rating_delta(previous_rating, new_rating)
+    update["show_id"] = show_id
+    update["last_rated_at"] = rated_at
+    shard = None
+    if trending_shard is not None and (counted or previous_counted_at):
+        shard, state = trending_shard
+        # A re-rating moves its trending weight to the new time; the previous
+        # rating's weight may sit on another shard, which the sum of the
+        # shards still accounts for
+        score, updated_at = state["trending_score"], state["trending_updated_at"]
+        if counted:
+            score, updated_at = combine_trending(score, updated_at, 1.0, rated_at)
+        if previous_counted_at:
+            score, updated_at = combine_trending(score, updated_at, -1.0, previous_counted_at)
+        state.update(trending_score=score, trending_updated_at=updated_at)
+        update.update(state)
+    show_rating_counter.increment(writer, show_id, update, shard)
+
+def summarize_rating_stats(stats):
+    """Turn a stats document into the summary returned by the API"""
+    stats = stats or {}
+    count = stats.get("count", 0)
+    total = stats.get("sum", 0)
+    histogram = empty_histogram()
+    histogram.update(stats.get("histogram", {}))
+    return {
+        "count": count,
+        "sum": total,
+        "average": round(total / count, 2) if count else None,
+        "histogram": histogram,
+        "last_rated_at": stats.get("last_rated_at")
+    }
+
+def rebuild_show_rating_stats(show_id):
+    """Recompute a show's aggregate from its ratings, e.g. for shows rated before aggregates existed"""
+    stats = {"show_id": show_id, "count": 0, "sum": 0, "histogram": empty_histogram(), "last_rated_at": None,
+             "trending_score": 0.0, "trending_updated_at": datetime.now(timezone.utc).isoformat()}
+    for rating in db.collection("ratings").where("show_id", "==", show_id).stream():
+        rating_data = rating.to_dict()
+        value = rating_data.get("rating")
+        if value is None:
+            continue
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["histogram"][str(value)] += 1
+        timestamp = rating_data.get("timestamp")
+        if rating_counted_at(rating_data):
+            stats["trending_score"] += decayed_trending_score(1.0, rating_counted_at(rating_data),
+                                                              stats["trending_updated_at"])
+        if timestamp and (stats["last_rated_at"] is None or timestamp > stats["last_rated_at"]):
+            stats["last_rated_at"] = timestamp
+    batch = db.batch()
+    show_rating_counter.set(batch, show_id, stats)
+    batch.commit()
+    return stats
+
+# Rating counts per show for every UTC hour and day, by when each rating was
+# last made, so popularity over any window is a sum of a few buckets. Every
+# rating lands in the same open hour and day, so open buckets count on
+# shards. Once a bucket has settled, the few changes it still gets (re-ratings
+# moving out of it) go to its own document as adjustments, and sealing folds
+# the shards into a sketch there, so a sealed bucket is one document read
+POPULAR_BUCKETS_COLLECTION = "popular_buckets"
+# The same buckets per genre and original language ("genre_18", "lang_en"),
+# keyed {facet}_{bucket_id}, so a filtered top list needs no over-fetching
+POPULAR_FACET_BUCKETS_COLLECTION = "popular_facet_buckets"
+# Shards per bucket; every rating made in an hour writes to that hour's bucket
+POPULAR_BUCKET_SHARDS = 20
+# How long after a bucket closes its shards still take writes, for ratings
+# made just before the close that are still being committed; after that it
+# has settled and can be sealed
+POPULAR_BUCKET_SETTLE_SECONDS = 300
+# Closed days whose buckets are (re)checked for sealing on each pass
+POPULAR_SEAL_LOOKBACK_DAYS = 2
+# How often closed buckets are sealed into sketches
+POPULAR_SEAL_INTERVAL_SECONDS = 300
+
+popular_bucket_counter = ShardedCounter(POPULAR_BUCKETS_COLLECTION, POPULAR_BUCKET_SHARDS)
+popular_facet_bucket_counter = ShardedCounter(POPULAR_FACET_BUCKETS_COLLECTION, POPULAR_BUCKET_SHARDS)
+
+def _bucket_ids(timestamp):
+    rated_at = datetime.fromisoformat(timestamp).astimezone(timezone.utc)
+    return (f"hour_{rated_at:%Y%m%d%H}", f"day_{rated_at:%Y%m%d}")
+
+def _bucket_doc_id(bucket_id, facet=None):
+    return bucket_id if facet is None else f"{facet}_{bucket_id}"
+
+def _bucket_ref(bucket_id, facet=None):
+    if facet is None:
+        return db.collection(POPULAR_BUCKETS_COLLECTION).document(bucket_id)
+    return db.collection(POPULAR_FACET_BUCKETS_COLLECTION).document(_bucket_doc_id(bucket_id, facet))
+
+def _bucket_counter(facet=None):
+    return popular_bucket_counter if facet is None else popular_facet_bucket_counter
+
+def popular_bucket_deltas(changes):
+    """Count changes per bucket for rating changes given as (show_id,
+    previous_timestamp, new_timestamp), where a None timestamp isn't counted"""
+    deltas = {}
+    for show_id, previous_timestamp, new_timestamp in changes:
+        new_buckets = _bucket_ids(new_timestamp) if new_timestamp else ()
+        old_buckets = _bucket_ids(previous_timestamp) if previous_timestamp else ()
+        # A re-rating moves out of the buckets of its previous timestamp
+        for bucket_id in old_buckets:
+            if bucket_id not in new_buckets:
+                counts = deltas.setdefault(bucket_id, {})
+                counts[show_id] = counts.get(show_id, 0) - 1
+        for bucket_id in new_buckets:
+            if bucket_id not in old_buckets:
+                counts = deltas.setdefault(bucket_id, {})
+                counts[show_id] = counts.get(show_id, 0) + 1
+    return deltas
+
+def _apply_bucket_increments(writer, bucket_id, increments, facet, now):
+    """Write one bucket's count Increments: to a shard while it is open, to its
+    own document's adjustments once it has settled"""
+    labels = _bucket_labels(bucket_id, facet)
+    if _bucket_settled(bucket_id, now):
+        writer.set(_bucket_ref(bucket_id, facet), {**labels, "bucket": bucket_id, "adjustments": increments},
+                   merge=True)
+    else:
+        _bucket_counter(facet).increment(writer, _bucket_doc_id(bucket_id, facet), {**labels, "counts": increments})
+
+def apply_popular_bucket_deltas(writer, changes, facets=None, overall=True, now=None):
+    """Add one merged write per affected bucket to a transaction or batch.
+
+    facets maps show IDs to the facets their ratings are also counted under;
+    pass overall=False to write only those.
+    """
+    facets = facets or {}
+    now = now or datetime.now(timezone.utc)
+    for bucket_id, counts in popular_bucket_deltas(changes).items():
+        counts = {show_id: change for show_id, change in counts.items() if change}
+        if counts and overall:
+            _apply_bucket_increments(writer, bucket_id, {show_id: firestore.Increment(change)
+                                                         for show_id, change in counts.items()}, None, now)
+        facet_counts = {}
+        for show_id, change in counts.items():
+            for facet in facets.get(show_id, ()):
+                facet_counts.setdefault(facet, {})[show_id] = firestore.Increment(change)
+        for facet, increments in facet_counts.items():
+            _apply_bucket_increments(writer, bucket_id, increments, facet, now)
+
+def popular_bucket_ids(start, end):
+    """IDs of the buckets covering start to end: the hours left in start's day,
+    then whole days up to and including end's day"""
+    hour = start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0) + timedelta(days=1)
+    bucket_ids = []
+    while hour < day:
+        bucket_ids.append(f"hour_{hour:%Y%m%d%H}")
+        hour += timedelta(hours=1)
+    end_day = end.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end_day:
+        bucket_ids.append(f"day_{day:%Y%m%d}")
+        day += timedelta(days=1)
+    return bucket_ids
+
+def _bucket_end(bucket_id):
+    kind, stamp = bucket_id.split("_")
+    if kind == "hour":
+        return datetime.strptime(stamp, "%Y%m%d%H").replace(tzinfo=timezone.utc) + timedelta(hours=1)
+    return datetime.strptime(stamp, "%Y%m%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+
+def _bucket_settled(bucket_id, now):
+    return _bucket_end(bucket_id) + timedelta(seconds=POPULAR_BUCKET_SETTLE_SECONDS) <= now
+
+def _day_hour_ids(day_bucket_id):
+    day = datetime.strptime(day_bucket_id.split("_")[1], "%Y%m%d")
+    return [f"hour_{day + timedelta(hours=hour):%Y%m%d%H}" for hour in range(24)]
+
+def _bucket_labels(bucket_id, facet=None):
+    """Fields a facet bucket's documents carry so they can be found by bucket"""
+    return {} if facet is None else {"facet": facet, "bucket": bucket_id}
+
+@firestore.transactional
+def _seal_bucket_txn(transaction, bucket_id, facet=None):
+    """Seal one settled bucket: write its sketch from the exact counts in its
+    shards and adjustments, and clear both. Returns False if the bucket was
+    already sealed.
+
+    The bucket document and shards are read in the transaction, so sealing
+    the same bucket from several workers at once seals it exactly once.
+    """
+    bucket_ref = _bucket_ref(bucket_id, facet)
+    bucket_data = bucket_ref.get(transaction=transaction).to_dict() or {}
+    if "sketch" in bucket_data:
+        return False
+    counter = _bucket_counter(facet)
+    doc_id = _bucket_doc_id(bucket_id, facet)
+    shard_refs = counter.shard_refs(doc_id)
+    counts = dict(bucket_data.get("adjustments") or {})
+    for shard in db.get_all(shard_refs, transaction=transaction):
+        if shard.exists:
+            for show_id, count in (shard.to_dict().get("counts") or {}).items():
+                counts[show_id] = counts.get(show_id, 0) + count
+    transaction.set(bucket_ref, {**_bucket_labels(bucket_id, facet), "bucket": bucket_id,
+                                 "sketch": SpaceSaving.from_counts(counts).to_dict()})
+    for shard_ref in shard_refs:
+        transaction.delete(shard_ref)
+    counter.invalidate(doc_id)
+    return True
+
+def seal_popular_buckets(now=None):
+    """Summarize recently closed buckets into Space-Saving sketches.
+
+    Safe to run from every worker at once, since each bucket is sealed in its
+    own transaction. Buckets older than the lookback that were never sealed
+    are still answered from their counts.
+    """
+    now = now or datetime.now(timezone.utc)
+    today = now.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    day_ids = [f"day_{today - timedelta(days=days):%Y%m%d}"
+               for days in range(POPULAR_SEAL_LOOKBACK_DAYS, 0, -1)]
+    hour_ids = [hour_id for day_id in day_ids + [f"day_{today:%Y%m%d}"]
+                for hour_id in _day_hour_ids(day_id)]
+    bucket_ids = [bucket_id for bucket_id in hour_ids + day_ids if _bucket_settled(bucket_id, now)]
+    buckets = {bucket.id: bucket.to_dict() for bucket in
+               db.get_all([_bucket_ref(bucket_id) for bucket_id in bucket_ids]) if bucket.exists}
+    # Empty buckets are sealed too, so reads never go to their shards
+    to_seal = [(bucket_id, None) for bucket_id in bucket_ids if "sketch" not in buckets.get(bucket_id, {})]
+
+    # Facet buckets are found by the bucket they belong to, 30 IDs per "in"
+    # query: the shards and documents of every bucket, less the ones already
+    # sealed
+    for start in range(0, len(bucket_ids), 30):
+        bucket_filter = FieldFilter("bucket", "in", bucket_ids[start:start + 30])
+        facet_buckets = {(bucket_data["bucket"], bucket_data["facet"])
+                         for bucket_data in popular_facet_bucket_counter.query(bucket_filter).values()}
+        for bucket in db.collection(POPULAR_FACET_BUCKETS_COLLECTION).where(filter=bucket_filter).stream():
+            bucket_data = bucket.to_dict()
+            if "sketch" in bucket_data:
+                facet_buckets.discard((bucket_data["bucket"], bucket_data["facet"]))
+            else:
+                facet_buckets.add((bucket_data["bucket"], bucket_data["facet"]))
+        to_seal += sorted(facet_buckets)
+
+    return sum(_seal_bucket_txn(db.transaction(), bucket_id, facet) for bucket_id, facet in to_seal)
+
+def top_recent_shows(start, end, facet=None):
+    """Space-Saving summary of ratings per show made between start and end,
+    optionally only for shows in one facet.
+
+    Every bucket's document is read in one get_all. Sealed buckets contribute
+    their sketches, and only unsealed ones have their shards read and summed.
+    Adjustments (re-ratings that moved out of a settled bucket) are added on
+    top. Memory stays bounded by the sketch capacity however many shows were
+    rated in sealed buckets.
+    """
+    bucket_ids = popular_bucket_ids(start, end)
+    doc_ids = [_bucket_doc_id(bucket_id, facet) for bucket_id in bucket_ids]
+    buckets = {bucket.id: bucket.to_dict() for bucket in
+               db.get_all([_bucket_ref(bucket_id, facet) for bucket_id in bucket_ids]) if bucket.exists}
+
+    summary = SpaceSaving()
+    # Exact counts of the unsealed buckets, and count changes to sealed ones
+    counts = {}
+    changes = {}
+    for doc_id in doc_ids:
+        bucket_data = buckets.get(doc_id, {})
+        sealed = "sketch" in bucket_data
+        if sealed:
+            summary.merge(SpaceSaving.from_dict(bucket_data["sketch"]))
+        for show_id, change in (bucket_data.get("adjustments") or {}).items():
+            target = changes if sealed else counts
+            target[show_id] = target.get(show_id, 0) + change
+    unsealed = [doc_id for doc_id in doc_ids if "sketch" not in buckets.get(doc_id, {})]
+    for bucket_data in _bucket_counter(facet).get_many(unsealed).values():
+        for show_id, count in (bucket_data.get("counts") or {}).items():
+            counts[show_id] = counts.get(show_id, 0) + count
+
+    summary.merge(SpaceSaving.from_counts(counts))
+    summary.merge(SpaceSaving.from_counts(changes))
+    # Decrements are applied once everything is merged, so they find the
+    # shows they belong to
+    return summary.subtract({show_id: -change for show_id, change in changes.items() if change < 0})
+
+def rebuild_popular_buckets():
+    """Recompute every bucket from the ratings, e.g. for ratings made before buckets existed"""
+    buckets = {}
+    # Ratings are counted under the facets stored with them, which is what a
+    # later re-rating takes back out; older ratings use their show's facets
+    stored_facets = []
+    for rating in db.collection("ratings").select(["show_id", "timestamp", "counted_at", "facets"]).stream():
+        rating_data = rating.to_dict()
+        show_id, timestamp = rating_data.get("show_id"), rating_counted_at(rating_data)
+        if not show_id or not timestamp:
+            continue
+        bucket_ids = _bucket_ids(timestamp)
+        for bucket_id in bucket_ids:
+            counts = buckets.setdefault(bucket_id, {})
+            counts[show_id] = counts.get(show_id, 0) + 1
+        stored_facets.append((show_id, bucket_ids, rating_data.get("facets")))
+
+    # Shows whose details were never fetched have no facets to count under
+    metadata = show_metadata_cache.get_many({show_id for show_id, _, facets in stored_facets if facets is None})
+    facet_buckets = {}
+    for show_id, bucket_ids, facets in stored_facets:
+        if facets is None:
+            facets = show_facets(metadata.get(show_id, {}))
+        for facet in facets:
+            for bucket_id in bucket_ids:
+                counts = facet_buckets.setdefault((facet, bucket_id), {})
+                counts[show_id] = counts.get(show_id, 0) + 1
+
+    now = datetime.now(timezone.utc)
+    writes = [(None, bucket_id, {"counts": counts}) for bucket_id, counts in buckets.items()]
+    writes += [(facet, bucket_id, {**_bucket_labels(bucket_id, facet), "counts": counts})
+               for (facet, bucket_id), counts in facet_buckets.items()]
+    batch = db.batch()
+    pending = 0
+    for facet, bucket_id, bucket_data in writes:
+        # Each bucket costs a write per shard plus one for its own document
+        if pending + POPULAR_BUCKET_SHARDS + 1 > 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+        # Settled buckets are sealed straight away, leaving nothing in their shards
+        if _bucket_settled(bucket_id, now):
+            sketch = SpaceSaving.from_counts(bucket_data["counts"]).to_dict()
+            batch.set(_bucket_ref(bucket_id, facet),
+                      {**_bucket_labels(bucket_id, facet), "bucket": bucket_id, "sketch": sketch})
+            bucket_data = {**bucket_data, "counts": {}}
+        else:
+            batch.delete(_bucket_ref(bucket_id, facet))
+        _bucket_counter(facet).set(batch, _bucket_doc_id(bucket_id, facet), bucket_data)
+        pending += POPULAR_BUCKET_SHARDS + 1
+    if pending:
+        batch.commit()
+    return len(buckets)
+
+# One sharded counter per user holding how many users follow them and how
+# many they follow, so a popular account isn't held to one document's write rate
+FOLLOW_COUNTS_COLLECTION = "follow_counts"
+
+follow_counter = ShardedCounter(FOLLOW_COUNTS_COLLECTION)
+
+def apply_follow_count_deltas(writer, follower_id, followee_id, change):
+    """Add the counter updates for follower_id following (change=1) or
+    unfollowing (change=-1) followee_id to a transaction or batch"""
+    follow_counter.increment(writer, followee_id, {"followers": firestore.Increment(change)})
+    follow_counter.increment(writer, follower_id, {"following": firestore.Increment(change)})
+
+def get_follow_counts(user_id):
+    """A user's follower and following counts, summed from their shards"""
+    counts = follow_counter.get(user_id) or {}
+    return {"followers_count": counts.get("followers", 0), "following_count": counts.get("following", 0)}
+
+def rebuild_follow_counts():
+    """Recount every user's followers and followings from the follows collection"""
+    counts = {}
+    for follow in db.collection("follows").select(["follower_id", "followee_id"]).stream():
+        counts.setdefault(follow.get("followee_id"), {"followers": 0, "following": 0})["followers"] += 1
+        counts.setdefault(follow.get("follower_id"), {"followers": 0, "following": 0})["following"] += 1
+
+    batch = db.batch()
+    pending = 0
+    for user_id, user_counts in counts.items():
+        if pending + follow_counter.num_shards > 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+        follow_counter.set(batch, user_id, user_counts)
+        pending += follow_counter.num_shards
+    if pending:
+        batch.commit()
+    return len(counts)
+
+# One document per user holding the count, sum and 1-10 histogram of their
+# show ratings, plus how many episodes they have rated
+USER_RATING_STATS_COLLECTION = "user_rating_stats"
+
+def user_rating_stats_ref(user_id):
+    return db.collection(USER_RATING_STATS_COLLECTION).document(user_id)
+
+def apply_user_rating_deltas(writer, user_id, changes, new_episode_ratings=0):
+    """Add one merged update of a user's stats to a transaction or batch, for show
+    rating changes given as (previous_rating, new_rating) and newly rated episodes"""
+    update = ratings_delta(changes)
+    if new_episode_ratings:
+        update["episode_rating_count"] = firestore.Increment(new_episode_ratings)
+    if update:
+        update["user_id"] = user_id
+        writer.set(user_rating_stats_ref(user_id), update, merge=True)
+
+def summarize_user_rating_stats(stats):
+    """Turn a user stats document into the stats returned by the API"""
+    summary = summarize_rating_stats(stats)
+    del summary["last_rated_at"]
+    summary["episode_rating_count"] = (stats or {}).get("episode_rating_count", 0)
+    return summary
+
+def rebuild_user_rating_stats(user_id):
+    """Recompute a user's stats from their ratings, e.g. for users who rated before stats existed"""
+    stats = {"user_id": user_id, "count": 0, "sum": 0, "histogram": empty_histogram()}
+    for rating in db.collection("ratings").where("user_id", "==", user_id).stream():
+        value = rating.get("rating")
+        if value is None:
+            continue
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["histogram"][str(value)] += 1
+    stats["episode_rating_count"] = db.collection("episode_ratings") \
+        .where("user_id", "==", user_id).count().get()[0][0].value
+    user_rating_stats_ref(user_id).set(stats)
+    return stats
+
+# One document per (show, season) with the rating count and sum of each episode
+EPISODE_RATING_STATS_COLLECTION = "episode_rating_stats"
+# One document per (user, show, season) with that user's rating of each episode
+USER_SEASON_RATINGS_COLLECTION = "user_season_ratings"
+
+def episode_rating_stats_ref(show_id, season_number):
+    return db.collection(EPISODE_RATING_STATS_COLLECTION).document(f"{show_id}_s{season_number}")
+
+def user_season_ratings_ref(user_id, show_id, season_number):
+    return db.collection(USER_SEASON_RATINGS_COLLECTION).document(f"{user_id}_{show_id}_s{season_number}")
+
+def apply_season_rating_deltas(writer, user_id, show_id, season_number, changes):
+    """Add the season aggregate and user season updates for a user's episode rating
+    changes in one season, given as (episode_number, previous_rating, new_rating).
+
+    Each document gets a single merged write however many episodes changed.
+    """
+    episode_deltas = {}
+    user_episodes = {}
+    for episode_number, previous_rating, new_rating in changes:
+        episode_key = str(episode_number)
+        episode_delta = {}
+        if previous_rating is None:
+            episode_delta["count"] = firestore.Increment(1)
+        if previous_rating != new_rating:
+            episode_delta["sum"] = firestore.Increment(new_rating - (previous_rating or 0))
+        if episode_delta:
+            episode_deltas[episode_key] = episode_delta
+        user_episodes[episode_key] = new_rating
+
+    if episode_deltas:
+        writer.set(episode_rating_stats_ref(show_id, season_number), {
+            "show_id": show_id,
+            "season_number": season_number,
+            "episodes": episode_deltas
+        }, merge=True)
+
+    writer.set(user_season_ratings_ref(user_id, show_id, season_number), {
+        "user_id": user_id,
+        "show_id": show_id,
+        "season_number": season_number,
+        "episodes": user_episodes
+    }, merge=True)
+
+def apply_episode_rating_delta(writer, rating_data, previous_rating):
+    """Add the season aggregate and user season updates for one episode rating change"""
+    apply_season_rating_deltas(
+        writer, rating_data["user_id"], rating_data["show_id"], rating_data["season_number"],
+        [(rating_data["episode_number"], previous_rating, rating_data["rating"])])
+
+def summarize_episode_heatmap(season_stats, user_seasons):
+    """Merge season aggregates and a user's season ratings into one season-by-episode matrix"""
+    seasons = {}
+    for stats in season_stats:
+        season = seasons.setdefault(stats["season_number"], {})
+        for episode_key, episode in stats.get("episodes", {}).items():
+            count = episode.get("count", 0)
+            season[int(episode_key)] = {
+                "episode_number": int(episode_key),
+                "rating": None,
+                "average": round(episode.get("sum", 0) / count, 2) if count else None,
+                "count": count
+            }
+    for user_season in user_seasons:
+        season = seasons.setdefault(user_season["season_number"], {})
+        for episode_key, rating in user_season.get("episodes", {}).items():
+            episode = season.setdefault(int(episode_key), {
+                "episode_number": int(episode_key), "rating": None, "average": None, "count": 0
+            })
+            episode["rating"] = rating
+
+    return [
+        {
+            "season_number": season_number,
+            "episodes": [episodes[number] for number in sorted(episodes)]
+        }
+        for season_number, episodes in sorted(seasons.items())
+    ]
+
+def rebuild_episode_rating_stats(show_id):
+    """Recompute a show's season aggregates and user season docs from its episode ratings"""
+    season_stats = {}
+    user_seasons = {}
+    for rating in db.collection("episode_ratings").where("show_id", "==", show_id).stream():
+        rating_data = rating.to_dict()
+        value = rating_data.get("rating")
+        if value is None:
+            continue
+        season_number = rating_data["season_number"]
+        episode_key = str(rating_data["episode_number"])
+
+        stats = season_stats.setdefault(season_number, {
+            "show_id": show_id, "season_number": season_number, "episodes": {}
+        })
+        episode = stats["episodes"].setdefault(episode_key, {"count": 0, "sum": 0})
+        episode["count"] += 1
+        episode["sum"] += value
+
+        user_season = user_seasons.setdefault((rating_data["user_id"], season_number), {
+            "user_id": rating_data["user_id"], "show_id": show_id,
+            "season_number": season_number, "episodes": {}
+        })
+        user_season["episodes"][episode_key] = value
+
+    batch = db.batch()
+    pending = 0
+    writes = [(episode_rating_stats_ref(show_id, season_number), stats)
+              for season_number, stats in season_stats.items()]
+    writes += [(user_season_ratings_ref(user_id, show_id, season_number), user_season)
+               for (user_id, season_number), user_season in user_seasons.items()]
+    for ref, data in writes:
+        batch.set(ref, data)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    return len(season_stats)
@@ -10,18 +10,37 @@ from datetime import datetime, timezone
 import requests
 import logging
 from tmdb_routes import tmdb
-from teli_routes import teli
+from teli_routes import teli, flush_pending_episode_activity, refresh_popular_snapshots, \
+    POPULAR_SNAPSHOT_INTERVAL_SECONDS, EPISODE_FLUSH_DELAY_SECONDS
+from feed_jobs import resume_feed_cleanups, compact_oversized_feeds, expire_old_feed_items, \
+    COMPACTION_SWEEP_INTERVAL_SECONDS, FEED_RETENTION_SWEEP_INTERVAL_SECONDS
+from scheduler import scheduler
+from leaderboard import leaderboard
+from follow_graph import follow_graph
+from aggregates import seal_popular_buckets, POPULAR_SEAL_INTERVAL_SECONDS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def create_app():
     app = Flask(__name__)
-    CORS(app)
+    # Expose the pagination cursor header to browser clients
+    CORS(app, expose_headers=["X-Next-Cursor"])
     app.register_blueprint(tmdb)
     app.register_blueprint(teli)
     return app
 
 if __name__ == "__main__":
     app = create_app()
+    resume_feed_cleanups()
+    flush_pending_episode_activity()
+    leaderboard.start()
+    follow_graph.start()
+    # Periodic jobs; disable with TELI_SCHEDULER_ENABLED=0
+    scheduler.every(POPULAR_SEAL_INTERVAL_SECONDS, seal_popular_buckets)
+    scheduler.every(POPULAR_SNAPSHOT_INTERVAL_SECONDS, refresh_popular_snapshots, app)
+    scheduler.every(COMPACTION_SWEEP_INTERVAL_SECONDS, compact_oversized_feeds, run_immediately=False)
+    scheduler.every(FEED_RETENTION_SWEEP_INTERVAL_SECONDS, expire_old_feed_items, run_immediately=False)
+    scheduler.every(EPISODE_FLUSH_DELAY_SECONDS, flush_pending_episode_activity, run_immediately=False)
+    scheduler.start()
     app.run(port=5001, debug=True)
@@ -0,0 +1,113 @@
+"""Measure how sharding a hot counter changes its write throughput.
+
+Concurrent writers increment one counter split over 1 to N shards. By default
+each shard is a simulated document that applies one write at a time, taking
+--write-ms per write, which models Firestore serializing the writes to a
+document. With --firestore the writers commit real increments through
+ShardedCounter instead (point FIRESTORE_EMULATOR_HOST at an emulator or use
+real credentials). Reports throughput, write latency and the documents a read
+of the total costs.
+
+    python benchmarks/counter_contention.py --writers 64 --writes 4000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class SimulatedShard:
+    """A document that applies one write at a time"""
+
+    def __init__(self, write_seconds):
+        self._write_seconds = write_seconds
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def increment(self, amount):
+        with self._lock:
+            time.sleep(self._write_seconds)
+            self.value += amount
+
+def simulated_writer(num_shards, write_seconds):
+    shards = [SimulatedShard(write_seconds) for _ in range(num_shards)]
+
+    def write():
+        random.choice(shards).increment(1)
+
+    def total():
+        return sum(shard.value for shard in shards)
+    return write, total
+
+def firestore_writer(num_shards, run_id):
+    from firebase_admin import firestore
+    from firebase_db import db
+    from sharded_counter import ShardedCounter
+    counter = ShardedCounter("benchmark_counters", num_shards=num_shards, cache_ttl=0)
+    counter_id = f"contention_{run_id}_{num_shards}"
+
+    def write():
+        batch = db.batch()
+        counter.increment(batch, counter_id, {"count": firestore.Increment(1)})
+        batch.commit()
+
+    def total():
+        return (counter.get(counter_id, cached=False) or {}).get("count", 0)
+    return write, total
+
+def run(write, writers, writes):
+    """Run writes across writer threads; returns (seconds, latencies, errors)"""
+    latencies = []
+    errors = []
+
+    def timed_write(_):
+        started = time.perf_counter()
+        try:
+            write()
+        except Exception as e:
+            errors.append(e)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        list(executor.map(timed_write, range(writes)))
+    return time.perf_counter() - started, sorted(latencies), errors
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--writes", type=int, default=4000)
+    parser.add_argument("--write-ms", type=float, default=5.0)
+    parser.add_argument("--firestore", action="store_true")
+    args = parser.parse_args()
+
+    run_id = int(time.time())
+    print(f"{args.writes:,} increments from {args.writers} writers "
+          f"({'Firestore' if args.firestore else f'simulated, {args.write_ms}ms per document write'})")
+    print()
+    print(f"{'shards':>6} {'writes/s':>9} {'speedup':>8} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'errors':>7} {'total':>7} {'read docs':>10}")
+
+    baseline = None
+    for num_shards in args.shards:
+        if args.firestore:
+            write, total = firestore_writer(num_shards, run_id)
+        else:
+            write, total = simulated_writer(num_shards, args.write_ms / 1000)
+        seconds, latencies, errors = run(write, args.writers, args.writes)
+        throughput = args.writes / seconds
+        baseline = baseline or throughput
+        print(f"{num_shards:>6} {throughput:>9,.0f} {throughput / baseline:>7.1f}x "
+              f"{percentile(latencies, 0.5) * 1000:>7.1f} {percentile(latencies, 0.99) * 1000:>7.1f} "
+              f"{len(errors):>7} {total():>7,} {num_shards:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Measure popular-show reads and sealing as the server runs them.
+
+Generates a synthetic stream of ratings spread over hourly buckets and loads
+each hour and day bucket's counts onto its shards, as the rating writes leave
+them. Then answers top-k over several windows with top_recent_shows before and
+after seal_popular_buckets has sealed every settled bucket, and compares each
+answer with the exact counts. Reports documents read, latency, top-k recall
+and count error, and the time sealing takes per bucket.
+
+This writes to the popular bucket collections, so point FIRESTORE_EMULATOR_HOST
+at an emulator. Buckets are dated in 2001 to stay clear of real ones.
+
+    python benchmarks/popular_sketch.py --ratings 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aggregates
+import sharded_counter
+from aggregates import popular_bucket_counter, popular_bucket_ids, seal_popular_buckets, top_recent_shows, \
+    POPULAR_BUCKET_SETTLE_SECONDS, POPULAR_BUCKETS_COLLECTION
+from firebase_db import db
+
+# The last bucket loaded; its day is still open when the windows are read
+BENCHMARK_END = datetime(2001, 1, 31, 12, tzinfo=timezone.utc)
+
+class CountingClient:
+    """Passes through to the Firestore client, counting documents read with get_all"""
+
+    def __init__(self, client):
+        self._client = client
+        self.reads = 0
+
+    def get_all(self, refs, *args, **kwargs):
+        refs = list(refs)
+        self.reads += len(refs)
+        return self._client.get_all(refs, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def zipf_cum_weights(num_shows, exponent):
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, num_shows + 1)))
+
+def generate_hours(num_ratings, num_shows, hours, exponent, trending, seed):
+    """Per-hour Counters of ratings per show, oldest hour first.
+
+    A few shows ramp up over the last days so that windows rank differently.
+    """
+    rng = random.Random(seed)
+    shows = [f"show_{rank}" for rank in range(num_shows)]
+    cum_weights = zipf_cum_weights(num_shows, exponent)
+    per_hour = num_ratings // hours
+    trending_shows = rng.sample(shows[num_shows // 10:], trending)
+    buckets = []
+    for hour in range(hours):
+        counts = Counter(rng.choices(shows, cum_weights=cum_weights, k=per_hour))
+        ramp = max(0, hour - (hours - 72)) / 72
+        for show in trending_shows:
+            counts[show] += int(ramp * per_hour * 0.02)
+        buckets.append(counts)
+    return buckets
+
+def load_buckets(bucket_counts, seed):
+    """Write each bucket's counts onto its shards, every show's ratings spread
+    over the shards at random as concurrent rating writes would leave them"""
+    rng = random.Random(seed)
+    batch = db.batch()
+    pending = 0
+    for bucket_id, counts in bucket_counts.items():
+        batch.delete(db.collection(POPULAR_BUCKETS_COLLECTION).document(bucket_id))
+        shards = [{} for _ in range(popular_bucket_counter.num_shards)]
+        for show_id, count in counts.items():
+            for _ in range(count):
+                shard = shards[rng.randrange(len(shards))]
+                shard[show_id] = shard.get(show_id, 0) + 1
+        for shard, shard_counts in enumerate(shards):
+            batch.set(popular_bucket_counter.shard_ref(bucket_id, shard),
+                      {"counter_id": bucket_id, "counts": shard_counts})
+        pending += len(shards) + 1
+        if pending + len(shards) + 1 > 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+def read_window(counting, days):
+    """Answer one window cold; returns (summary, documents read, ms)"""
+    start = BENCHMARK_END - timedelta(days=days)
+    for bucket_id in popular_bucket_ids(start, BENCHMARK_END):
+        popular_bucket_counter.invalidate(bucket_id)
+    counting.reads = 0
+    started = time.perf_counter()
+    summary = top_recent_shows(start, BENCHMARK_END)
+    return summary, counting.reads, (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ratings", type=int, default=1_000_000)
+    parser.add_argument("--shows", type=int, default=50_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--exponent", type=float, default=1.05)
+    parser.add_argument("--trending", type=int, default=20)
+    parser.add_argument("--top", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    first_hour = BENCHMARK_END - timedelta(days=args.days - 1, hours=BENCHMARK_END.hour)
+    num_hours = int((BENCHMARK_END - first_hour).total_seconds() // 3600) + 1
+    started = time.perf_counter()
+    hour_counts = generate_hours(args.ratings, args.shows, num_hours, args.exponent, args.trending, args.seed)
+    hour_starts = [first_hour + timedelta(hours=hour) for hour in range(num_hours)]
+    print(f"generated {sum(sum(c.values()) for c in hour_counts):,} ratings over "
+          f"{num_hours} hours in {time.perf_counter() - started:.1f}s")
+
+    # Hour and day buckets of exact counts, as the rating writes maintain them
+    buckets = {}
+    for hour_start, counts in zip(hour_starts, hour_counts):
+        buckets[f"hour_{hour_start:%Y%m%d%H}"] = counts
+        buckets.setdefault(f"day_{hour_start:%Y%m%d}", Counter()).update(counts)
+    started = time.perf_counter()
+    load_buckets(buckets, args.seed)
+    print(f"loaded {len(buckets)} buckets in {time.perf_counter() - started:.1f}s")
+
+    counting = CountingClient(db)
+    aggregates.db = counting
+    sharded_counter.db = counting
+
+    windows = [days for days in (1, 7, 30) if days <= args.days]
+    unsealed = {days: read_window(counting, days) for days in windows}
+
+    # Seal as the scheduler would have, a pass just after each day settled
+    settle = timedelta(seconds=POPULAR_BUCKET_SETTLE_SECONDS + 60)
+    started = time.perf_counter()
+    sealed_count = 0
+    for day in range(args.days - 1):
+        sealed_count += seal_popular_buckets(first_hour + timedelta(days=day + 1) + settle)
+    sealed_count += seal_popular_buckets(BENCHMARK_END + settle)
+    seal_seconds = time.perf_counter() - started
+    print(f"sealed {sealed_count} buckets in {seal_seconds:.1f}s "
+          f"({seal_seconds / max(sealed_count, 1) * 1000:.1f}ms per bucket)")
+    print()
+    print(f"{'window':>7} {'unsealed docs':>14} {'unsealed ms':>12} {'sealed docs':>12} {'sealed ms':>10} "
+          f"{'recall':>7} {'max err':>8} {'err bound':>10}")
+
+    for days in windows:
+        start = BENCHMARK_END - timedelta(days=days)
+        start_hour = start.replace(minute=0, second=0, microsecond=0)
+        exact = Counter()
+        for hour_start, counts in zip(hour_starts, hour_counts):
+            if hour_start >= start_hour:
+                exact.update(counts)
+        exact_top = [show for show, _ in exact.most_common(args.top)]
+
+        _, unsealed_reads, unsealed_ms = unsealed[days]
+        summary, sealed_reads, sealed_ms = read_window(counting, days)
+        sketch_top = summary.top(args.top)
+        recall = len(set(exact_top) & {show for show, _ in sketch_top}) / len(exact_top)
+        max_error = max(count - exact[show] for show, count in sketch_top)
+        # Space-Saving never overestimates by more than N / capacity
+        bound = sum(exact.values()) / summary.capacity
+        print(f"{days:>6}d {unsealed_reads:>14,} {unsealed_ms:>12.1f} {sealed_reads:>12,} {sealed_ms:>10.1f} "
+              f"{recall:>7.3f} {max_error:>8,} {bound:>10,.0f}")
+
+if __name__ == "__main__":
+    main()
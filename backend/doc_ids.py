@@ -0,0 +1,76 @@
+"""Deterministic document IDs for documents that are unique per user and show
+(or, for follows, per pair of users).
+
+Writing to a known ID turns "find the existing doc, then update or add" into a
+single write, and concurrent requests for the same key can no longer create
+duplicates. User IDs are Firestore auto IDs and never contain an underscore,
+so the IDs can't collide even when show IDs do.
+
+Documents written before this have auto IDs until the rekey migrations move
+them. Until a collection's migration has finished, writers look the key up
+with keyed_doc_ref and keep using the old document if there is one, so they
+don't leave a second copy next to it.
+"""
+import threading
+import time
+from firebase_db import db
+from jobs import load_checkpoint
+
+# Seconds a worker trusts that a collection still needs rekeying before it
+# checks the migration's checkpoint again
+REKEY_STATUS_TTL_SECONDS = 60
+
+_rekeyed = set()
+_rekey_checked_at = {}
+_rekey_lock = threading.Lock()
+
+def rating_doc_id(user_id, show_id):
+    return f"{user_id}_{show_id}"
+
+def episode_rating_doc_id(user_id, show_id, season_number, episode_number):
+    return f"{user_id}_{show_id}_{season_number}_{episode_number}"
+
+def watch_status_doc_id(user_id, show_id):
+    return f"{user_id}_{show_id}"
+
+def follow_doc_id(follower_id, followee_id):
+    return f"{follower_id}_{followee_id}"
+
+def rekey_job_id(collection_name):
+    """Checkpoint ID of the migration moving a collection to deterministic IDs"""
+    return f"rekey_{collection_name}"
+
+def _is_rekeyed(collection_name):
+    with _rekey_lock:
+        if collection_name in _rekeyed:
+            return True
+        now = time.monotonic()
+        checked_at = _rekey_checked_at.get(collection_name)
+        if checked_at is not None and now - checked_at < REKEY_STATUS_TTL_SECONDS:
+            return False
+        _rekey_checked_at[collection_name] = now
+    checkpoint = load_checkpoint(rekey_job_id(collection_name)) or {}
+    if checkpoint.get("status") != "done":
+        return False
+    with _rekey_lock:
+        _rekeyed.add(collection_name)
+    return True
+
+def keyed_doc_ref(collection_name, doc_id, key, transaction=None):
+    """The document holding a key, given its deterministic ID and key fields.
+
+    Before the collection is rekeyed this is the legacy auto-ID document for
+    the key if one exists. Pass the transaction when called in one, so a
+    migration moving the document makes the transaction retry.
+    """
+    collection = db.collection(collection_name)
+    doc_ref = collection.document(doc_id)
+    if _is_rekeyed(collection_name):
+        return doc_ref
+    query = collection
+    for field, value in key.items():
+        query = query.where(field, "==", value)
+    docs = list(transaction.get(query) if transaction is not None else query.stream())
+    if not docs or any(doc.id == doc_id for doc in docs):
+        return doc_ref
+    return docs[0].reference
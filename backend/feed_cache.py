@@ -0,0 +1,198 @@
+from cachetools import TTLCache
+import json
+import threading
+from firebase_db import db
+from feed_stream import feed_bus, FEED_ITEM, FEED_RESET, RATINGS_CHANGED
+
+# Items on the first feed page, which is the only page we cache
+FEED_PAGE_SIZE = 50
+# Memory budget for cached pages, measured as the size of their JSON
+FEED_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Upper bound on staleness if an invalidation is ever missed
+FEED_CACHE_TTL_SECONDS = 300
+# Users whose latest feed change is remembered, so a page read from Firestore
+# isn't cached if the feed changed while it was being read
+FEED_GENERATION_MAX_USERS = 100000
+# Rating bodies kept for hydrating compact feed items
+RATING_CACHE_MAX_ITEMS = 50000
+RATING_CACHE_TTL_SECONDS = 600
+# Users whose "popular among people you follow" results are cached
+FOLLOWEE_POPULAR_CACHE_MAX_USERS = 10000
+
+# Fields a compact feed item stores; everything else is hydrated from the rating
+COMPACT_FEED_FIELDS = ("rating_id", "user_id", "show_id", "timestamp")
+# Fields kept on feed items and ratings for the server's own use, left out of
+# responses; a rating item's id is already its rating ID
+INTERNAL_FEED_FIELDS = ("rating_id", "counted_at", "has_comment", "facets")
+
+def compact_feed_item(rating_id, rating_data):
+    """Build the reference-only feed item written to followers' feeds"""
+    item = {field: rating_data.get(field) for field in COMPACT_FEED_FIELDS}
+    item["rating_id"] = rating_id
+    return item
+
+def feed_response_item(item):
+    """A feed item as clients see it, without internal fields"""
+    return {field: value for field, value in item.items() if field not in INTERNAL_FEED_FIELDS}
+
+def _page_size_bytes(page):
+    return len(json.dumps(page, default=str))
+
+class FeedPageCache:
+    """Per-user cache of the hydrated first feed page, bounded by memory.
+
+    Fan-out patches cached pages with the new item, so repeat reads don't
+    have to go back to Firestore just because something new arrived.
+
+    Every patch or invalidation moves the user's generation on. A reader
+    takes the generation before querying and passes it to put, which skips
+    the page if the feed changed in between.
+    """
+
+    def __init__(self, max_bytes=FEED_CACHE_MAX_BYTES, ttl=FEED_CACHE_TTL_SECONDS,
+                 max_users=FEED_GENERATION_MAX_USERS):
+        self._pages = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=_page_size_bytes)
+        # Generations come from one counter, so a user whose entry was evicted
+        # never gets back a value a reader may have taken before
+        self._generations = TTLCache(maxsize=max_users, ttl=ttl)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            page = self._pages.get(user_id)
+            return list(page) if page is not None else None
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def _bump(self, user_id):
+        self._counter += 1
+        self._generations[user_id] = self._counter
+
+    def put(self, user_id, page, generation):
+        """Cache a page read at the given generation, unless the feed changed since"""
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            try:
+                self._pages[user_id] = list(page)
+            except ValueError:
+                # A single page bigger than the whole budget just isn't cached
+                pass
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._bump(user_id)
+            self._pages.pop(user_id, None)
+
+    def patch(self, user_id, item):
+        """Insert or replace an item in a cached page, keeping it newest first"""
+        with self._lock:
+            self._bump(user_id)
+            page = self._pages.get(user_id)
+            if page is None:
+                return
+            page = [existing for existing in page if existing.get("id") != item.get("id")]
+            page.append(item)
+            page.sort(key=lambda entry: entry.get("timestamp", ""), reverse=True)
+            # Re-insert so the memory accounting sees the new size
+            try:
+                self._pages[user_id] = page[:FEED_PAGE_SIZE]
+            except ValueError:
+                self._pages.pop(user_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pages)
+
+class RatingCache:
+    """Shared LRU of rating bodies used to hydrate compact feed items.
+
+    Misses are fetched together with a single get_all, so hydrating a feed
+    page costs at most one round trip however many ratings it shows.
+    """
+
+    def __init__(self, max_items=RATING_CACHE_MAX_ITEMS, ttl=RATING_CACHE_TTL_SECONDS):
+        self._ratings = TTLCache(maxsize=max_items, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def put(self, rating_id, rating_data):
+        with self._lock:
+            self._ratings[rating_id] = dict(rating_data)
+
+    def invalidate(self, rating_id):
+        with self._lock:
+            self._ratings.pop(rating_id, None)
+
+    def get_many(self, rating_ids):
+        """Return {rating_id: rating data} for the ratings that exist"""
+        found = {}
+        missing = []
+        with self._lock:
+            for rating_id in set(rating_ids):
+                rating_data = self._ratings.get(rating_id)
+                if rating_data is not None:
+                    found[rating_id] = dict(rating_data)
+                else:
+                    missing.append(rating_id)
+
+        if missing:
+            rating_refs = [db.collection("ratings").document(rating_id) for rating_id in missing]
+            for rating_doc in db.get_all(rating_refs):
+                if rating_doc.exists:
+                    rating_data = rating_doc.to_dict()
+                    self.put(rating_doc.id, rating_data)
+                    found[rating_doc.id] = rating_data
+        return found
+
+class FolloweePopularCache:
+    """Per-user results of "popular among people you follow", keyed by query.
+
+    Any new item or reset in a user's feed drops all of their results, since
+    the ranking is computed from the feed.
+    """
+
+    def __init__(self, max_users=FOLLOWEE_POPULAR_CACHE_MAX_USERS, ttl=FEED_CACHE_TTL_SECONDS):
+        self._results = TTLCache(maxsize=max_users, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, user_id, key):
+        with self._lock:
+            return self._results.get(user_id, {}).get(key)
+
+    def put(self, user_id, key, result):
+        with self._lock:
+            results = self._results.get(user_id, {})
+            results[key] = result
+            self._results[user_id] = results
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._results.pop(user_id, None)
+
+feed_page_cache = FeedPageCache()
+rating_cache = RatingCache()
+followee_popular_cache = FolloweePopularCache()
+
+def _on_feed_event(user_ids, kind, event):
+    # Feed events reach every worker through the bus, so each worker keeps
+    # its own caches in step
+    if kind == RATINGS_CHANGED:
+        for rating_id in event.get("rating_ids", ()):
+            rating_cache.invalidate(rating_id)
+        return
+    if kind == FEED_ITEM and event.get("rating_id") and "rating" in event:
+        rating_cache.put(event["rating_id"], {
+            field: value for field, value in event.items()
+            if field not in ("id", "rating_id", "user_name", "user_username")
+        })
+    for user_id in user_ids:
+        if kind == FEED_ITEM:
+            feed_page_cache.patch(user_id, feed_response_item(event))
+        elif kind == FEED_RESET:
+            feed_page_cache.invalidate(user_id)
+        followee_popular_cache.invalidate(user_id)
+
+feed_bus.add_listener(_on_feed_event)
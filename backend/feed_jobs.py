@@ -0,0 +1,248 @@
+from datetime import datetime, timezone, timedelta
+from firebase_admin import firestore
+import logging
+import threading
+import time
+from firebase_db import db
+from doc_ids import follow_doc_id, keyed_doc_ref
+from jobs import run_in_background, load_checkpoint, save_checkpoint, find_jobs
+from feed_stream import publish_feed_event, FEED_RESET
+
+logger = logging.getLogger(__name__)
+
+# Feed items deleted per batch during unfollow cleanup
+CLEANUP_CHUNK_SIZE = 200
+# Pause between cleanup batches so a large cleanup doesn't starve other writes
+CLEANUP_PAUSE_SECONDS = 0.5
+
+# Feeds are trimmed back to this many items by compaction
+FEED_MAX_ITEMS = 500
+# Items older than this are dropped by the retention sweep, and whenever a
+# feed is compacted
+FEED_RETENTION_DAYS = 90
+# Minimum time between retention sweeps; expired items only need to go
+# eventually, so this runs far less often than compaction
+FEED_RETENTION_SWEEP_INTERVAL_SECONDS = 60 * 60
+# How far over the cap a feed may grow before compaction is due, so we
+# don't compact after every single new item
+FEED_COMPACTION_SLACK = 50
+# Feed items deleted per batch during compaction
+COMPACTION_CHUNK_SIZE = 200
+# Minimum time between compaction sweeps triggered from this process
+COMPACTION_SWEEP_INTERVAL_SECONDS = 60
+
+def feed_meta_ref(user_id):
+    """The feed's parent document, which holds the per-feed item counter"""
+    return db.collection("feeds").document(user_id)
+
+def increment_feed_count(batch, user_id, amount):
+    """Add a feed item counter update to a batch (one extra write op)"""
+    batch.set(feed_meta_ref(user_id), {"item_count": firestore.Increment(amount)}, merge=True)
+
+def _cleanup_job_id(follower_id, followee_id):
+    return f"unfollow_cleanup_{follower_id}_{followee_id}"
+
+@firestore.transactional
+def _delete_cleanup_chunk_txn(transaction, follower_id, followee_id, chunk_size):
+    """Delete one chunk of the followee's items from the follower's feed, unless
+    the follower follows them again. Returns how many were deleted, or None
+    if the follow is back.
+
+    The follow is read in the same transaction as the items, so a follow or
+    backfill committed meanwhile makes the chunk retry and see it.
+    """
+    follow_ref = keyed_doc_ref("follows", follow_doc_id(follower_id, followee_id),
+                               {"follower_id": follower_id, "followee_id": followee_id}, transaction)
+    if follow_ref.get(transaction=transaction).exists:
+        return None
+    items_ref = db.collection("feeds").document(follower_id).collection("items")
+    docs = list(transaction.get(items_ref.where("user_id", "==", followee_id).limit(chunk_size)))
+    for doc in docs:
+        transaction.delete(doc.reference)
+    if docs:
+        increment_feed_count(transaction, follower_id, -len(docs))
+    return len(docs)
+
+def clean_feed_after_unfollow(follower_id, followee_id, chunk_size=CLEANUP_CHUNK_SIZE,
+                              pause_seconds=CLEANUP_PAUSE_SECONDS):
+    """Delete the followee's items from the follower's feed in rate-limited chunks.
+
+    Progress is checkpointed in the jobs collection after every chunk. Deleted
+    items no longer match the query, so resuming simply re-runs the job and it
+    picks up with whatever is left.
+    """
+    job_id = _cleanup_job_id(follower_id, followee_id)
+    checkpoint = load_checkpoint(job_id) or {}
+    deleted = checkpoint.get("deleted", 0) if checkpoint.get("status") == "running" else 0
+
+    save_checkpoint(job_id, type="unfollow_cleanup", status="running",
+                    follower_id=follower_id, followee_id=followee_id, deleted=deleted)
+
+    while True:
+        # Stop if the user followed again while we were cleaning up,
+        # otherwise we'd delete the freshly backfilled items
+        chunk_deleted = _delete_cleanup_chunk_txn(db.transaction(), follower_id, followee_id, chunk_size)
+        if chunk_deleted is None:
+            save_checkpoint(job_id, status="aborted", deleted=deleted)
+            logger.info(f"Feed cleanup {job_id} aborted: follow relationship restored")
+            if deleted > 0:
+                publish_feed_event([follower_id], {}, FEED_RESET)
+            return deleted
+        if not chunk_deleted:
+            break
+
+        deleted += chunk_deleted
+        save_checkpoint(job_id, deleted=deleted)
+
+        if chunk_deleted < chunk_size:
+            break
+        time.sleep(pause_seconds)
+
+    save_checkpoint(job_id, status="done", deleted=deleted,
+                    finished_at=datetime.now(timezone.utc).isoformat())
+    if deleted > 0:
+        # Drop cached pages and tell live clients to reload
+        publish_feed_event([follower_id], {}, FEED_RESET)
+    return deleted
+
+def schedule_feed_cleanup(follower_id, followee_id):
+    """Queue a feed cleanup without blocking the unfollow request"""
+    return run_in_background(clean_feed_after_unfollow, follower_id, followee_id)
+
+def resume_feed_cleanups():
+    """Restart cleanups that were interrupted before they finished"""
+    for job_id, checkpoint in find_jobs("unfollow_cleanup"):
+        logger.info(f"Resuming feed cleanup {job_id}")
+        schedule_feed_cleanup(checkpoint["follower_id"], checkpoint["followee_id"])
+
+def _delete_in_chunks(query, limit=None, chunk_size=COMPACTION_CHUNK_SIZE):
+    """Delete up to limit documents matched by an oldest-first query, a chunk at a time"""
+    deleted = 0
+    while limit is None or deleted < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - deleted)
+        docs = list(query.limit(size).stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        deleted += len(docs)
+
+        if len(docs) < size:
+            break
+    return deleted
+
+def compact_feed(user_id, max_items=FEED_MAX_ITEMS, retention_days=FEED_RETENTION_DAYS):
+    """Trim a feed to its retention window and item cap, oldest items first.
+
+    Returns the number of items deleted. The item counter is reset to the exact
+    remaining count afterwards, which also corrects any drift.
+    """
+    items_ref = db.collection("feeds").document(user_id).collection("items")
+    oldest_first = items_ref.order_by("timestamp")
+
+    # Drop everything outside the retention window
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+    deleted = _delete_in_chunks(oldest_first.where("timestamp", "<", cutoff))
+
+    # Then trim the oldest items beyond the cap
+    remaining = items_ref.count().get()[0][0].value
+    if remaining > max_items:
+        deleted += _delete_in_chunks(oldest_first, limit=remaining - max_items)
+        remaining = items_ref.count().get()[0][0].value
+
+    # A fan-out racing with compaction can make this slightly low, which only
+    # delays the next compaction a little
+    feed_meta_ref(user_id).set({
+        "item_count": remaining,
+        "last_compacted_at": datetime.now(timezone.utc).isoformat()
+    }, merge=True)
+
+    if deleted > 0:
+        publish_feed_event([user_id], {}, FEED_RESET)
+
+    logger.info(f"Compacted feed {user_id}: deleted {deleted}, {remaining} remaining")
+    return deleted
+
+def compact_oversized_feeds(max_items=FEED_MAX_ITEMS, slack=FEED_COMPACTION_SLACK):
+    """Compact every feed whose item counter says it is over the cap.
+
+    Only the counter is queried, so finding the feeds that need work never
+    scans feed items.
+    """
+    oversized = db.collection("feeds") \
+        .where("item_count", ">", max_items + slack) \
+        .stream()
+
+    compacted = 0
+    for feed in oversized:
+        compact_feed(feed.id, max_items=max_items)
+        compacted += 1
+    return compacted
+
+@firestore.transactional
+def _expire_chunk_txn(transaction, item_refs, cutoff):
+    """Delete the items that are still there and still expired, with their feed
+    counter decrements. Returns {user_id: items deleted}.
+
+    A sweep running on another worker at the same time makes this retry and
+    find its items gone, so no feed is decremented twice for one item.
+    """
+    per_feed = {}
+    expired = [doc for doc in db.get_all(item_refs, transaction=transaction)
+               if doc.exists and (doc.to_dict().get("timestamp") or "") < cutoff]
+    for doc in expired:
+        user_id = doc.reference.parent.parent.id
+        per_feed[user_id] = per_feed.get(user_id, 0) + 1
+        transaction.delete(doc.reference)
+    for user_id, count in per_feed.items():
+        increment_feed_count(transaction, user_id, -count)
+    return per_feed
+
+def expire_old_feed_items(retention_days=FEED_RETENTION_DAYS, chunk_size=COMPACTION_CHUNK_SIZE):
+    """Delete items older than the retention window from every feed.
+
+    Compaction only visits feeds over the cap, so this sweep enforces
+    retention on its own. A collection group query over all feeds' items finds
+    the expired ones oldest first, without reading any feed that has none.
+    Each chunk's deletes commit in a transaction together with the feed
+    counter decrements, so concurrent sweeps don't both count a deletion.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+    expired = db.collection_group("items") \
+        .where("timestamp", "<", cutoff) \
+        .order_by("timestamp")
+
+    deleted = 0
+    expired_feeds = set()
+    while True:
+        docs = list(expired.limit(chunk_size).stream())
+        if not docs:
+            break
+
+        per_feed = _expire_chunk_txn(db.transaction(), [doc.reference for doc in docs], cutoff)
+        deleted += sum(per_feed.values())
+        expired_feeds.update(per_feed)
+        if len(docs) < chunk_size:
+            break
+
+    if expired_feeds:
+        publish_feed_event(list(expired_feeds), {}, FEED_RESET)
+    logger.info(f"Expired {deleted} feed items older than {retention_days} days "
+                f"from {len(expired_feeds)} feeds")
+    return deleted
+
+_sweep_lock = threading.Lock()
+_last_sweep = None
+
+def schedule_compaction_sweep():
+    """Queue a compaction sweep, at most once per sweep interval per process"""
+    global _last_sweep
+    with _sweep_lock:
+        now = time.monotonic()
+        if _last_sweep is not None and now - _last_sweep < COMPACTION_SWEEP_INTERVAL_SECONDS:
+            return None
+        _last_sweep = now
+    return run_in_background(compact_oversized_feeds)
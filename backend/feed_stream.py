@@ -0,0 +1,184 @@
+from datetime import datetime, timezone, timedelta
+import logging
+import os
+import queue
+import threading
+import uuid
+from firebase_db import db
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connected client before it counts as a slow consumer
+SUBSCRIBER_BUFFER_SIZE = 100
+# Seconds between heartbeats on an idle stream, so proxies keep it open
+HEARTBEAT_SECONDS = 15
+# Collection used to relay events between workers by the Firestore broker
+FEED_EVENTS_COLLECTION = "feed_events"
+# How long relayed events are kept (enforced by a Firestore TTL policy on expires_at)
+FEED_EVENT_TTL_MINUTES = 10
+
+# Event kinds: a new or updated feed item, or a change that means the
+# client should reload its feed (e.g. items removed after an unfollow)
+FEED_ITEM = "feed_item"
+FEED_RESET = "feed_reset"
+# Ratings were edited or removed; sent to no user, only to every worker's
+# listeners so they stop hydrating feeds from old copies
+RATINGS_CHANGED = "ratings_changed"
+
+class Subscription:
+    """A single client's stream of feed events, with a bounded buffer"""
+
+    def __init__(self, user_id, max_buffer):
+        self.user_id = user_id
+        self.dropped = False
+        self._queue = queue.Queue(maxsize=max_buffer)
+
+    def offer(self, event):
+        """Buffer an event, returning False if the buffer is full"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout):
+        """Wait for the next event, returning None if none arrives in time"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class FeedBus:
+    """In-process publish/subscribe for feed events, keyed by the receiving user.
+
+    Slow consumers are dropped rather than allowed to grow their buffer: a
+    subscriber whose buffer fills up is marked dropped and removed, and its
+    stream tells the client to reconnect and catch up from /feed.
+    """
+
+    def __init__(self, max_buffer=SUBSCRIBER_BUFFER_SIZE):
+        self._max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(user_ids, kind, event) for every event this process receives"""
+        self._listeners.append(listener)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self._max_buffer)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def deliver(self, user_ids, event, kind=FEED_ITEM):
+        """Hand an event to every listener and local subscriber of the given users"""
+        for listener in self._listeners:
+            try:
+                listener(user_ids, kind, event)
+            except Exception as e:
+                logger.error(f"Feed bus listener failed: {e}")
+
+        with self._lock:
+            targets = [sub for user_id in user_ids for sub in self._subscribers.get(user_id, ())]
+
+        for subscription in targets:
+            if not subscription.offer((kind, event)):
+                logger.info(f"Dropping slow feed stream subscriber for {subscription.user_id}")
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscribers.values())
+
+class InProcessBroker:
+    """Delivers events straight to this process's bus; enough for a single worker"""
+
+    def __init__(self, bus):
+        self._bus = bus
+
+    def start(self):
+        pass
+
+    def publish(self, user_ids, event, kind=FEED_ITEM):
+        self._bus.deliver(user_ids, event, kind)
+
+class FirestoreBroker:
+    """Relays events through a Firestore collection so every worker's bus sees them.
+
+    This is a stand-in for a real message broker when running several workers:
+    each worker listens to new documents in the events collection and delivers
+    them to its own local subscribers.
+    """
+
+    def __init__(self, bus):
+        self._bus = bus
+        self._watch = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Begin relaying events to the local bus; safe to call repeatedly"""
+        with self._lock:
+            if self._watch is not None:
+                return
+            started_at = datetime.now(timezone.utc).isoformat()
+            query = db.collection(FEED_EVENTS_COLLECTION).where("created_at", ">=", started_at)
+            self._watch = query.on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for change in changes:
+            if change.type.name != "ADDED":
+                continue
+            data = change.document.to_dict()
+            self._bus.deliver(data.get("user_ids", []), data.get("event", {}),
+                              data.get("kind", FEED_ITEM))
+
+    def publish(self, user_ids, event, kind=FEED_ITEM):
+        self.start()
+        now = datetime.now(timezone.utc)
+        db.collection(FEED_EVENTS_COLLECTION).document(uuid.uuid4().hex).set({
+            "user_ids": list(user_ids),
+            "kind": kind,
+            "event": event,
+            "created_at": now.isoformat(),
+            "expires_at": now + timedelta(minutes=FEED_EVENT_TTL_MINUTES)
+        })
+
+feed_bus = FeedBus()
+
+def _create_broker():
+    # Set TELI_FEED_BROKER=firestore when running more than one worker
+    if os.environ.get("TELI_FEED_BROKER", "local") == "firestore":
+        return FirestoreBroker(feed_bus)
+    return InProcessBroker(feed_bus)
+
+broker = _create_broker()
+
+def publish_feed_event(user_ids, event, kind=FEED_ITEM):
+    """Publish a feed event to the live streams of the given users"""
+    if not user_ids:
+        return
+    try:
+        broker.publish(user_ids, event, kind)
+    except Exception as e:
+        # Live streams are best effort; clients still see the item on /feed
+        logger.error(f"Error publishing feed event: {e}")
+
+def publish_ratings_changed(rating_ids):
+    """Tell every worker that these ratings were edited or removed"""
+    if not rating_ids:
+        return
+    try:
+        broker.publish([], {"rating_ids": list(rating_ids)}, RATINGS_CHANGED)
+    except Exception as e:
+        logger.error(f"Error publishing rating changes: {e}")
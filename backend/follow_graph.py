@@ -0,0 +1,156 @@
+from array import array
+import logging
+import sys
+import threading
+from firebase_db import db
+
+logger = logging.getLogger(__name__)
+
+# Array typecode for interned user IDs: 4 bytes each, enough for 4 billion users
+FOLLOW_GRAPH_ID_TYPECODE = "I"
+
+class FollowGraph:
+    """Who follows whom, held in memory as arrays of interned user IDs.
+
+    Each user ID is interned to a small int the first time it's seen, and each
+    user's followers and followees are kept as compact int arrays rather than
+    lists of strings, so a follow costs 8 bytes whichever way it's read. The
+    graph follows the follows collection through a snapshot listener. Follows
+    made or removed through this process are also applied straight away, so a
+    user sees their own change before the listener catches up. Interned IDs
+    are never freed, which only matters for users who stop following anyone.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> int, and int -> user_id
+        self._ids = {}
+        self._user_ids = []
+        # int -> array of follower ints, and int -> array of followee ints
+        self._followers = []
+        self._following = []
+        self._follows = 0
+        # Bytes of the interned ID strings and adjacency arrays, kept up to
+        # date as follows change so reporting usage doesn't walk the graph
+        self._bytes = 0
+        self._watch = None
+        self._start_lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def _intern(self, user_id):
+        index = self._ids.get(user_id)
+        if index is None:
+            index = len(self._user_ids)
+            self._ids[user_id] = index
+            self._user_ids.append(user_id)
+            self._followers.append(array(FOLLOW_GRAPH_ID_TYPECODE))
+            self._following.append(array(FOLLOW_GRAPH_ID_TYPECODE))
+            self._bytes += sys.getsizeof(user_id) + sys.getsizeof(self._followers[index]) + \
+                sys.getsizeof(self._following[index])
+        return index
+
+    def _resize(self, follower, followee, change):
+        """Apply change() to the two arrays an edge lives in, tracking how their size moves"""
+        arrays = (self._following[follower], self._followers[followee])
+        before = sum(sys.getsizeof(ids) for ids in arrays)
+        change()
+        self._bytes += sum(sys.getsizeof(ids) for ids in arrays) - before
+
+    def _add(self, follower_id, followee_id):
+        follower, followee = self._intern(follower_id), self._intern(followee_id)
+        # A user follows far fewer people than a popular user has followers,
+        # so the duplicate check scans the shorter side
+        if followee in self._following[follower]:
+            return
+
+        def append():
+            self._following[follower].append(followee)
+            self._followers[followee].append(follower)
+        self._resize(follower, followee, append)
+        self._follows += 1
+
+    def _remove(self, follower_id, followee_id):
+        follower, followee = self._ids.get(follower_id), self._ids.get(followee_id)
+        if follower is None or followee is None or followee not in self._following[follower]:
+            return
+
+        def remove():
+            self._following[follower].remove(followee)
+            self._followers[followee].remove(follower)
+        self._resize(follower, followee, remove)
+        self._follows -= 1
+
+    def add(self, follower_id, followee_id):
+        """Record a follow; adding one that's already known does nothing"""
+        with self._lock:
+            self._add(follower_id, followee_id)
+
+    def remove(self, follower_id, followee_id):
+        with self._lock:
+            self._remove(follower_id, followee_id)
+
+    def load(self, follows):
+        """Replace the graph with (follower_id, followee_id) pairs"""
+        with self._lock:
+            self._ids = {}
+            self._user_ids = []
+            self._followers = []
+            self._following = []
+            self._follows = 0
+            self._bytes = 0
+            for follower_id, followee_id in follows:
+                self._add(follower_id, followee_id)
+        self._loaded.set()
+        usage = self.memory_usage()
+        logger.info(f"Loaded follow graph: {usage['users']} users, {usage['follows']} follows, "
+                    f"{usage['bytes'] / 1e6:.1f} MB")
+
+    def _user_list(self, adjacency, user_id):
+        with self._lock:
+            index = self._ids.get(user_id)
+            if index is None:
+                return []
+            return [self._user_ids[other] for other in adjacency[index]]
+
+    def followers(self, user_id):
+        """IDs of the users following user_id"""
+        return self._user_list(self._followers, user_id)
+
+    def following(self, user_id):
+        """IDs of the users user_id follows"""
+        return self._user_list(self._following, user_id)
+
+    def memory_usage(self):
+        """Users, follows and the approximate bytes the graph holds, including
+        the interned ID strings"""
+        with self._lock:
+            size = sys.getsizeof(self._ids) + sys.getsizeof(self._user_ids) + \
+                sys.getsizeof(self._followers) + sys.getsizeof(self._following)
+            return {"users": len(self._user_ids), "follows": self._follows, "bytes": size + self._bytes}
+
+    def is_loaded(self):
+        return self._loaded.is_set()
+
+    def start(self):
+        """Begin following the follows collection; safe to call repeatedly"""
+        with self._start_lock:
+            if self._watch is not None:
+                return
+            self._watch = db.collection("follows").on_snapshot(self._on_snapshot)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            if not self._loaded.is_set():
+                # The first snapshot holds every follow
+                self.load((doc.get("follower_id"), doc.get("followee_id")) for doc in docs)
+                return
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self.remove(doc.get("follower_id"), doc.get("followee_id"))
+                else:
+                    self.add(doc.get("follower_id"), doc.get("followee_id"))
+        except Exception as e:
+            logger.error(f"Error updating follow graph: {e}")
+
+follow_graph = FollowGraph()
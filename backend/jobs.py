@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import logging
+from firebase_db import db
+
+logger = logging.getLogger(__name__)
+
+# Checkpoints for background jobs live here so a job can be resumed
+# after a restart instead of starting over
+JOBS_COLLECTION = "jobs"
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="teli-job")
+
+def _run_logged(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        logger.error(f"Background job {fn.__name__} failed: {e}", exc_info=True)
+
+def run_in_background(fn, *args, **kwargs):
+    """Run fn on the shared worker pool without blocking the caller"""
+    return _executor.submit(_run_logged, fn, *args, **kwargs)
+
+def load_checkpoint(job_id):
+    """Return the saved checkpoint for a job, or None if it never ran"""
+    doc = db.collection(JOBS_COLLECTION).document(job_id).get()
+    return doc.to_dict() if doc.exists else None
+
+def save_checkpoint(job_id, **fields):
+    """Merge progress fields into the job's checkpoint document"""
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    db.collection(JOBS_COLLECTION).document(job_id).set(fields, merge=True)
+
+def find_jobs(job_type, status="running"):
+    """Return (job_id, checkpoint) pairs for jobs of a type left in a given status"""
+    docs = db.collection(JOBS_COLLECTION) \
+        .where("type", "==", job_type) \
+        .where("status", "==", status) \
+        .stream()
+    return [(doc.id, doc.to_dict()) for doc in docs]
@@ -0,0 +1,240 @@
+from bisect import bisect_left, insort
+import logging
+import os
+import threading
+from firebase_db import db
+from aggregates import show_rating_counter, decayed_trending_score, combine_trending, trending_rank
+
+logger = logging.getLogger(__name__)
+
+# Bayesian prior: every show is ranked as if it also had this many votes at
+# the prior mean, so a couple of 10s can't beat hundreds of 9s
+LEADERBOARD_PRIOR_VOTES = float(os.environ.get("TELI_LEADERBOARD_PRIOR_VOTES", "10"))
+# Prior mean rating; when unset, the mean of all ratings is used
+LEADERBOARD_PRIOR_MEAN = os.environ.get("TELI_LEADERBOARD_PRIOR_MEAN")
+# How far the mean of all ratings may drift from the prior mean the ranking
+# was built with before every show is re-ranked
+LEADERBOARD_PRIOR_RERANK_DELTA = 0.01
+# How long a request waits for the initial load before giving up
+LEADERBOARD_LOAD_TIMEOUT_SECONDS = 10
+
+class Leaderboard:
+    """Shows ranked by Bayesian average, kept sorted in memory.
+
+    The ranking follows the shards of the show rating aggregates through a
+    snapshot listener, so each aggregate change moves one show in the sorted
+    list instead of re-ranking everything. When the prior mean comes from the
+    data, running totals of all votes follow every update, and the whole
+    ranking is rebuilt with the new mean once it drifts far enough to matter.
+    """
+
+    def __init__(self, prior_votes=LEADERBOARD_PRIOR_VOTES, prior_mean=LEADERBOARD_PRIOR_MEAN):
+        self._prior_votes = prior_votes
+        self._configured_mean = float(prior_mean) if prior_mean is not None else None
+        self._prior_mean = self._configured_mean or 0.0
+        # Running totals of every show's votes, for a data-derived prior mean
+        self._votes = 0
+        self._total = 0
+        self._lock = threading.Lock()
+        # show_id -> (count, ...) values and show_id -> its key in the ranked list
+        self._stats = {}
+        self._keys = {}
+        # Sorted (-score, -count, show_id) tuples, best first
+        self._ranked = []
+        # show_id -> {shard document ID: values}, summed into _stats
+        self._shards = {}
+        self._watch = None
+        # Boards fed from this board's listener rather than their own
+        self._linked = []
+        self._start_lock = threading.Lock()
+        self._loaded = threading.Event()
+
+    def _score(self, count, total):
+        return (self._prior_mean * self._prior_votes + total) / (self._prior_votes + count)
+
+    def _key(self, show_id, count, total):
+        return (-self._score(count, total), -count, show_id)
+
+    def _entry(self, show_id, count, total):
+        return {
+            "show_id": show_id,
+            "score": round(self._score(count, total), 3),
+            "average": round(total / count, 2),
+            "count": count
+        }
+
+    def _values(self, doc):
+        """The values a show is ranked by, read from one of its aggregate's shards"""
+        data = doc.to_dict() or {}
+        return (data.get("count") or 0, data.get("sum") or 0)
+
+    def _apply_shard(self, doc, removed=False):
+        """Record one shard's values; returns its show ID and the show's summed values"""
+        show_id = show_rating_counter.counter_id(doc.id)
+        shards = self._shards.setdefault(show_id, {})
+        if removed:
+            shards.pop(doc.id, None)
+        else:
+            shards[doc.id] = self._values(doc)
+        if not shards:
+            del self._shards[show_id]
+            return show_id, (0,)
+        return show_id, self._sum(shards.values())
+
+    def _sum(self, shard_values):
+        """A show's values from those of its shards"""
+        return tuple(sum(values) for values in zip(*shard_values))
+
+    def _track_votes(self, values, sign):
+        """Add (sign 1) or take out (sign -1) a show's votes in the running totals"""
+        count, total = values
+        self._votes += sign * count
+        self._total += sign * total
+
+    def _data_mean(self):
+        return self._total / self._votes if self._votes else 0.0
+
+    def _refresh_prior(self):
+        if self._configured_mean is None:
+            self._prior_mean = self._data_mean()
+
+    def _rerank(self):
+        self._refresh_prior()
+        self._keys = {show_id: self._key(show_id, *values) for show_id, values in self._stats.items()}
+        self._ranked = sorted(self._keys.values())
+
+    def load(self, stats):
+        """Replace the ranking with {show_id: (count, ...)}, the values _values reads"""
+        with self._lock:
+            self._stats = {show_id: values for show_id, values in stats.items() if values[0] > 0}
+            self._votes = 0
+            self._total = 0
+            for values in self._stats.values():
+                self._track_votes(values, 1)
+            self._rerank()
+        self._loaded.set()
+
+    def rebuild(self):
+        """Re-rank every show, refreshing a data-derived prior mean"""
+        with self._lock:
+            self._rerank()
+
+    def update(self, show_id, count, *values):
+        """Move one show to its place for new values; a count of 0 removes it"""
+        with self._lock:
+            old_key = self._keys.pop(show_id, None)
+            if old_key is not None:
+                del self._ranked[bisect_left(self._ranked, old_key)]
+                self._track_votes(self._stats[show_id], -1)
+            if count > 0:
+                self._stats[show_id] = (count, *values)
+                self._track_votes(self._stats[show_id], 1)
+                self._keys[show_id] = self._key(show_id, count, *values)
+                insort(self._ranked, self._keys[show_id])
+            else:
+                self._stats.pop(show_id, None)
+            if self._configured_mean is None and \
+                    abs(self._data_mean() - self._prior_mean) > LEADERBOARD_PRIOR_RERANK_DELTA:
+                self._rerank()
+
+    def page(self, offset=0, limit=20, min_votes=1):
+        """Return (entries, has_more) for one page of shows with at least min_votes ratings"""
+        entries = []
+        rank = 0
+        with self._lock:
+            for _, _, show_id in self._ranked:
+                values = self._stats[show_id]
+                if values[0] < min_votes:
+                    continue
+                rank += 1
+                if rank <= offset:
+                    continue
+                if len(entries) == limit:
+                    return entries, True
+                entries.append({"rank": rank, **self._entry(show_id, *values)})
+        return entries, False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ranked)
+
+    def prior(self):
+        with self._lock:
+            return {"mean": round(self._prior_mean, 3), "votes": self._prior_votes}
+
+    def start(self):
+        """Begin following show aggregates; safe to call repeatedly"""
+        with self._start_lock:
+            if self._watch is not None:
+                return
+            self._watch = db.collection(show_rating_counter.shards_collection).on_snapshot(self._on_snapshot)
+
+    def link(self, board):
+        """Keep another board of the same shows current from this board's listener"""
+        self._linked.append(board)
+
+    def wait_until_loaded(self, timeout=LEADERBOARD_LOAD_TIMEOUT_SECONDS):
+        return self._loaded.wait(timeout)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        for board in self._linked:
+            board._on_snapshot(docs, changes, read_time)
+        try:
+            if not self._loaded.is_set():
+                # The first snapshot holds every shard of every show
+                self._shards = {}
+                stats = {}
+                for doc in docs:
+                    show_id, values = self._apply_shard(doc)
+                    stats[show_id] = values
+                self.load(stats)
+                return
+            for change in changes:
+                show_id, values = self._apply_shard(change.document, removed=change.type.name == "REMOVED")
+                self.update(show_id, *values)
+        except Exception as e:
+            logger.error(f"Error updating leaderboard: {e}")
+
+class TrendingLeaderboard(Leaderboard):
+    """Shows ranked by exponentially decayed rating activity.
+
+    Every score decays at the same rate, so shows are ordered by their
+    trending_rank, which doesn't change with time, and the ranking only moves
+    when a show is rated. Scores are decayed to the current time when read.
+    """
+
+    def _key(self, show_id, count, trending_score, updated_at):
+        return (-trending_rank(trending_score, updated_at), -count, show_id)
+
+    def _entry(self, show_id, count, trending_score, updated_at):
+        return {
+            "show_id": show_id,
+            "score": round(decayed_trending_score(trending_score, updated_at), 3),
+            "count": count
+        }
+
+    def _values(self, doc):
+        data = doc.to_dict() or {}
+        return (data.get("count") or 0, data.get("trending_score") or 0.0, data.get("trending_updated_at"))
+
+    def _sum(self, shard_values):
+        count, score, updated_at = 0, 0.0, None
+        for shard_count, shard_score, shard_updated_at in shard_values:
+            count += shard_count
+            score, updated_at = combine_trending(score, updated_at, shard_score, shard_updated_at)
+        return count, score, updated_at
+
+    def _track_votes(self, values, sign):
+        pass
+
+    def _refresh_prior(self):
+        pass
+
+    def top(self, limit):
+        """The highest trending shows as (show_id, decayed score) pairs"""
+        entries, _ = self.page(limit=limit)
+        return [(entry["show_id"], entry["score"]) for entry in entries]
+
+leaderboard = Leaderboard()
+trending_leaderboard = TrendingLeaderboard()
+leaderboard.link(trending_leaderboard)
@@ -0,0 +1,316 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from firebase_db import db
+from aggregates import rebuild_show_rating_stats, rebuild_episode_rating_stats, rebuild_user_rating_stats, \
+    rebuild_popular_buckets, rebuild_follow_counts, show_rating_counter, \
+    SHOW_RATING_STATS_COLLECTION
+from doc_ids import rating_doc_id, episode_rating_doc_id, watch_status_doc_id, follow_doc_id, rekey_job_id
+from feed_jobs import increment_feed_count
+from feed_stream import publish_ratings_changed
+from jobs import load_checkpoint, save_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# Documents read and written per migration batch (Firestore's batch limit is 500)
+MIGRATION_BATCH_SIZE = 500
+# Batches committed concurrently by the rekey migrations
+MIGRATION_WORKERS = 8
+# Most values Firestore accepts in one "in" filter
+FIRESTORE_IN_LIMIT = 30
+
+def backfill_has_comment(batch_size=MIGRATION_BATCH_SIZE):
+    """Set has_comment on ratings written before the field existed.
+
+    Ratings without the field are left out of the with_comment_first sort,
+    so run this once after deploying it.
+    """
+    query = db.collection("ratings").order_by("__name__").limit(batch_size)
+    updated = 0
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc is not None else query
+        docs = list(page.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            rating_data = doc.to_dict()
+            if "has_comment" not in rating_data:
+                batch.update(doc.reference, {"has_comment": bool(rating_data.get("comment"))})
+                pending += 1
+        if pending:
+            batch.commit()
+            updated += pending
+
+        last_doc = docs[-1]
+        if len(docs) < batch_size:
+            break
+
+    logger.info(f"Backfilled has_comment on {updated} ratings")
+    return updated
+
+def backfill_episode_heatmaps():
+    """Build season aggregates and user season docs for episode ratings
+    written before the heatmap endpoint existed"""
+    show_ids = {doc.get("show_id") for doc in db.collection("episode_ratings").select(["show_id"]).stream()}
+    for show_id in show_ids:
+        rebuild_episode_rating_stats(show_id)
+    logger.info(f"Rebuilt episode heatmaps for {len(show_ids)} shows")
+    return len(show_ids)
+
+def backfill_user_rating_stats():
+    """Build stats documents for users who rated before they existed"""
+    rebuilt = 0
+    for user in db.collection("users").select([]).stream():
+        rebuild_user_rating_stats(user.id)
+        rebuilt += 1
+    logger.info(f"Rebuilt rating stats for {rebuilt} users")
+    return rebuilt
+
+def backfill_popular_buckets():
+    """Build the popularity buckets from ratings made before they existed"""
+    rebuilt = rebuild_popular_buckets()
+    logger.info(f"Rebuilt {rebuilt} popularity buckets")
+    return rebuilt
+
+def backfill_trending_scores():
+    """Rebuild the aggregate of every rated show so it has a trending score
+    and update time; shards holding only an older epoch-weighted score are
+    ignored until then"""
+    show_ids = {shard.get("counter_id") for shard in
+                db.collection(show_rating_counter.shards_collection).select(["counter_id"]).stream()}
+    for show_id in show_ids:
+        rebuild_show_rating_stats(show_id)
+    logger.info(f"Rebuilt trending scores for {len(show_ids)} shows")
+    return len(show_ids)
+
+def backfill_sharded_counters():
+    """Move show aggregates, popularity buckets and follow counts into sharded counters.
+
+    Everything is recomputed from the ratings and follows, then the unsharded
+    show aggregates, which nothing reads any more, are deleted.
+    """
+    show_ids = {doc.get("show_id") for doc in db.collection("ratings").select(["show_id"]).stream()}
+    for show_id in show_ids:
+        rebuild_show_rating_stats(show_id)
+    buckets = rebuild_popular_buckets()
+    users = rebuild_follow_counts()
+
+    legacy = list(db.collection(SHOW_RATING_STATS_COLLECTION).select([]).stream())
+    for start in range(0, len(legacy), MIGRATION_BATCH_SIZE):
+        batch = db.batch()
+        for doc in legacy[start:start + MIGRATION_BATCH_SIZE]:
+            batch.delete(doc.reference)
+        batch.commit()
+    logger.info(f"Sharded aggregates of {len(show_ids)} shows, {buckets} popularity buckets "
+                f"and follow counts of {users} users")
+    return len(show_ids)
+
+def _pack_batches(groups, batch_size=MIGRATION_BATCH_SIZE):
+    """Pack groups of write operations into batches without splitting a group,
+    so a failed batch never leaves a key half moved"""
+    batches = [[]]
+    for group in groups:
+        if batches[-1] and len(batches[-1]) + len(group) > batch_size:
+            batches.append([])
+        batches[-1].extend(group)
+    return [batch for batch in batches if batch]
+
+def _commit_in_parallel(batches, workers=MIGRATION_WORKERS):
+    """Commit lists of (op, ref, data) write operations as batches on a thread pool.
+
+    Batches must be independent of each other, since they can land in any order.
+    """
+    def commit(operations):
+        batch = db.batch()
+        for op, ref, data in operations:
+            if op == "set":
+                batch.set(ref, data)
+            elif op == "increment":
+                increment_feed_count(batch, ref, data)
+            else:
+                batch.delete(ref)
+        batch.commit()
+        return len(operations)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # sum() re-raises the first failed commit
+        return sum(executor.map(commit, batches))
+
+def _rekey_groups(collection, docs, doc_id_for, recency_field):
+    """Work out the writes moving documents to their deterministic IDs.
+
+    Documents that map to the same ID are duplicates left by racing writes;
+    the most recent one is kept and the rest are deleted. Returns the write
+    groups, a map of old ID to new ID for every document that moves, and the
+    kept data of every key that had duplicates.
+    """
+    keys = {}
+    for doc in docs:
+        keys.setdefault(doc_id_for(doc.to_dict()), []).append(doc)
+
+    groups = []
+    renamed = {}
+    deduplicated = []
+    for new_id, key_docs in keys.items():
+        if len(key_docs) == 1 and key_docs[0].id == new_id:
+            continue
+        kept = max(key_docs, key=lambda doc: doc.to_dict().get(recency_field) or "")
+        group = []
+        if kept.id != new_id:
+            group.append(("set", collection.document(new_id), kept.to_dict()))
+        for doc in key_docs:
+            if doc.id != new_id:
+                group.append(("delete", doc.reference, None))
+                renamed[doc.id] = new_id
+        groups.append(group)
+        if len(key_docs) > 1:
+            deduplicated.append(kept.to_dict())
+    return groups, renamed, deduplicated
+
+def _rekey_collection(collection_name, doc_id_for, recency_field, group_field,
+                      on_page=None, on_finish=None, page_size=MIGRATION_BATCH_SIZE):
+    """Move every document in a collection to its deterministic ID, a page at a time.
+
+    Every key starts with group_field, so paging in its order never splits a
+    key's duplicates across pages. The last value done is checkpointed and a
+    rerun carries on after it. on_page(renamed, deduplicated) runs after each
+    page commits, and on_finish(merged) once the whole collection is done,
+    before the migration is marked finished. Returns how many documents
+    moved and how many keys had duplicates.
+    """
+    collection = db.collection(collection_name)
+    job_id = rekey_job_id(collection_name)
+    checkpoint = load_checkpoint(job_id) or {}
+    if checkpoint.get("status") == "done":
+        return checkpoint.get("moved", 0), checkpoint.get("merged", 0)
+
+    # A page that committed just before the last run stopped still needs its follow-up
+    pending = checkpoint.get("pending")
+    if pending and on_page:
+        on_page(pending["renamed"], pending["deduplicated"])
+
+    last_value = checkpoint.get("last_value")
+    moved = checkpoint.get("moved", 0)
+    merged = checkpoint.get("merged", 0)
+    query = collection.order_by(group_field).limit(page_size)
+    while True:
+        page = query.start_after({group_field: last_value}) if last_value is not None else query
+        docs = list(page.stream())
+        if not docs:
+            break
+        finished = len(docs) < page_size
+        values = [doc.to_dict().get(group_field) for doc in docs]
+        last_value = values[-1]
+        if not finished:
+            if values[0] == last_value:
+                # One group fills the whole page, so read all of it
+                docs = list(collection.where(group_field, "==", last_value).stream())
+            else:
+                # The page may end partway through its last group; the next page starts with it
+                docs = [doc for doc, value in zip(docs, values) if value != last_value]
+                last_value = values[len(docs) - 1]
+
+        groups, renamed, deduplicated = _rekey_groups(collection, docs, doc_id_for, recency_field)
+        if on_page and groups:
+            save_checkpoint(job_id, type="rekey", status="running",
+                            pending={"renamed": renamed, "deduplicated": deduplicated})
+        _commit_in_parallel(_pack_batches(groups))
+        if on_page and groups:
+            on_page(renamed, deduplicated)
+        moved += len(renamed)
+        merged += len(deduplicated)
+        save_checkpoint(job_id, type="rekey", status="running", last_value=last_value,
+                        moved=moved, merged=merged, pending=None)
+        if finished:
+            break
+
+    if on_finish:
+        on_finish(merged)
+    save_checkpoint(job_id, type="rekey", status="done", moved=moved, merged=merged, pending=None)
+    logger.info(f"Rekeyed {moved} {collection_name} documents, {merged} keys had duplicates")
+    return moved, merged
+
+def _rekey_feed_items(renamed_ratings):
+    """Point feed items at the new rating IDs, merging items that now share one"""
+    if not renamed_ratings:
+        return 0
+
+    keys = {}
+    old_ids = list(renamed_ratings)
+    for start in range(0, len(old_ids), FIRESTORE_IN_LIMIT):
+        items = db.collection_group("items") \
+            .where("rating_id", "in", old_ids[start:start + FIRESTORE_IN_LIMIT]).stream()
+        for item in items:
+            feed_id = item.reference.parent.parent.id
+            keys.setdefault((feed_id, renamed_ratings[item.get("rating_id")]), []).append(item)
+
+    groups = []
+    for (user_id, new_id), items in keys.items():
+        kept = max(items, key=lambda item: item.to_dict().get("timestamp") or "").to_dict()
+        kept["rating_id"] = new_id
+        items_ref = db.collection("feeds").document(user_id).collection("items")
+        group = [("set", items_ref.document(new_id), kept)]
+        group += [("delete", item.reference, None) for item in items]
+        if len(items) > 1:
+            group.append(("increment", user_id, -(len(items) - 1)))
+        groups.append(group)
+
+    _commit_in_parallel(_pack_batches(groups))
+    return len(keys)
+
+def _rebuild_rating_stats(deduplicated, rebuild_show):
+    """Recount the users and shows whose duplicate ratings were each counted"""
+    for show_id in {data["show_id"] for data in deduplicated}:
+        rebuild_show(show_id)
+    for user_id in {data["user_id"] for data in deduplicated}:
+        rebuild_user_rating_stats(user_id)
+
+def rekey_ratings(page_size=MIGRATION_BATCH_SIZE):
+    """Move ratings to {user_id}_{show_id} IDs and update the feed items that reference them"""
+    def after_page(renamed, deduplicated):
+        _rekey_feed_items(renamed)
+        publish_ratings_changed(list(renamed))
+        _rebuild_rating_stats(deduplicated, rebuild_show_rating_stats)
+
+    def after_all(merged):
+        # Duplicates were each counted in the popularity buckets too
+        if merged:
+            rebuild_popular_buckets()
+
+    moved, _ = _rekey_collection(
+        "ratings", lambda data: rating_doc_id(data["user_id"], data["show_id"]), "timestamp", "user_id",
+        on_page=after_page, on_finish=after_all, page_size=page_size)
+    return moved
+
+def rekey_episode_ratings(page_size=MIGRATION_BATCH_SIZE):
+    """Move episode ratings to {user_id}_{show_id}_{season}_{episode} IDs"""
+    moved, _ = _rekey_collection(
+        "episode_ratings",
+        lambda data: episode_rating_doc_id(data["user_id"], data["show_id"],
+                                           data["season_number"], data["episode_number"]),
+        "timestamp", "user_id",
+        on_page=lambda renamed, deduplicated: _rebuild_rating_stats(deduplicated, rebuild_episode_rating_stats),
+        page_size=page_size)
+    return moved
+
+def rekey_watch_statuses(page_size=MIGRATION_BATCH_SIZE):
+    """Move watch statuses to {user_id}_{show_id} IDs"""
+    moved, _ = _rekey_collection(
+        "watch_status", lambda data: watch_status_doc_id(data["user_id"], data["show_id"]),
+        "updated_at", "user_id", page_size=page_size)
+    return moved
+
+def rekey_follows(page_size=MIGRATION_BATCH_SIZE):
+    """Move follows to {follower_id}_{followee_id} IDs, recounting follows if
+    there were duplicates, since each was counted"""
+    def after_all(merged):
+        if merged:
+            rebuild_follow_counts()
+
+    moved, _ = _rekey_collection(
+        "follows", lambda data: follow_doc_id(data["follower_id"], data["followee_id"]),
+        "followed_at", "follower_id", on_finish=after_all, page_size=page_size)
+    return moved
@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+import time
+from jobs import run_in_background
+
+logger = logging.getLogger(__name__)
+
+# Set TELI_SCHEDULER_ENABLED=0 on workers that shouldn't run periodic jobs,
+# e.g. all but one worker in a multi-worker deployment
+SCHEDULER_ENABLED = os.environ.get("TELI_SCHEDULER_ENABLED", "1") == "1"
+# How often the scheduler checks for due tasks
+SCHEDULER_TICK_SECONDS = 1
+
+class Scheduler:
+    """Runs registered tasks periodically on the background job pool.
+
+    A task that is still running when it comes due again is skipped rather
+    than started twice.
+    """
+
+    def __init__(self, enabled=SCHEDULER_ENABLED):
+        self._enabled = enabled
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def every(self, interval_seconds, fn, *args, run_immediately=True):
+        """Register fn(*args) to run every interval_seconds"""
+        with self._lock:
+            self._tasks.append({
+                "fn": fn,
+                "args": args,
+                "interval": interval_seconds,
+                "next_run": time.monotonic() if run_immediately else time.monotonic() + interval_seconds,
+                "running": None
+            })
+
+    def start(self):
+        """Start the scheduler thread; does nothing if disabled or already started"""
+        with self._lock:
+            if not self._enabled or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="teli-scheduler", daemon=True)
+            self._thread.start()
+        logger.info(f"Scheduler started with {len(self._tasks)} tasks")
+
+    def stop(self):
+        self._stop.set()
+
+    def run_due(self):
+        """Start every task that is due and not still running from last time"""
+        now = time.monotonic()
+        with self._lock:
+            for task in self._tasks:
+                if task["next_run"] > now:
+                    continue
+                if task["running"] is not None and not task["running"].done():
+                    logger.info(f"Skipping {task['fn'].__name__}: previous run still in progress")
+                else:
+                    task["running"] = run_in_background(task["fn"], *task["args"])
+                task["next_run"] = now + task["interval"]
+
+    def _run(self):
+        while not self._stop.wait(SCHEDULER_TICK_SECONDS):
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Scheduler error: {e}")
+
+scheduler = Scheduler()
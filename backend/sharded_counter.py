@@ -0,0 +1,122 @@
+from cachetools import TTLCache
+import random
+import threading
+from firebase_db import db
+
+# Shards per counter unless a counter asks for more; Firestore sustains about
+# one write per second on a document, so this is roughly the sustained
+# increments per second a counter can take
+SHARDED_COUNTER_SHARDS = 10
+# Totals kept in memory; increments made through this process drop the cached
+# total, so only other workers' writes can take this long to show up
+SHARDED_COUNTER_CACHE_MAX_ITEMS = 10000
+SHARDED_COUNTER_CACHE_TTL_SECONDS = 5
+
+def combine_totals(total, values):
+    """Fold one shard's fields into a running total"""
+    for field, value in values.items():
+        current = total.get(field)
+        if isinstance(value, dict):
+            total[field] = combine_totals(dict(current) if isinstance(current, dict) else {}, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[field] = (current if isinstance(current, (int, float)) else 0) + value
+        elif current is None or (value is not None and value > current):
+            total[field] = value
+    return total
+
+class ShardedCounter:
+    """Counters whose increments are spread over shard documents.
+
+    Each increment lands on one of num_shards documents in the
+    {collection}_shards collection, keyed {counter_id}_{shard}, so a hot
+    counter takes num_shards times the writes a single document can. Reads sum
+    the shards: numeric fields are added up, maps are combined field by field
+    and any other field (an ISO timestamp, a label) takes its largest value.
+    A counter with fields that don't add up that way passes its own combine.
+    """
+
+    def __init__(self, collection, num_shards=SHARDED_COUNTER_SHARDS,
+                 cache_max_items=SHARDED_COUNTER_CACHE_MAX_ITEMS, cache_ttl=SHARDED_COUNTER_CACHE_TTL_SECONDS,
+                 combine=combine_totals):
+        self.collection = collection
+        self._combine = combine
+        self.shards_collection = f"{collection}_shards"
+        self.num_shards = num_shards
+        self._totals = TTLCache(maxsize=cache_max_items, ttl=cache_ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def counter_id(shard_doc_id):
+        """The counter a shard document belongs to"""
+        return shard_doc_id.rsplit("_", 1)[0]
+
+    def shard_ref(self, counter_id, shard):
+        return db.collection(self.shards_collection).document(f"{counter_id}_{shard}")
+
+    def shard_refs(self, counter_id):
+        return [self.shard_ref(counter_id, shard) for shard in range(self.num_shards)]
+
+    def increment(self, writer, counter_id, fields, shard=None):
+        """Add a merged write of fields (firestore.Increment values, or plain
+        values such as labels) to one shard, picked at random unless given"""
+        if shard is None:
+            shard = random.randrange(self.num_shards)
+        writer.set(self.shard_ref(counter_id, shard), {"counter_id": counter_id, **fields}, merge=True)
+        self.invalidate(counter_id)
+
+    def set(self, writer, counter_id, fields):
+        """Replace a counter's totals, e.g. when rebuilding it; costs one write per shard"""
+        refs = self.shard_refs(counter_id)
+        writer.set(refs[0], {"counter_id": counter_id, **fields})
+        for ref in refs[1:]:
+            writer.delete(ref)
+        self.invalidate(counter_id)
+
+    def get_many(self, counter_ids, cached=True):
+        """Return {counter_id: totals} for the counters that have any shards,
+        reading every uncached counter's shards in one get_all"""
+        found = {}
+        missing = []
+        with self._lock:
+            for counter_id in dict.fromkeys(counter_ids):
+                totals = self._totals.get(counter_id) if cached else None
+                if totals is not None:
+                    found[counter_id] = totals
+                else:
+                    missing.append(counter_id)
+
+        if missing:
+            shards = {}
+            refs = [ref for counter_id in missing for ref in self.shard_refs(counter_id)]
+            for shard in db.get_all(refs):
+                if shard.exists:
+                    shards.setdefault(self.counter_id(shard.id), []).append(shard.to_dict())
+            for counter_id in missing:
+                totals = {}
+                for shard in shards.get(counter_id, ()):
+                    self._combine(totals, shard)
+                totals.pop("counter_id", None)
+                with self._lock:
+                    # Counters with no shards are cached too, as empty totals
+                    self._totals[counter_id] = totals
+                if totals:
+                    found[counter_id] = totals
+        return {counter_id: totals for counter_id, totals in found.items() if totals}
+
+    def get(self, counter_id, cached=True):
+        """A counter's totals, or None if it has never been incremented"""
+        return self.get_many([counter_id], cached).get(counter_id)
+
+    def query(self, filter):
+        """Return {counter_id: totals} for the counters with shards matching a
+        FieldFilter on a label, summing only the matching shards"""
+        totals = {}
+        for shard in db.collection(self.shards_collection).where(filter=filter).stream():
+            self._combine(totals.setdefault(self.counter_id(shard.id), {}), shard.to_dict())
+        for counter_totals in totals.values():
+            counter_totals.pop("counter_id", None)
+        return totals
+
+    def invalidate(self, counter_id):
+        with self._lock:
+            self._totals.pop(counter_id, None)
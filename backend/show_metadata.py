@@ -0,0 +1,76 @@
+from cachetools import TTLCache
+import threading
+from firebase_db import db
+
+# One document per show holding the TMDB fields popular shows can be filtered by
+SHOW_METADATA_COLLECTION = "show_metadata"
+# Metadata kept in memory; genres and language rarely change, so the TTL
+# only bounds how long a TMDB correction takes to show up
+SHOW_METADATA_CACHE_MAX_ITEMS = 100000
+SHOW_METADATA_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+def metadata_from_details(details):
+    """The filterable fields of a TMDB show details payload"""
+    return {
+        "genre_ids": sorted(genre["id"] for genre in details.get("genres") or [] if "id" in genre),
+        "original_language": details.get("original_language") or None
+    }
+
+def genre_facet(genre_id):
+    return f"genre_{genre_id}"
+
+def language_facet(language):
+    return f"lang_{language}"
+
+def show_facets(metadata):
+    """Facets a show's ratings are also counted under"""
+    facets = [genre_facet(genre_id) for genre_id in metadata.get("genre_ids", [])]
+    if metadata.get("original_language"):
+        facets.append(language_facet(metadata["original_language"]))
+    return facets
+
+class ShowMetadataCache:
+    """Genres and language per show, cached from TMDB detail payloads.
+
+    Metadata is written to Firestore the first time a show's details are seen
+    (or when they change) and read back with a single get_all for misses.
+    """
+
+    def __init__(self, max_items=SHOW_METADATA_CACHE_MAX_ITEMS, ttl=SHOW_METADATA_CACHE_TTL_SECONDS):
+        self._metadata = TTLCache(maxsize=max_items, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def record(self, show_id, details):
+        """Remember a show's metadata; returns True if it was new or changed"""
+        show_id = str(show_id)
+        metadata = metadata_from_details(details)
+        with self._lock:
+            if self._metadata.get(show_id) == metadata:
+                return False
+            self._metadata[show_id] = metadata
+        db.collection(SHOW_METADATA_COLLECTION).document(show_id).set(metadata)
+        return True
+
+    def get_many(self, show_ids):
+        """Return {show_id: metadata} for the shows whose details have been seen"""
+        found = {}
+        missing = []
+        with self._lock:
+            for show_id in set(map(str, show_ids)):
+                metadata = self._metadata.get(show_id)
+                if metadata is not None:
+                    found[show_id] = metadata
+                else:
+                    missing.append(show_id)
+
+        if missing:
+            metadata_refs = [db.collection(SHOW_METADATA_COLLECTION).document(show_id) for show_id in missing]
+            for metadata_doc in db.get_all(metadata_refs):
+                if metadata_doc.exists:
+                    metadata = metadata_doc.to_dict()
+                    with self._lock:
+                        self._metadata[metadata_doc.id] = metadata
+                    found[metadata_doc.id] = metadata
+        return found
+
+show_metadata_cache = ShowMetadataCache()
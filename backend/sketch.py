@@ -0,0 +1,90 @@
+import heapq
+
+# Counters kept per summary; a count is never over by more than the total
+# number of ratings summarized divided by this
+SKETCH_CAPACITY = 1000
+
+class SpaceSaving:
+    """Mergeable Space-Saving summary of per-item counts.
+
+    Holds at most `capacity` items. Each kept count is an upper bound that is
+    at most `error` above the true count, and `floor` bounds the count of any
+    item that isn't kept. Summaries of disjoint streams merge into a summary of
+    the combined stream with the same guarantees, so a long window is answered
+    by merging the summaries of its buckets in constant memory.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, counts=None, errors=None, floor=0):
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self.errors = dict(errors or {})
+        self.floor = floor
+
+    @classmethod
+    def from_counts(cls, counts, capacity=SKETCH_CAPACITY):
+        """Summarize exact counts, keeping the largest `capacity` of them"""
+        counts = {item: count for item, count in counts.items() if count > 0}
+        summary = cls(capacity)
+        summary._absorb(counts, {}, 0)
+        return summary
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("capacity", SKETCH_CAPACITY), data.get("counts"),
+                   data.get("errors"), data.get("floor", 0))
+
+    def to_dict(self):
+        return {
+            "capacity": self.capacity,
+            "counts": dict(self.counts),
+            # Most items are exact, so only the non-zero errors are stored
+            "errors": {item: error for item, error in self.errors.items() if error},
+            "floor": self.floor
+        }
+
+    @property
+    def exact(self):
+        """True if nothing has been dropped, so every count is exact"""
+        return self.floor == 0 and not any(self.errors.values())
+
+    def merge(self, other):
+        """Fold another summary in; an item missing from one side is assumed
+        to have that side's floor count there"""
+        counts = {}
+        errors = {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, self.floor) + other.counts.get(item, other.floor)
+            errors[item] = (self.errors.get(item, 0) if item in self.counts else self.floor) + \
+                (other.errors.get(item, 0) if item in other.counts else other.floor)
+        self._absorb(counts, errors, self.floor + other.floor)
+        return self
+
+    def subtract(self, counts):
+        """Take out counts that were already summarized, e.g. ratings that
+        moved to another bucket after this one was sealed. Kept counts stay
+        upper bounds, and items not kept are still bounded by the floor."""
+        for item, count in counts.items():
+            if item in self.counts:
+                self.counts[item] -= count
+                if self.counts[item] <= 0:
+                    del self.counts[item]
+                    self.errors.pop(item, None)
+        return self
+
+    def _absorb(self, counts, errors, floor):
+        if len(counts) > self.capacity:
+            kept = heapq.nlargest(self.capacity, counts, key=counts.get)
+            kept_set = set(kept)
+            # The largest dropped count bounds everything no longer kept
+            floor = max([floor] + [count for item, count in counts.items() if item not in kept_set])
+            counts = {item: counts[item] for item in kept}
+        self.counts = counts
+        self.errors = {item: errors.get(item, 0) for item in counts}
+        self.floor = floor
+
+    def top(self, k):
+        """The k items with the highest estimated counts as (item, count) pairs"""
+        return sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+
+    def __len__(self):
+        return len(self.counts)
@@ -1,15 +1,39 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.api_core.exceptions import AlreadyExists
 from flask_cors import CORS
-from pydantic import BaseModel, EmailStr, Field, ValidationError
+from pydantic import BaseModel, EmailStr, Field, PastDatetime, TypeAdapter, ValidationError
 from werkzeug.exceptions import BadRequest
 from typing import Optional, List
 from datetime import datetime, timezone, timedelta
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 import requests
+import csv
+import io
+import json
+import re
 import logging
+import threading
+import uuid
 from firebase_db import db
+from feed_jobs import schedule_feed_cleanup, schedule_compaction_sweep, increment_feed_count
+from jobs import run_in_background, load_checkpoint, save_checkpoint
+from aggregates import apply_show_rating_delta, get_show_rating_stats, summarize_rating_stats, \
+    apply_episode_rating_delta, apply_season_rating_deltas, summarize_episode_heatmap, \
+    apply_user_rating_deltas, user_rating_stats_ref, summarize_user_rating_stats, \
+    apply_popular_bucket_deltas, top_recent_shows, apply_follow_count_deltas, get_follow_counts, rating_counted_at, \
+    read_trending_shards, TRENDING_HALF_LIFE_SECONDS, \
+    EPISODE_RATING_STATS_COLLECTION, USER_SEASON_RATINGS_COLLECTION
+from feed_stream import feed_bus, broker, publish_feed_event, publish_ratings_changed, HEARTBEAT_SECONDS, \
+    FEED_ITEM, FEED_RESET
+from feed_cache import feed_page_cache, rating_cache, followee_popular_cache, compact_feed_item, \
+    feed_response_item, FEED_PAGE_SIZE
+from doc_ids import rating_doc_id, episode_rating_doc_id, watch_status_doc_id, follow_doc_id, keyed_doc_ref
+from leaderboard import leaderboard, trending_leaderboard
+from follow_graph import follow_graph
+from show_metadata import show_metadata_cache, show_facets, genre_facet, language_facet
+from tmdb_routes import fetch_show_metadata
 
 
 logger = logging.getLogger(__name__)
@@ -19,6 +43,15 @@ teli = Blueprint("teli", __name__)
 def hello():
     return jsonify({"message": "Hello from Teli!"})
 
+@teli.route("/health", methods=["GET"])
+def health():
+    """This worker's in-memory state, for monitoring its footprint"""
+    return jsonify({
+        "status": "ok",
+        "follow_graph": {"loaded": follow_graph.is_loaded(), **follow_graph.memory_usage()},
+        "feed_stream_subscribers": feed_bus.subscriber_count()
+    }), 200
+
 class AddUserRequest(BaseModel):
     name: str
     username: str
@@ -76,6 +109,8 @@ def get_user(user_id):
         
         # Add the document ID to the response
         user_data["id"] = user_id
+        # Profile headers show these, so they come from counters rather than the follow graph
+        user_data.update(get_follow_counts(user_id))
         
         return jsonify(user_data), 200
     
@@ -143,6 +178,134 @@ class AddEpisodeRatingRequest(BaseModel):
     rating: int = Field(..., ge=1, le=10)  # Rating between 1-10
     comment: Optional[str] = None
 
+class SeasonEpisodeRating(BaseModel):
+    episode_number: int = Field(..., ge=1)  # Episode number must be positive
+    rating: int = Field(..., ge=1, le=10)  # Rating between 1-10
+    comment: Optional[str] = None
+
+# Longest list of episodes accepted by one season rating request
+SEASON_RATINGS_MAX_EPISODES = 100
+
+class AddSeasonRatingsRequest(BaseModel):
+    user_id: str
+    show_id: str
+    season_number: int = Field(..., ge=1)  # Season number must be positive
+    ratings: List[SeasonEpisodeRating] = Field(..., min_length=1, max_length=SEASON_RATINGS_MAX_EPISODES)
+
+@firestore.transactional
+def _save_rating_txn(transaction, rating_data):
+    """Create or update a user's rating for a show and apply the change to the
+    show's rating aggregate atomically. The rating is counted under the facets
+    listed in rating_data["facets"]. Returns (rating_id, previous rating data)."""
+    # A user has one rating per show, stored under a deterministic ID
+    rating_ref = keyed_doc_ref(
+        "ratings", rating_doc_id(rating_data["user_id"], rating_data["show_id"]),
+        {"user_id": rating_data["user_id"], "show_id": rating_data["show_id"]}, transaction)
+    # The previous rating is only read to work out the aggregate delta
+    snapshot = rating_ref.get(transaction=transaction)
+    previous_data = snapshot.to_dict() if snapshot.exists else None
+    trending_shard = read_trending_shards([rating_data["show_id"]], transaction)[rating_data["show_id"]]
+    transaction.set(rating_ref, rating_data, merge=True)
+
+    previous_rating = previous_data.get("rating") if previous_data else None
+    previous_counted_at = rating_counted_at(previous_data) if previous_data else None
+    apply_show_rating_delta(transaction, rating_data["show_id"], previous_rating,
+                            rating_data["rating"], rating_data["timestamp"], previous_counted_at,
+                            trending_shard=trending_shard)
+    apply_user_rating_deltas(transaction, rating_data["user_id"], [(previous_rating, rating_data["rating"])])
+    apply_popular_bucket_deltas(transaction, [(rating_data["show_id"], previous_counted_at,
+                                               rating_data["counted_at"])])
+    _apply_facet_changes(transaction, _facet_changes(rating_data["show_id"], previous_data,
+                                                     rating_data["counted_at"], rating_data["facets"]))
+    return rating_ref.id, previous_data
+
+@firestore.transactional
+def _save_episode_rating_txn(transaction, rating_data):
+    """Create or update a user's episode rating and apply the change to the
+    season aggregate and the user's season ratings atomically. Returns the rating id."""
+    # A user has one rating per episode, stored under a deterministic ID
+    rating_ref = keyed_doc_ref(
+        "episode_ratings",
+        episode_rating_doc_id(rating_data["user_id"], rating_data["show_id"],
+                              rating_data["season_number"], rating_data["episode_number"]),
+        {field: rating_data[field] for field in ("user_id", "show_id", "season_number", "episode_number")},
+        transaction)
+    # The previous rating is only read to work out the aggregate deltas
+    snapshot = rating_ref.get(transaction=transaction)
+    previous_rating = snapshot.get("rating") if snapshot.exists else None
+    transaction.set(rating_ref, rating_data, merge=True)
+
+    apply_episode_rating_delta(transaction, rating_data, previous_rating)
+    if previous_rating is None:
+        apply_user_rating_deltas(transaction, rating_data["user_id"], [], new_episode_ratings=1)
+    return rating_ref.id
+
+# Rating changes per batch of facet counter writes; each change can touch four
+# buckets (old and new hour and day) for each of a show's handful of facets
+RATING_FACET_CHUNK_SIZE = 20
+
+def _show_facets(show_ids):
+    """{show_id: facets} for the shows whose TMDB metadata is known"""
+    return {show_id: show_facets(metadata)
+            for show_id, metadata in show_metadata_cache.get_many(show_ids).items()}
+
+def _facet_changes(show_id, previous_data, counted_at, facets, known_facets=None):
+    """Facet counter changes for a rating moving from its previous counted time
+    to counted_at, as ((show_id, previous_timestamp, new_timestamp), facets) pairs.
+
+    The old buckets lose the rating under the facets it was stored with, so
+    they always take back exactly what was added, and the new buckets gain it
+    under facets. Ratings stored before facets were fall back to
+    known_facets, the show's current facets (facets if not given).
+    """
+    previous_data = previous_data or {}
+    previous_counted_at = rating_counted_at(previous_data)
+    previous_facets = previous_data.get("facets", facets if known_facets is None else known_facets)
+    if previous_facets == facets:
+        changes = [((show_id, previous_counted_at, counted_at), facets)]
+    else:
+        changes = [((show_id, previous_counted_at, None), previous_facets),
+                   ((show_id, None, counted_at), facets)]
+    return [(change, change_facets) for change, change_facets in changes
+            if change_facets and (change[1] or change[2])]
+
+def _apply_facet_changes(writer, facet_changes):
+    """Add facet changes from _facet_changes to a transaction or batch"""
+    for change, facets in facet_changes:
+        apply_popular_bucket_deltas(writer, [change], {change[0]: facets}, overall=False)
+
+def _apply_facet_deltas(facet_changes):
+    """Apply facet changes in batches small enough for any number of them"""
+    for start in range(0, len(facet_changes), RATING_FACET_CHUNK_SIZE):
+        batch = db.batch()
+        _apply_facet_changes(batch, facet_changes[start:start + RATING_FACET_CHUNK_SIZE])
+        batch.commit()
+
+@firestore.transactional
+def _count_rating_facets_txn(transaction, rating_ref, counted_at, facets):
+    """Count a rating written without facets under them, unless it has been
+    re-rated since; that write moved it on using the facets it was stored with"""
+    snapshot = rating_ref.get(transaction=transaction)
+    rating_data = snapshot.to_dict() if snapshot.exists else None
+    if not rating_data or rating_counted_at(rating_data) != counted_at or rating_data.get("facets"):
+        return
+    _apply_facet_changes(transaction, [((rating_data["show_id"], None, counted_at), facets)])
+    transaction.update(rating_ref, {"facets": facets})
+
+def _index_rating_facets(ratings):
+    """Fetch metadata for shows rated before their details were ever seen and
+    count those ratings under their genres and language. Takes (rating_id,
+    show_id, counted_at) for ratings stored without facets."""
+    facets = {}
+    for show_id in {show_id for _, show_id, _ in ratings}:
+        metadata = fetch_show_metadata(show_id)
+        if metadata is not None:
+            facets[show_id] = show_facets(metadata)
+    for rating_id, show_id, counted_at in ratings:
+        if facets.get(show_id):
+            _count_rating_facets_txn(db.transaction(), db.collection("ratings").document(rating_id),
+                                     counted_at, facets[show_id])
+
 @teli.route("/ratings", methods=["POST"])
 def add_rating():
     try:
@@ -157,31 +320,39 @@ def add_rating():
         
     rating_data = req_data.model_dump()
     rating_data["timestamp"] = datetime.now(timezone.utc).isoformat()
+    # Counts toward popularity and trending now, even if it replaces imported history
+    rating_data["counted_at"] = rating_data["timestamp"]
+    # Lets a show's ratings be sorted with commented ones first
+    rating_data["has_comment"] = bool(rating_data.get("comment"))
 
     try:
-        # Check if a rating from the same user for the same show already exists
-        ratings_ref = db.collection("ratings")
-        query = ratings_ref.where(
-            filter=FieldFilter("user_id", "==", rating_data["user_id"])).where(
-                filter=FieldFilter("show_id", "==", rating_data["show_id"])).limit(1)
-
-        existing_ratings = list(query.stream())
-        existing_rating = existing_ratings[0] if existing_ratings else None
-
-        if existing_rating:
-            # If rating exists, update it
-            existing_rating.reference.update(rating_data)
-            rating_id = existing_rating.id
+        # Genre and language counters need the show's TMDB metadata; the
+        # rating keeps the facets it was counted under
+        facets = _show_facets([rating_data["show_id"]])
+        rating_data["facets"] = facets.get(rating_data["show_id"], [])
+        rating_id, previous_data = _save_rating_txn(db.transaction(), rating_data)
+        if rating_data["show_id"] not in facets:
+            run_in_background(_index_rating_facets,
+                              [(rating_id, rating_data["show_id"], rating_data["counted_at"])])
+
+        if previous_data is not None:
             is_new_rating = False
+            # Resubmitting the same rating doesn't change anything followers see
+            content_changed = any(previous_data.get(field) != rating_data.get(field)
+                                  for field in FEED_CONTENT_FIELDS)
         else:
-            # If rating does not exist, create a new one
-            rating_ref = ratings_ref.add(rating_data)
-            rating_id = rating_ref[1].id
             is_new_rating = True
+            content_changed = True
 
-        # Only update feed if this is a new rating
-        if is_new_rating:
-            update_feeds_with_rating(req_data.user_id, rating_id, rating_data)
+        # Feed items only reference the rating, so keep the hydration cache
+        # fresh here and have other workers drop their copy of an edit
+        if previous_data is not None:
+            publish_ratings_changed([rating_id])
+        rating_cache.put(rating_id, rating_data)
+
+        # New ratings are added to followers' feeds, edits update them in place
+        if content_changed:
+            update_feeds_with_rating(req_data.user_id, rating_id, rating_data, is_new_rating)
 
         return jsonify({"message": "Rating added successfully!", "id": rating_id})
     
@@ -205,69 +376,575 @@ def add_episode_rating():
     rating_data["timestamp"] = datetime.now(timezone.utc).isoformat()
 
     try:
-        # Check if a rating from the same user for the same episode already exists
-        episode_ratings_ref = db.collection("episode_ratings")
-        query = episode_ratings_ref.where(
-            filter=FieldFilter("user_id", "==", rating_data["user_id"])).where(
-                filter=FieldFilter("show_id", "==", rating_data["show_id"])).where(
-                    filter=FieldFilter("season_number", "==", rating_data["season_number"])).where(
-                        filter=FieldFilter("episode_number", "==", rating_data["episode_number"])).limit(1)
+        rating_id = _save_episode_rating_txn(db.transaction(), rating_data)
 
-        existing_ratings = list(query.stream())
-        existing_rating = existing_ratings[0] if existing_ratings else None
-
-        if existing_rating:
-            # If rating exists, update it
-            existing_rating.reference.update(rating_data)
-            rating_id = existing_rating.id
-        else:
-            # If rating does not exist, create a new one
-            rating_ref = episode_ratings_ref.add(rating_data)
-            rating_id = rating_ref[1].id
+        # Bursts of episode ratings for a show reach followers as one feed item
+        record_episode_activity([rating_data])
 
         return jsonify({"message": "Rating added successfully!", "id": rating_id})
     
     except Exception as e:
         logger.error(f"Error adding episode rating: {e}")
         return jsonify({"error": str(e)}), 500
+
+@firestore.transactional
+def _save_season_ratings_txn(transaction, user_id, show_id, season_number, ratings):
+    """Upsert a user's ratings for several episodes of a season, and the season
+    aggregates, in one commit. Returns the rating ids."""
+    rating_refs = [
+        keyed_doc_ref(
+            "episode_ratings", episode_rating_doc_id(user_id, show_id, season_number, rating_data["episode_number"]),
+            {"user_id": user_id, "show_id": show_id, "season_number": season_number,
+             "episode_number": rating_data["episode_number"]},
+            transaction)
+        for rating_data in ratings
+    ]
+    # Previous ratings are only read to work out the aggregate deltas
+    previous = {doc.id: doc.get("rating")
+                for doc in db.get_all(rating_refs, transaction=transaction) if doc.exists}
+
+    changes = []
+    for rating_ref, rating_data in zip(rating_refs, ratings):
+        transaction.set(rating_ref, rating_data, merge=True)
+        changes.append((rating_data["episode_number"], previous.get(rating_ref.id), rating_data["rating"]))
+    apply_season_rating_deltas(transaction, user_id, show_id, season_number, changes)
+    apply_user_rating_deltas(transaction, user_id, [],
+                             new_episode_ratings=len(rating_refs) - len(previous))
+    return [rating_ref.id for rating_ref in rating_refs]
+
+@teli.route("/episode_ratings/season", methods=["POST"])
+def add_season_episode_ratings():
+    """Rate several episodes of one season in a single request"""
+    try:
+        req_data = AddSeasonRatingsRequest.model_validate(request.get_json())
+    except ValidationError as e:
+        return jsonify({"errors": e.errors()}), 400
+
+    # Check if user exists
+    user_ref = db.collection("users").document(req_data.user_id).get()
+    if not user_ref.exists:
+        return jsonify({"error": "User not found"}), 404
+
+    timestamp = datetime.now(timezone.utc).isoformat()
+    # An episode listed twice keeps its last entry
+    episodes = {episode.episode_number: episode for episode in req_data.ratings}
+    ratings = [
+        {
+            "user_id": req_data.user_id,
+            "show_id": req_data.show_id,
+            "season_number": req_data.season_number,
+            "episode_number": episode.episode_number,
+            "rating": episode.rating,
+            "comment": episode.comment,
+            "timestamp": timestamp
+        }
+        for episode in sorted(episodes.values(), key=lambda episode: episode.episode_number)
+    ]
+
+    try:
+        rating_ids = _save_season_ratings_txn(db.transaction(), req_data.user_id, req_data.show_id,
+                                              req_data.season_number, ratings)
+
+        # Followers see the season alongside any other recent episode ratings
+        record_episode_activity(ratings)
+
+        return jsonify({"message": "Ratings added successfully!", "ids": rating_ids})
+
+    except Exception as e:
+        logger.error(f"Error adding season episode ratings: {e}")
+        return jsonify({"error": str(e)}), 500
     
-def update_feeds_with_rating(user_id, rating_id, rating_data):
-    """Update the feeds of all followers with this new rating"""
+# Followers written per fan-out batch; each follower costs up to two write ops
+FAN_OUT_CHUNK_SIZE = 250
+# Rating fields whose change means a follower's feed copy is out of date
+FEED_CONTENT_FIELDS = ("rating", "comment")
+
+def _feed_copy_is_current(snapshot, feed_data):
+    if snapshot is None or not snapshot.exists:
+        return False
+    item = snapshot.to_dict()
+    return all(item.get(field) == value for field, value in feed_data.items())
+
+def get_user_details(user_ids):
+    """Look up display names for a set of users with a single batched read"""
+    user_refs = [db.collection("users").document(user_id) for user_id in set(user_ids)]
+    details = {}
+    for user_doc in db.get_all(user_refs):
+        if user_doc.exists:
+            user_data = user_doc.to_dict()
+            details[user_doc.id] = {
+                "user_name": user_data.get("name", ""),
+                "user_username": user_data.get("username", "")
+            }
+    return details
+
+def _write_feed_chunk(follower_ids, item_id, feed_data, is_new_item, live_item):
+    """Upsert one feed item into a chunk of followers' feeds, returning the number of writes"""
+    item_refs = [
+        db.collection("feeds").document(follower_id).collection("items").document(item_id)
+        for follower_id in follower_ids
+    ]
+
+    # A new item can't be in anyone's feed yet; for updates, read the existing
+    # copies in one round trip so up-to-date followers can be skipped
+    existing = {}
+    if not is_new_item:
+        existing = {snapshot.reference.path: snapshot for snapshot in db.get_all(item_refs)}
+
+    batch = db.batch()
+    updated_followers = []
+    for follower_id, item_ref in zip(follower_ids, item_refs):
+        snapshot = existing.get(item_ref.path)
+        if _feed_copy_is_current(snapshot, feed_data):
+            continue
+        batch.set(item_ref, feed_data)
+        # Keep the follower's feed item counter in step
+        if snapshot is None or not snapshot.exists:
+            increment_feed_count(batch, follower_id, 1)
+        updated_followers.append(follower_id)
+
+    if updated_followers:
+        batch.commit()
+        # Push the item to any followers watching their feed live; this also
+        # patches their cached first page
+        publish_feed_event(updated_followers, {**live_item, "id": item_id})
+    return len(updated_followers)
+
+def _follower_ids(user_id):
+    """IDs of a user's followers, from the in-memory follow graph once it has
+    loaded and streamed from Firestore until then"""
+    follow_graph.start()
+    if follow_graph.is_loaded():
+        return follow_graph.followers(user_id)
+    followers = db.collection("follows").where("followee_id", "==", user_id).select(["follower_id"]).stream()
+    return (follower.get("follower_id") for follower in followers)
+
+def _followee_ids(user_id):
+    """IDs of the users a user follows, like _follower_ids"""
+    follow_graph.start()
+    if follow_graph.is_loaded():
+        return follow_graph.following(user_id)
+    follows = db.collection("follows").where("follower_id", "==", user_id).select(["followee_id"]).stream()
+    return [follow.get("followee_id") for follow in follows]
+
+def fan_out_feed_item(user_id, item_id, feed_data, live_item, is_new_item=True):
+    """Upsert a feed item into the feeds of all of a user's followers.
+
+    Items are keyed by item_id, so updating an item rewrites each follower's
+    copy in place, skipping followers whose copy is already current.
+    """
+    # Use batched writes for efficiency, committing as each chunk fills up
+    written = 0
+    chunk = []
+    for follower_id in _follower_ids(user_id):
+        chunk.append(follower_id)
+        if len(chunk) == FAN_OUT_CHUNK_SIZE:
+            written += _write_feed_chunk(chunk, item_id, feed_data, is_new_item, live_item)
+            chunk = []
+
+    if chunk:
+        written += _write_feed_chunk(chunk, item_id, feed_data, is_new_item, live_item)
+
+    # Trim any feeds this pushed over the cap
+    if written > 0:
+        schedule_compaction_sweep()
+    return written
+
+def update_feeds_with_rating(user_id, rating_id, rating_data, is_new_rating=True):
+    """Write this rating into the feeds of all followers.
+
+    Feed items are compact references keyed by rating ID, so an edited rating
+    updates each follower's copy in place rather than adding a duplicate, and
+    followers whose copy is already current are skipped. The rating body is
+    hydrated when the feed is read.
+    """
     try:
-        # Get all followers
-        followers = db.collection("follows").where("followee_id", "==", user_id).stream()
+        # Create a reference-only feed item
+        feed_data = compact_feed_item(rating_id, rating_data)
+        # Live clients and cached pages get the fully hydrated item
+        author = get_user_details([user_id]).get(user_id, {})
+        live_item = {**rating_data, "rating_id": rating_id, **author}
+
+        return fan_out_feed_item(user_id, rating_id, feed_data, live_item, is_new_rating)
 
-        # Create feed data with rating ID
-        feed_data = {**rating_data, "rating_id": rating_id}
-        
-        # Use batched writes for efficiency
-        batch = db.batch()
-        batch_count = 0
-        all_batches = []
-
-        for follower in followers:
-            follower_id = follower.to_dict()["follower_id"]
-            feed_ref = db.collection("feeds").document(follower_id).collection("items").document()
-            batch.set(feed_ref, feed_data)
-            batch_count += 1
-            # If we hit 500, commit the batch and start a new one
-            if batch_count == 500:
-                all_batches.append(batch)
-                batch = db.batch()
-                batch_count = 0
-
-        # Commit any remaining writes
-        if batch_count > 0:
-            all_batches.append(batch)
-        
-        # Commit all batches
-        for b in all_batches:
-            b.commit()
-            
     except Exception as e:
         logger.error(f"Error updating feeds: {e}")
         # Don't fail the main request if feed updates fail
         # Just log the error
+        return 0
+
+# Episode ratings by one user for one show share a feed item while each
+# rating comes within this long of the previous one
+EPISODE_COALESCE_WINDOW_MINUTES = 360
+# How long a burst of episode ratings is collected before it is fanned out,
+# so a binge costs one fan-out per delay rather than one per episode
+EPISODE_FLUSH_DELAY_SECONDS = 120
+# How long a flush holds its claim on an activity; if it hasn't finished the
+# fan-out by then (e.g. its worker died), a later flush retries it
+EPISODE_FLUSH_LEASE_SECONDS = 600
+
+_pending_episode_flushes = set()
+_pending_episode_flushes_lock = threading.Lock()
+
+def _episode_activity_ref(user_id, show_id):
+    return db.collection("episode_activity").document(f"{user_id}_{show_id}")
+
+@firestore.transactional
+def _record_episode_activity_txn(transaction, activity_ref, ratings):
+    snapshot = activity_ref.get(transaction=transaction)
+    activity = snapshot.to_dict() if snapshot.exists else None
+
+    # All the ratings are for one user and show and were made together
+    rating_data = ratings[0]
+    rated_at = rating_data["timestamp"]
+    window_cutoff = (datetime.fromisoformat(rated_at)
+                     - timedelta(minutes=EPISODE_COALESCE_WINDOW_MINUTES)).isoformat()
+
+    if activity is None or activity.get("last_rated_at", "") < window_cutoff:
+        # Start a new window, which gets its own feed item
+        started = datetime.fromisoformat(rated_at)
+        activity = {
+            "user_id": rating_data["user_id"],
+            "show_id": rating_data["show_id"],
+            "feed_item_id": f"episodes_{rating_data['user_id']}_{rating_data['show_id']}_{int(started.timestamp())}",
+            "window_started_at": rated_at,
+            "episodes": {},
+            "flushed": False
+        }
+
+    for episode_rating in ratings:
+        episode_key = f"s{episode_rating['season_number']}e{episode_rating['episode_number']}"
+        activity["episodes"][episode_key] = {
+            "season_number": episode_rating["season_number"],
+            "episode_number": episode_rating["episode_number"],
+            "rating": episode_rating["rating"]
+        }
+    activity["last_rated_at"] = rated_at
+    activity["pending"] = True
+    transaction.set(activity_ref, activity)
+
+def record_episode_activity(ratings):
+    """Fold episode ratings made together by one user for one show into their
+    coalesced activity for the show"""
+    try:
+        user_id, show_id = ratings[0]["user_id"], ratings[0]["show_id"]
+        _record_episode_activity_txn(db.transaction(), _episode_activity_ref(user_id, show_id), ratings)
+        _schedule_episode_flush(user_id, show_id)
+    except Exception as e:
+        logger.error(f"Error recording episode activity: {e}")
+        # Don't fail the main request if feed updates fail
+
+def _schedule_episode_flush(user_id, show_id, delay=EPISODE_FLUSH_DELAY_SECONDS):
+    key = (user_id, show_id)
+    with _pending_episode_flushes_lock:
+        if key in _pending_episode_flushes:
+            return
+        _pending_episode_flushes.add(key)
+
+    timer = threading.Timer(delay, run_in_background, args=(flush_episode_activity, user_id, show_id))
+    timer.daemon = True
+    timer.start()
+
+@firestore.transactional
+def _claim_episode_activity_txn(transaction, activity_ref, now):
+    """Take a lease on pending activity, unless another flush holds one.
+    Returns the claimed activity or None."""
+    snapshot = activity_ref.get(transaction=transaction)
+    activity = snapshot.to_dict() if snapshot.exists else None
+    if not activity or not activity.get("pending"):
+        return None
+    lease_cutoff = (now - timedelta(seconds=EPISODE_FLUSH_LEASE_SECONDS)).isoformat()
+    if (activity.get("claimed_at") or "") > lease_cutoff:
+        return None
+    activity["claimed_at"] = now.isoformat()
+    transaction.update(activity_ref, {"claimed_at": activity["claimed_at"]})
+    return activity
+
+@firestore.transactional
+def _complete_episode_activity_txn(transaction, activity_ref, claimed):
+    """Mark claimed activity flushed once its fan-out has gone through"""
+    snapshot = activity_ref.get(transaction=transaction)
+    activity = snapshot.to_dict() if snapshot.exists else None
+    if not activity or activity.get("claimed_at") != claimed["claimed_at"]:
+        # The lease ran out, or a new window replaced the activity
+        return
+    # Ratings that landed during the fan-out keep it pending for a flush of their own
+    unchanged = activity.get("episodes") == claimed["episodes"] \
+        and activity.get("last_rated_at") == claimed["last_rated_at"]
+    transaction.update(activity_ref, {"pending": not unchanged, "flushed": True, "claimed_at": None})
+
+def flush_episode_activity(user_id, show_id):
+    """Fan out the coalesced feed item for a user's recent episode ratings of a show"""
+    with _pending_episode_flushes_lock:
+        _pending_episode_flushes.discard((user_id, show_id))
+
+    activity_ref = _episode_activity_ref(user_id, show_id)
+    activity = _claim_episode_activity_txn(db.transaction(), activity_ref, datetime.now(timezone.utc))
+    if activity is None:
+        return 0
+
+    episodes = sorted(activity["episodes"].values(),
+                      key=lambda episode: (episode["season_number"], episode["episode_number"]))
+    feed_data = {
+        "kind": "episode_ratings",
+        "user_id": user_id,
+        "show_id": show_id,
+        "timestamp": activity["last_rated_at"],
+        "episode_count": len(episodes),
+        "episodes": episodes
+    }
+    author = get_user_details([user_id]).get(user_id, {})
+    # A failed fan-out leaves the activity pending, so it is retried once the lease runs out
+    written = fan_out_feed_item(user_id, activity["feed_item_id"], feed_data, {**feed_data, **author},
+                                is_new_item=not activity.get("flushed"))
+    _complete_episode_activity_txn(db.transaction(), activity_ref, activity)
+    return written
+
+def flush_pending_episode_activity():
+    """Fan out episode activity whose scheduled flush was lost, e.g. to a
+    restart, or whose fan-out failed"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=EPISODE_FLUSH_DELAY_SECONDS)).isoformat()
+    pending = db.collection("episode_activity").where("pending", "==", True).stream()
+    for activity in pending:
+        data = activity.to_dict()
+        if data.get("last_rated_at", "") <= cutoff:
+            run_in_background(flush_episode_activity, data["user_id"], data["show_id"])
+
+# Bulk rating import
+
+# Imports with more rows than this run in the background and report progress
+RATING_IMPORT_SYNC_MAX_ROWS = 200
+# Largest import accepted in one request
+RATING_IMPORT_MAX_ROWS = 5000
+# Ratings written per transaction. Each costs up to six writes: the rating, its show
+# aggregate, the hour and day buckets of its original time and, for a
+# re-rating, the two buckets it moves out of. Each chunk adds the user's stats.
+RATING_IMPORT_CHUNK_SIZE = 80
+# Top-rated shows listed on the import's feed item
+RATING_IMPORT_FEED_SAMPLE = 5
+
+class ImportRatingRow(AddRatingRequest):
+    # When the rating was originally made; rows without one are imported as
+    # history, which popular and trending shows don't count
+    timestamp: Optional[PastDatetime] = None
+
+_rating_rows_adapter = TypeAdapter(List[ImportRatingRow])
+
+def _import_timestamp(timestamp):
+    """An import row's original time as a UTC ISO string, or None"""
+    if timestamp is None:
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).isoformat()
+
+def _read_rating_import_rows():
+    """Read the rows of an import from a CSV (upload or body) or a JSON list.
+
+    Returns (rows, error message).
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        try:
+            text = upload.read().decode("utf-8-sig")
+        except UnicodeDecodeError as e:
+            return None, f"Could not read import: file is not UTF-8 ({e})"
+        if (upload.filename or "").lower().endswith(".json"):
+            try:
+                body = json.loads(text)
+            except json.JSONDecodeError as e:
+                return None, f"Could not read import: invalid JSON ({e})"
+            return _rating_import_list(body)
+        return list(csv.DictReader(io.StringIO(text))), None
+
+    if request.mimetype == "text/csv":
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True)))), None
+
+    return _rating_import_list(request.get_json(silent=True))
+
+def _rating_import_list(body):
+    """The ratings of a JSON import, given as a list or as {"ratings": [...]}"""
+    if isinstance(body, dict):
+        body = body.get("ratings")
+    if not isinstance(body, list):
+        return None, "Expected a CSV file or a JSON list of ratings"
+    return body, None
+
+@firestore.transactional
+def _import_ratings_txn(transaction, user_id, chunk, timestamp, facets):
+    """Write one chunk of imported ratings and their aggregate changes.
+
+    The previous ratings and the shards taking the trending updates are read
+    in the transaction, so a rating made while the import runs isn't lost.
+    Ratings are stored with the facets they count under, from facets where
+    known. Returns (written ratings, facet counter changes).
+    """
+    rating_refs = [keyed_doc_ref("ratings", rating_doc_id(user_id, rating.show_id),
+                                 {"user_id": user_id, "show_id": rating.show_id}, transaction)
+                   for rating in chunk]
+    previous = {doc.id: doc.to_dict() for doc in db.get_all(rating_refs, transaction=transaction) if doc.exists}
+    trending_shards = read_trending_shards([rating.show_id for rating in chunk], transaction)
+
+    written = []
+    bucket_changes = []
+    facet_changes = []
+    for rating_ref, rating in zip(rating_refs, chunk):
+        rating_data = rating.model_dump()
+        # Ratings count toward popularity and trending at their original
+        # time, or not at all, so an import never looks like a burst of
+        # ratings made now
+        rating_data["counted_at"] = _import_timestamp(rating.timestamp)
+        rating_data["timestamp"] = rating_data["counted_at"] or timestamp
+        rating_data["has_comment"] = bool(rating_data.get("comment"))
+        rating_data["facets"] = facets.get(rating.show_id, []) if rating_data["counted_at"] else []
+        transaction.set(rating_ref, rating_data, merge=True)
+        previous_data = previous.get(rating_ref.id, {})
+        previous_counted_at = rating_counted_at(previous_data)
+        apply_show_rating_delta(transaction, rating.show_id, previous_data.get("rating"), rating.rating,
+                                rating_data["timestamp"], previous_counted_at,
+                                counted=rating_data["counted_at"] is not None,
+                                trending_shard=trending_shards[rating.show_id])
+        if previous_counted_at or rating_data["counted_at"]:
+            bucket_changes.append((rating.show_id, previous_counted_at, rating_data["counted_at"]))
+            facet_changes += _facet_changes(rating.show_id, previous_data, rating_data["counted_at"],
+                                            rating_data["facets"], facets.get(rating.show_id, []))
+        written.append((rating_ref.id, rating_data))
+    apply_user_rating_deltas(transaction, user_id,
+                             [(previous.get(rating_ref.id, {}).get("rating"), rating.rating)
+                              for rating_ref, rating in zip(rating_refs, chunk)])
+    apply_popular_bucket_deltas(transaction, bucket_changes)
+    return written, facet_changes
+
+def import_ratings(user_id, ratings, import_id, chunk_size=RATING_IMPORT_CHUNK_SIZE):
+    """Write validated ratings for a user in transactions and announce them with one feed item.
+
+    Ratings are keyed by user and show, so re-running an import that failed
+    partway through doesn't double count anything.
+    """
+    job_id = f"rating_import_{import_id}"
+    timestamp = datetime.now(timezone.utc).isoformat()
+
+    imported = 0
+    for start in range(0, len(ratings), chunk_size):
+        chunk = ratings[start:start + chunk_size]
+        facets = _show_facets([rating.show_id for rating in chunk])
+        written, facet_changes = _import_ratings_txn(db.transaction(), user_id, chunk, timestamp, facets)
+
+        # Genre and language counters go in their own batches to keep each
+        # chunk's transaction under the write limit
+        _apply_facet_deltas(facet_changes)
+        unknown = [(rating_id, rating_data["show_id"], rating_data["counted_at"])
+                   for rating_id, rating_data in written
+                   if rating_data["counted_at"] and rating_data["show_id"] not in facets]
+        if unknown:
+            run_in_background(_index_rating_facets, unknown)
+
+        # Imports can overwrite existing ratings other workers have cached
+        publish_ratings_changed([rating_id for rating_id, _ in written])
+        for rating_id, rating_data in written:
+            rating_cache.put(rating_id, rating_data)
+        imported += len(chunk)
+        save_checkpoint(job_id, imported=imported)
+
+    # Followers get one item for the whole import instead of one per rating
+    top_rated = sorted(ratings, key=lambda rating: rating.rating, reverse=True)[:RATING_IMPORT_FEED_SAMPLE]
+    feed_data = {
+        "kind": "rating_import",
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "rating_count": imported,
+        "ratings": [{"show_id": rating.show_id, "rating": rating.rating} for rating in top_rated]
+    }
+    author = get_user_details([user_id]).get(user_id, {})
+    fan_out_feed_item(user_id, job_id, feed_data, {**feed_data, **author})
+    return imported
+
+def _run_rating_import(user_id, ratings, import_id):
+    job_id = f"rating_import_{import_id}"
+    try:
+        imported = import_ratings(user_id, ratings, import_id)
+    except Exception:
+        save_checkpoint(job_id, status="failed")
+        raise
+    save_checkpoint(job_id, status="done", imported=imported,
+                    finished_at=datetime.now(timezone.utc).isoformat())
+    return imported
+
+@teli.route("/users/<user_id>/ratings/import", methods=["POST"])
+def import_user_ratings(user_id):
+    """Import many ratings at once, e.g. from another tracker"""
+    try:
+        rows, error = _read_rating_import_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({"error": f"Could not read import: {e}"}), 400
+    if error:
+        return jsonify({"error": error}), 400
+    if not rows:
+        return jsonify({"error": "No ratings to import"}), 400
+    if len(rows) > RATING_IMPORT_MAX_ROWS:
+        return jsonify({"error": f"Imports are limited to {RATING_IMPORT_MAX_ROWS} ratings"}), 400
+
+    # Validate every row in one pass; the user comes from the URL and empty
+    # CSV cells count as missing
+    rows = [
+        {**{key: (value if value != "" else None) for key, value in row.items()}, "user_id": user_id}
+        if isinstance(row, dict) else row
+        for row in rows
+    ]
+    try:
+        ratings = _rating_rows_adapter.validate_python(rows)
+    except ValidationError as e:
+        return jsonify({"errors": e.errors(include_url=False, include_context=False)}), 400
+
+    # Check if user exists
+    user_ref = db.collection("users").document(user_id).get()
+    if not user_ref.exists:
+        return jsonify({"error": "User not found"}), 404
+
+    # A show listed twice keeps its last row
+    ratings = list({rating.show_id: rating for rating in ratings}.values())
+
+    import_id = uuid.uuid4().hex
+    try:
+        save_checkpoint(f"rating_import_{import_id}", type="rating_import", status="running",
+                        user_id=user_id, total=len(ratings), imported=0)
+
+        if len(ratings) > RATING_IMPORT_SYNC_MAX_ROWS:
+            run_in_background(_run_rating_import, user_id, ratings, import_id)
+            return jsonify({
+                "message": "Import started",
+                "import_id": import_id,
+                "total": len(ratings)
+            }), 202
+
+        imported = _run_rating_import(user_id, ratings, import_id)
+        return jsonify({
+            "message": "Ratings imported successfully",
+            "import_id": import_id,
+            "imported": imported
+        }), 201
+    except Exception as e:
+        logger.error(f"Error importing ratings: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@teli.route("/users/<user_id>/ratings/import/<import_id>", methods=["GET"])
+def get_rating_import(user_id, import_id):
+    """Progress of a rating import"""
+    try:
+        checkpoint = load_checkpoint(f"rating_import_{import_id}")
+        if checkpoint is None or checkpoint.get("user_id") != user_id:
+            return jsonify({"error": "Import not found"}), 404
+
+        return jsonify({
+            "import_id": import_id,
+            "status": checkpoint.get("status"),
+            "total": checkpoint.get("total"),
+            "imported": checkpoint.get("imported", 0),
+            "updated_at": checkpoint.get("updated_at")
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting rating import: {e}")
+        return jsonify({"error": str(e)}), 500
 
 @teli.route("/users/<user_id>/ratings", methods=["GET"])
 def get_user_ratings(user_id):
@@ -291,6 +968,25 @@ def get_user_ratings(user_id):
         logger.error(f"Error getting user ratings: {e}")
         return jsonify({"error": str(e)}), 500
 
+@teli.route("/users/<user_id>/stats", methods=["GET"])
+def get_user_stats(user_id):
+    """Rating count, average, histogram and episode rating count for a user,
+    from their stats document"""
+    try:
+        stats_doc = user_rating_stats_ref(user_id).get()
+        if not stats_doc.exists:
+            # Users who haven't rated anything have no stats document yet
+            user_ref = db.collection("users").document(user_id).get()
+            if not user_ref.exists:
+                return jsonify({"error": "User not found"}), 404
+
+        stats = summarize_user_rating_stats(stats_doc.to_dict() if stats_doc.exists else None)
+        stats["user_id"] = user_id
+        return jsonify(stats), 200
+    except Exception as e:
+        logger.error(f"Error getting user stats: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @teli.route("/users/<user_id>/shows/<show_id>/season/<season_number>/ratings", methods=["GET"])
 def get_episode_ratings(user_id, show_id, season_number):
     try:
@@ -316,19 +1012,16 @@ def get_episode_ratings(user_id, show_id, season_number):
                 return jsonify({"error": "Episode number must be an integer"}), 400
                 
             # Get rating for a specific episode
-            query = db.collection("episode_ratings").where(
-                filter=FieldFilter("user_id", "==", user_id)).where(
-                    filter=FieldFilter("show_id", "==", show_id)).where(
-                        filter=FieldFilter("season_number", "==", season_num)).where(
-                            filter=FieldFilter("episode_number", "==", episode_number)).limit(1)
-                            
-            docs = list(query.stream())
+            rating_doc = keyed_doc_ref(
+                "episode_ratings", episode_rating_doc_id(user_id, show_id, season_num, episode_number),
+                {"user_id": user_id, "show_id": show_id, "season_number": season_num,
+                 "episode_number": episode_number}).get()
             
-            if not docs:
+            if not rating_doc.exists:
                 return jsonify({"error": "Episode rating not found"}), 404
                 
-            rating_data = docs[0].to_dict()
-            rating_data["id"] = docs[0].id
+            rating_data = rating_doc.to_dict()
+            rating_data["id"] = rating_doc.id
             
             return jsonify(rating_data), 200
             
@@ -353,11 +1046,93 @@ def get_episode_ratings(user_id, show_id, season_number):
         logger.error(f"Error getting episode ratings: {e}")
         return jsonify({"error": str(e)}), 500
 
+@teli.route("/users/<user_id>/shows/<show_id>/episode_heatmap", methods=["GET"])
+def get_episode_heatmap(user_id, show_id):
+    """A user's episode ratings and the average rating of every episode of a show.
+
+    Both come from per-season documents, so this costs one read per season
+    rather than one per episode.
+    """
+    try:
+        # Check if user exists
+        user_ref = db.collection("users").document(user_id).get()
+        if not user_ref.exists:
+            return jsonify({"error": "User not found"}), 404
+
+        season_stats = db.collection(EPISODE_RATING_STATS_COLLECTION).where(
+            filter=FieldFilter("show_id", "==", show_id)).stream()
+        user_seasons = db.collection(USER_SEASON_RATINGS_COLLECTION).where(
+            filter=FieldFilter("user_id", "==", user_id)).where(
+                filter=FieldFilter("show_id", "==", show_id)).stream()
+
+        seasons = summarize_episode_heatmap(
+            [doc.to_dict() for doc in season_stats],
+            [doc.to_dict() for doc in user_seasons]
+        )
+        return jsonify({"user_id": user_id, "show_id": show_id, "seasons": seasons}), 200
+    except Exception as e:
+        logger.error(f"Error getting episode heatmap: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Sort orders for a show's ratings; each has a matching composite index in
+# firestore.indexes.json
+SHOW_RATING_SORTS = {
+    "newest": [("timestamp", firestore.Query.DESCENDING)],
+    "highest": [("rating", firestore.Query.DESCENDING), ("timestamp", firestore.Query.DESCENDING)],
+    "lowest": [("rating", firestore.Query.ASCENDING), ("timestamp", firestore.Query.DESCENDING)],
+    "with_comment_first": [("has_comment", firestore.Query.DESCENDING), ("timestamp", firestore.Query.DESCENDING)],
+}
+SHOW_RATINGS_PAGE_SIZE = 50
+SHOW_RATINGS_MAX_PAGE_SIZE = 100
+
 @teli.route("/shows/<show_id>/ratings", methods=["GET"])
 def get_show_ratings(show_id):
+    """Ratings for a show, a page at a time or streamed as NDJSON.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
     try:
-        ratings_ref = db.collection("ratings").where("show_id", "==", show_id)
-        docs = ratings_ref.stream()
+        sort = request.args.get("sort", "newest")
+        if sort not in SHOW_RATING_SORTS:
+            return jsonify({"error": f"sort must be one of: {', '.join(SHOW_RATING_SORTS)}"}), 400
+
+        try:
+            limit = int(request.args.get("limit", SHOW_RATINGS_PAGE_SIZE))
+            if limit < 1:
+                limit = SHOW_RATINGS_PAGE_SIZE
+            elif limit > SHOW_RATINGS_MAX_PAGE_SIZE:
+                limit = SHOW_RATINGS_MAX_PAGE_SIZE
+        except ValueError:
+            return jsonify({"error": "limit parameter must be a valid integer"}), 400
+
+        output_format = request.args.get("format", "json")
+        if output_format not in ("json", "ndjson"):
+            return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+
+        query = db.collection("ratings").where("show_id", "==", show_id)
+        for field, direction in SHOW_RATING_SORTS[sort]:
+            query = query.order_by(field, direction=direction)
+
+        # The cursor is the ID of the last rating on the previous page
+        cursor = request.args.get("cursor")
+        if cursor:
+            cursor_doc = db.collection("ratings").document(cursor).get()
+            if not cursor_doc.exists or cursor_doc.get("show_id") != show_id:
+                return jsonify({"error": "Invalid cursor"}), 400
+            query = query.start_after(cursor_doc)
+
+        if output_format == "ndjson":
+            # Bulk consumers get every rating, written out as Firestore yields
+            # them rather than collected into one response
+            def generate():
+                for doc in query.stream():
+                    rating_data = doc.to_dict()
+                    rating_data["id"] = doc.id
+                    yield json.dumps(rating_data, default=str) + "\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        docs = list(query.limit(limit).stream())
 
         ratings_list = []
         for doc in docs:
@@ -365,19 +1140,57 @@ def get_show_ratings(show_id):
             rating_data["id"] = doc.id
             ratings_list.append(rating_data)
 
-        return jsonify(ratings_list), 200
+        response = jsonify(ratings_list)
+        if len(docs) == limit:
+            response.headers["X-Next-Cursor"] = docs[-1].id
+        return response, 200
     except Exception as e:
         logger.error(f"Error getting show ratings: {e}")
         return jsonify({"error": str(e)}), 500
 
+@teli.route("/shows/<show_id>/ratings/summary", methods=["GET"])
+def get_show_ratings_summary(show_id):
+    """Rating count, average and histogram for a show, from its sharded aggregate"""
+    try:
+        summary = summarize_rating_stats(get_show_rating_stats(show_id))
+        summary["show_id"] = show_id
+        return jsonify(summary), 200
+    except Exception as e:
+        logger.error(f"Error getting show ratings summary: {e}")
+        return jsonify({"error": str(e)}), 500
+
     
 class FollowRequest(BaseModel):
     follower_id: str
     followee_id: str
 
-class FollowRequest(BaseModel):
-    follower_id: str
-    followee_id: str
+@firestore.transactional
+def _follow_txn(transaction, follower_id, followee_id):
+    """Create a follow and count it for both users atomically.
+    Returns False if the follow already existed."""
+    follow_ref = keyed_doc_ref("follows", follow_doc_id(follower_id, followee_id),
+                               {"follower_id": follower_id, "followee_id": followee_id}, transaction)
+    if follow_ref.get(transaction=transaction).exists:
+        return False
+    transaction.set(follow_ref, {
+        "follower_id": follower_id,
+        "followee_id": followee_id,
+        "followed_at": datetime.now(timezone.utc).isoformat()
+    })
+    apply_follow_count_deltas(transaction, follower_id, followee_id, 1)
+    return True
+
+@firestore.transactional
+def _unfollow_txn(transaction, follower_id, followee_id):
+    """Delete a follow and uncount it for both users atomically.
+    Returns False if there was no follow to delete."""
+    follow_ref = keyed_doc_ref("follows", follow_doc_id(follower_id, followee_id),
+                               {"follower_id": follower_id, "followee_id": followee_id}, transaction)
+    if not follow_ref.get(transaction=transaction).exists:
+        return False
+    transaction.delete(follow_ref)
+    apply_follow_count_deltas(transaction, follower_id, followee_id, -1)
+    return True
 
 @teli.route("/follow", methods=["POST"])
 def follow_user():
@@ -404,53 +1217,80 @@ def follow_user():
         return jsonify({"error": "Cannot follow yourself"}), 400
 
     try:
-        # Check if already following
-        follow_ref = db.collection("follows") \
-            .where("follower_id", "==", follower_id) \
-            .where("followee_id", "==", followee_id) \
-            .limit(1) \
-            .get()
-
-        if len(follow_ref) > 0:
+        # The follow is keyed by both users, so concurrent requests can't
+        # create it (or count it) twice
+        if not _follow_txn(db.transaction(), follower_id, followee_id):
             return jsonify({"message": "Already following"}), 200
-
-        # Create new follow relationship
-        db.collection("follows").add({
-            "follower_id": follower_id,
-            "followee_id": followee_id,
-            "followed_at": datetime.now(timezone.utc).isoformat()
-        })
+        # The graph's listener will see the follow too, but this process
+        # shouldn't have to wait for it
+        follow_graph.add(follower_id, followee_id)
         
-        # Populate feed with followee's recent ratings
-        populate_feed_from_follow(follower_id, followee_id)
+        # Populate feed with followee's recent ratings without blocking the request
+        run_in_background(populate_feed_from_follow, follower_id, followee_id)
         
         return jsonify({"message": f"{follower_id} now follows {followee_id}"}), 200
     except Exception as e:
         logger.error(f"Error following user: {e}")
         return jsonify({"error": str(e)}), 500
 
-def populate_feed_from_follow(follower_id, followee_id):
-    """When a user follows someone, add that user's recent ratings to their feed"""
+# Number of the followee's most recent ratings copied into a new follower's feed
+FEED_BACKFILL_DEPTH = 20
+# Ratings read and written per backfill batch
+FEED_BACKFILL_CHUNK_SIZE = 100
+
+def populate_feed_from_follow(follower_id, followee_id, depth=FEED_BACKFILL_DEPTH,
+                              chunk_size=FEED_BACKFILL_CHUNK_SIZE):
+    """When a user follows someone, add that user's recent ratings to their feed.
+
+    Feed items are keyed by rating ID, so re-following overwrites the existing
+    copies instead of duplicating them. Ratings are paged in chunks so a deep
+    backfill only ever holds one chunk in memory.
+    """
     try:
         # Get recent ratings from the followee
-        ratings = db.collection("ratings") \
+        ratings_query = db.collection("ratings") \
             .where("user_id", "==", followee_id) \
-            .order_by("timestamp", direction=firestore.Query.DESCENDING) \
-            .limit(20) \
-            .stream()
-            
-        batch = db.batch()
-        for rating in ratings:
-            rating_data = rating.to_dict()
-            rating_data["rating_id"] = rating.id
-            
-            feed_ref = db.collection("feeds").document(follower_id).collection("items").document()
-            batch.set(feed_ref, rating_data)
-            
-        batch.commit()
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+        items_ref = db.collection("feeds").document(follower_id).collection("items")
+
+        copied = 0
+        last_rating = None
+        while copied < depth:
+            page_size = min(chunk_size, depth - copied)
+            page = ratings_query.limit(page_size)
+            if last_rating is not None:
+                page = page.start_after(last_rating)
+
+            ratings = list(page.stream())
+            if not ratings:
+                break
+
+            batch = db.batch()
+            for rating in ratings:
+                rating_data = rating.to_dict()
+                rating_cache.put(rating.id, rating_data)
+                batch.set(items_ref.document(rating.id), compact_feed_item(rating.id, rating_data))
+
+            # Overwritten items get counted again here; compaction recounts
+            # exactly, so the drift is harmless
+            increment_feed_count(batch, follower_id, len(ratings))
+            batch.commit()
+
+            copied += len(ratings)
+            last_rating = ratings[-1]
+            if len(ratings) < page_size:
+                break
+
+        if copied > 0:
+            schedule_compaction_sweep()
+            # Older items were added below the top of the feed, so cached
+            # pages and live clients need to reload rather than be patched
+            publish_feed_event([follower_id], {}, FEED_RESET)
+        return copied
     except Exception as e:
         logger.error(f"Error populating feed from follow: {e}")
         # Don't fail the main request if feed updates fail
+        return 0
 
 @teli.route("/unfollow", methods=["POST"])
 def unfollow_user():
@@ -463,21 +1303,12 @@ def unfollow_user():
     followee_id = req_data.followee_id
 
     try:
-        follows = db.collection("follows") \
-            .where("follower_id", "==", follower_id) \
-            .where("followee_id", "==", followee_id) \
-            .stream()
-
-        deleted = False
-        for doc in follows:
-            doc.reference.delete()
-            deleted = True
+        if _unfollow_txn(db.transaction(), follower_id, followee_id):
+            follow_graph.remove(follower_id, followee_id)
+            # Remove followee's items from follower's feed in the background,
+            # since it could be expensive if there are many items
+            schedule_feed_cleanup(follower_id, followee_id)
 
-        if deleted:
-            # Optional: Remove followee's items from follower's feed
-            # This could be expensive if there are many items, so it's often skipped
-            # clean_feed_after_unfollow(follower_id, followee_id)
-            
             return jsonify({"message": "Unfollowed successfully"}), 200
         else:
             return jsonify({"message": "No follow relationship found"}), 404
@@ -485,6 +1316,19 @@ def unfollow_user():
         logger.error(f"Error unfollowing user: {e}")
         return jsonify({"error": str(e)}), 500
 
+@teli.route("/users/<user_id>/follow_counts", methods=["GET"])
+def get_user_follow_counts(user_id):
+    """How many users follow a user and how many they follow, read from counters"""
+    try:
+        user_ref = db.collection("users").document(user_id).get()
+        if not user_ref.exists:
+            return jsonify({"error": "User not found"}), 404
+
+        return jsonify({"user_id": user_id, **get_follow_counts(user_id)}), 200
+    except Exception as e:
+        logger.error(f"Error getting follow counts: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @teli.route("/users/<user_id>/following", methods=["GET"])
 def get_following(user_id):
     try:
@@ -493,14 +1337,7 @@ def get_following(user_id):
         if not user_ref.exists:
             return jsonify({"error": "User not found"}), 404
             
-        follows = db.collection("follows").where("follower_id", "==", user_id).stream()
-        following = []
-        
-        for doc in follows:
-            followee_id = doc.to_dict()["followee_id"]
-            following.append(followee_id)
-            
-        return jsonify({"following": following}), 200
+        return jsonify({"following": _followee_ids(user_id)}), 200
     except Exception as e:
         logger.error(f"Error getting following list: {e}")
         return jsonify({"error": str(e)}), 500
@@ -513,14 +1350,7 @@ def get_followers(user_id):
         if not user_ref.exists:
             return jsonify({"error": "User not found"}), 404
             
-        followers = db.collection("follows").where("followee_id", "==", user_id).stream()
-        follower_list = []
-        
-        for doc in followers:
-            follower_id = doc.to_dict()["follower_id"]
-            follower_list.append(follower_id)
-            
-        return jsonify({"followers": follower_list}), 200
+        return jsonify({"followers": list(_follower_ids(user_id))}), 200
     except Exception as e:
         logger.error(f"Error getting followers list: {e}")
         return jsonify({"error": str(e)}), 500
@@ -528,16 +1358,26 @@ def get_followers(user_id):
 @teli.route("/users/<user_id>/feed", methods=["GET"])
 def get_feed(user_id):
     try:
+        # Optional start_after param for pagination
+        start_after_str = request.args.get("start_after")
+
+        # The first page is served from cache when we have it; a cached page
+        # means the user already exists
+        if not start_after_str:
+            cached_feed = feed_page_cache.get(user_id)
+            if cached_feed is not None:
+                return jsonify({"feed": cached_feed}), 200
+            # Taken before reading so a change made meanwhile keeps this page out of the cache
+            generation = feed_page_cache.generation(user_id)
+
         # Check if user exists
         user_ref = db.collection("users").document(user_id).get()
         if not user_ref.exists:
             return jsonify({"error": "User not found"}), 404
             
-        # Optional start_after param for pagination
-        start_after_str = request.args.get("start_after")
         query = db.collection("feeds").document(user_id).collection("items") \
                   .order_by("timestamp", direction=firestore.Query.DESCENDING) \
-                  .limit(50)
+                  .limit(FEED_PAGE_SIZE)
 
         if start_after_str:
             try:
@@ -550,20 +1390,27 @@ def get_feed(user_id):
         docs = list(query.stream())
         feed = []
         
-        # Include user details in feed
-        for doc in docs:
-            item = doc.to_dict()
-            item["id"] = doc.id
-            
-            # Get user info if available
-            if "user_id" in item:
-                user_doc = db.collection("users").document(item["user_id"]).get()
-                if user_doc.exists:
-                    user_data = user_doc.to_dict()
-                    item["user_name"] = user_data.get("name", "")
-                    item["user_username"] = user_data.get("username", "")
-            
-            feed.append(item)
+        # Hydrate rating bodies and user details, one batched read each at most
+        items = [{**doc.to_dict(), "id": doc.id} for doc in docs]
+        ratings = rating_cache.get_many(
+            [item["rating_id"] for item in items if item.get("rating_id")])
+        user_details = get_user_details(
+            [item["user_id"] for item in items if item.get("user_id")])
+        for item in items:
+            rating_id = item.get("rating_id")
+            if rating_id:
+                if rating_id in ratings:
+                    # The rating is the source of truth, also over whatever
+                    # an old full copy of it on the item still says
+                    item = {**item, **ratings[rating_id]}
+                elif "rating" not in item:
+                    # The rating was deleted and this compact item has nothing to show
+                    continue
+            item.update(user_details.get(item.get("user_id"), {}))
+            feed.append(feed_response_item(item))
+
+        if not start_after_str:
+            feed_page_cache.put(user_id, feed, generation)
             
         return jsonify({"feed": feed}), 200
     
@@ -571,6 +1418,48 @@ def get_feed(user_id):
         logger.error(f"Error getting feed: {e}")
         return jsonify({"error": str(e)}), 500
 
+@teli.route("/users/<user_id>/feed/stream", methods=["GET"])
+def stream_feed(user_id):
+    """Server-Sent Events stream of new feed items as they are fanned out"""
+    try:
+        # Check if user exists
+        user_ref = db.collection("users").document(user_id).get()
+        if not user_ref.exists:
+            return jsonify({"error": "User not found"}), 404
+    except Exception as e:
+        logger.error(f"Error opening feed stream: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    broker.start()
+    subscription = feed_bus.subscribe(user_id)
+
+    def generate():
+        try:
+            yield ": connected\n\n"
+            while True:
+                if subscription.dropped:
+                    # We fell too far behind; the client should reconnect and
+                    # catch up from /feed
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+
+                message = subscription.get(timeout=HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                kind, event = message
+                if kind == FEED_ITEM:
+                    event = feed_response_item(event)
+                yield f"event: {kind}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            feed_bus.unsubscribe(subscription)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @teli.errorhandler(404)
 def not_found(e):
     return jsonify({"error": "Not found"}), 404
@@ -616,22 +1505,16 @@ def update_watch_status():
     watch_status_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
     try:
-        # Check if a watch status for this user and show already exists
-        status_query = db.collection("watch_status").where(
-            filter=FieldFilter("user_id", "==", req_data.user_id)).where(
-                filter=FieldFilter("show_id", "==", req_data.show_id)).limit(1).get()
-        
-        if len(status_query) > 0:
+        status_ref = keyed_doc_ref("watch_status", watch_status_doc_id(req_data.user_id, req_data.show_id),
+                                   {"user_id": req_data.user_id, "show_id": req_data.show_id})
+        try:
+            # Try to create the status; this fails if it already exists
+            status_ref.create(watch_status_data)
+            return jsonify({"message": "Watch status added successfully", "id": status_ref.id}), 201
+        except AlreadyExists:
             # If status exists, update it
-            existing_status = status_query[0]
-            existing_status.reference.update(watch_status_data)
-            status_id = existing_status.id
-            return jsonify({"message": "Watch status updated successfully", "id": status_id}), 200
-        else:
-            # If status does not exist, create a new one
-            status_ref = db.collection("watch_status").add(watch_status_data)
-            status_id = status_ref[1].id
-            return jsonify({"message": "Watch status added successfully", "id": status_id}), 201
+            status_ref.set(watch_status_data, merge=True)
+            return jsonify({"message": "Watch status updated successfully", "id": status_ref.id}), 200
     
     except Exception as e:
         logger.error(f"Error updating watch status: {e}")
@@ -697,18 +1580,17 @@ def get_watch_status(user_id, show_id):
         if not user_ref.exists:
             return jsonify({"error": "User not found"}), 404
             
-        # Query for the watch status
-        status_query = db.collection("watch_status").where(
-            filter=FieldFilter("user_id", "==", user_id)).where(
-                filter=FieldFilter("show_id", "==", show_id)).limit(1).get()
+        # Get the watch status
+        status_doc = keyed_doc_ref("watch_status", watch_status_doc_id(user_id, show_id),
+                                   {"user_id": user_id, "show_id": show_id}).get()
         
         # Check if status exists
-        if len(status_query) == 0:
+        if not status_doc.exists:
             return jsonify({"error": "No watch status found for this show"}), 404
         
         # Return the status
-        status_data = status_query[0].to_dict()
-        status_data["id"] = status_query[0].id
+        status_data = status_doc.to_dict()
+        status_data["id"] = status_doc.id
         
         return jsonify(status_data), 200
     
@@ -716,6 +1598,137 @@ def get_watch_status(user_id, show_id):
         logger.error(f"Error retrieving watch status: {e}")
         return jsonify({"error": "Database error occurred"}), 500
 
+# Timeframes whose popular lists are precomputed by the scheduler
+POPULAR_SNAPSHOT_TIMEFRAMES = (1, 7, 30)
+# Shows kept per snapshot, enough for the largest num_most_popular
+POPULAR_SNAPSHOT_SIZE = 100
+# How often snapshots are recomputed
+POPULAR_SNAPSHOT_INTERVAL_SECONDS = 600
+# Snapshots older than this are ignored, e.g. if the scheduler has stopped
+POPULAR_SNAPSHOT_MAX_AGE_SECONDS = 3 * POPULAR_SNAPSHOT_INTERVAL_SECONDS
+POPULAR_SNAPSHOTS_COLLECTION = "popular_snapshots"
+# Snapshot of the sort=trending list, next to the per-timeframe ones
+TRENDING_SNAPSHOT_ID = "trending"
+# Orders get_popular_shows can rank by
+POPULAR_SORTS = ("count", "trending")
+
+def _fetch_show_details(show_ids, details_cache):
+    """Look up shows through the show details endpoint, filling details_cache.
+
+    Needs an app context. Shows that can't be fetched are cached as None.
+    """
+    for show_id in show_ids:
+        if show_id in details_cache:
+            continue
+        # Use the existing endpoint to get show details
+        try:
+            with current_app.test_client() as client:
+                response = client.get(f"/shows/{show_id}")
+                details_cache[show_id] = response.get_json() if response.status_code == 200 else None
+        except Exception as e:
+            logger.error(f"Error fetching show details for {show_id}: {e}")
+            # Continue with the next show if there's an error
+            details_cache[show_id] = None
+
+def compute_popular_shows(timeframe_days, num_most_popular, details_cache=None, genre=None, language=None):
+    """Rank shows by ratings made in the timeframe and fetch their details.
+
+    Needs an app context. details_cache lets several timeframes share show
+    lookups. A genre or language filter reads that facet's own counters; with
+    both, the genre's ranking is filtered by the cached language of each show.
+    Returns (popular shows, number of shows rated in the timeframe, which
+    stops at the sketch capacity).
+    """
+    # Calculate the date based on the timeframe
+    end_date = datetime.now(timezone.utc)
+    start_date = end_date - timedelta(days=timeframe_days)
+    
+    # Merge the sketches and counts of the hourly and daily buckets that
+    # cover the timeframe
+    if genre is not None:
+        facet = genre_facet(genre)
+    elif language is not None:
+        facet = language_facet(language)
+    else:
+        facet = None
+    summary = top_recent_shows(start_date, end_date, facet)
+    total_shows_found = len(summary)
+    if genre is not None and language is not None:
+        ranked = summary.top(len(summary))
+        metadata = show_metadata_cache.get_many([show_id for show_id, _ in ranked])
+        ranked = [(show_id, count) for show_id, count in ranked
+                  if metadata.get(show_id, {}).get("original_language") == language]
+        total_shows_found = len(ranked)
+        top_shows = ranked[:num_most_popular]
+    else:
+        top_shows = summary.top(num_most_popular)
+    
+    # Prepare result with show details
+    details_cache = details_cache if details_cache is not None else {}
+    _fetch_show_details([show_id for show_id, _ in top_shows], details_cache)
+    result = []
+    for show_id, count in top_shows:
+        if details_cache[show_id] is not None:
+            show_details = dict(details_cache[show_id])
+            # Add rating count for the specified timeframe
+            show_details["rating_count"] = count
+            # Add the timeframe to the response
+            show_details["timeframe_days"] = timeframe_days
+            result.append(show_details)
+
+    return result, total_shows_found
+
+def compute_trending_shows(num_most_popular, details_cache=None):
+    """Rank shows by decayed trending score from the in-memory trending board.
+
+    Needs an app context and a loaded board. Returns (trending shows, number
+    of shows ever rated).
+    """
+    top_shows = trending_leaderboard.top(num_most_popular)
+    details_cache = details_cache if details_cache is not None else {}
+    _fetch_show_details([show_id for show_id, _ in top_shows], details_cache)
+    result = []
+    for show_id, score in top_shows:
+        if details_cache[show_id] is not None:
+            show_details = dict(details_cache[show_id])
+            show_details["trending_score"] = score
+            result.append(show_details)
+    return result, len(trending_leaderboard)
+
+def refresh_popular_snapshots(app):
+    """Precompute the popular list for each common timeframe"""
+    details_cache = {}
+    with app.app_context():
+        for timeframe_days in POPULAR_SNAPSHOT_TIMEFRAMES:
+            popular_shows, total_shows_found = compute_popular_shows(
+                timeframe_days, POPULAR_SNAPSHOT_SIZE, details_cache)
+            db.collection(POPULAR_SNAPSHOTS_COLLECTION).document(str(timeframe_days)).set({
+                "timeframe_days": timeframe_days,
+                "popular_shows": popular_shows,
+                "total_shows_found": total_shows_found,
+                "computed_at": datetime.now(timezone.utc).isoformat()
+            })
+        leaderboard.start()
+        if trending_leaderboard.wait_until_loaded():
+            popular_shows, total_shows_found = compute_trending_shows(POPULAR_SNAPSHOT_SIZE, details_cache)
+            db.collection(POPULAR_SNAPSHOTS_COLLECTION).document(TRENDING_SNAPSHOT_ID).set({
+                "popular_shows": popular_shows,
+                "total_shows_found": total_shows_found,
+                "computed_at": datetime.now(timezone.utc).isoformat()
+            })
+    logger.info(f"Refreshed popular show snapshots for {len(details_cache)} shows")
+
+def _load_popular_snapshot(snapshot_id):
+    """The precomputed popular list for a timeframe (or trending), or None if there's no fresh one"""
+    snapshot = db.collection(POPULAR_SNAPSHOTS_COLLECTION).document(str(snapshot_id)).get()
+    if not snapshot.exists:
+        return None
+    snapshot_data = snapshot.to_dict()
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(snapshot_data["computed_at"])
+    if age > timedelta(seconds=POPULAR_SNAPSHOT_MAX_AGE_SECONDS):
+        return None
+    return snapshot_data
+
 @teli.route("/shows/popular", methods=["GET"])
 def get_popular_shows():
     try:
@@ -739,70 +1752,198 @@ def get_popular_shows():
                 num_most_popular = 100
         except ValueError:
             return jsonify({"error": "num_most_popular parameter must be a valid integer"}), 400
-        
-        # Calculate the date based on the timeframe
-        start_date = datetime.now(timezone.utc) - timedelta(days=timeframe_days)
-        start_date_str = start_date.isoformat()
-        
-        # Query ratings from the specified timeframe with a reasonable limit
-        ratings_ref = db.collection("ratings").where(
-            filter=FieldFilter("timestamp", ">=", start_date_str)).limit(10000)
-        
-        # Get ratings from the specified timeframe
-        ratings = list(ratings_ref.stream())
-        
-        # Count ratings per show
-        show_rating_counts = {}
-        
-        for rating in ratings:
-            rating_data = rating.to_dict()
-            show_id = rating_data.get("show_id")
-            
-            if show_id:
-                if show_id in show_rating_counts:
-                    show_rating_counts[show_id] += 1
-                else:
-                    show_rating_counts[show_id] = 1
-        
-        # Sort shows by rating count (most popular first)
-        sorted_shows = sorted(show_rating_counts.items(), 
-                             key=lambda x: x[1], reverse=True)
-        
-        # Limit to the specified number of most popular shows
-        top_shows = sorted_shows[:num_most_popular]
-        
-        # Prepare result with show details
-        result = []
-        for show_id, count in top_shows:
-            # Use the existing endpoint to get show details
+
+        sort = request.args.get("sort", "count")
+        if sort not in POPULAR_SORTS:
+            return jsonify({"error": f"sort must be one of: {', '.join(POPULAR_SORTS)}"}), 400
+
+        # Optional filters: a TMDB genre ID and an ISO 639-1 language code
+        genre = request.args.get("genre")
+        if genre is not None:
             try:
-                # Import necessary modules
-                from flask import current_app
-                with current_app.test_client() as client:
-                    response = client.get(f"/shows/{show_id}")
-                    if response.status_code == 200:
-                        show_details = response.get_json()
-                        # Add rating count for the specified timeframe
-                        show_details["rating_count"] = count
-                        # Add the timeframe to the response
-                        show_details["timeframe_days"] = timeframe_days
-                        result.append(show_details)
-            except Exception as e:
-                logger.error(f"Error fetching show details for {show_id}: {e}")
-                # Continue with the next show if there's an error
-                continue
+                genre = int(genre)
+            except ValueError:
+                return jsonify({"error": "genre must be a TMDB genre ID"}), 400
+        language = request.args.get("original_language")
+        if language is not None:
+            language = language.lower()
+            if not re.fullmatch(r"[a-z]{2}", language):
+                return jsonify({"error": "original_language must be a two-letter language code"}), 400
+        filters = {key: value for key, value in (("genre", genre), ("original_language", language))
+                   if value is not None}
+        if filters and sort != "count":
+            return jsonify({"error": "genre and original_language can only be used with sort=count"}), 400
+
+        if sort == "trending":
+            # Trending ignores the timeframe; older ratings just count for less
+            snapshot = _load_popular_snapshot(TRENDING_SNAPSHOT_ID)
+            if snapshot is not None:
+                popular_shows = snapshot["popular_shows"][:num_most_popular]
+                total_shows_found = snapshot["total_shows_found"]
+                computed_at = snapshot["computed_at"]
+            else:
+                leaderboard.start()
+                if not trending_leaderboard.wait_until_loaded():
+                    return jsonify({"error": "Trending shows are still loading, try again shortly"}), 503
+                popular_shows, total_shows_found = compute_trending_shows(num_most_popular)
+                computed_at = datetime.now(timezone.utc).isoformat()
+            return jsonify({
+                "popular_shows": popular_shows,
+                "sort": sort,
+                "half_life_hours": TRENDING_HALF_LIFE_SECONDS / 3600,
+                "total_shows_found": total_shows_found,
+                "num_most_popular": num_most_popular,
+                "computed_at": computed_at
+            }), 200
+
+        # Common unfiltered timeframes are served from the scheduler's snapshot
+        snapshot = None
+        if timeframe_days in POPULAR_SNAPSHOT_TIMEFRAMES and not filters:
+            snapshot = _load_popular_snapshot(timeframe_days)
+
+        if snapshot is not None:
+            popular_shows = snapshot["popular_shows"][:num_most_popular]
+            total_shows_found = snapshot["total_shows_found"]
+            computed_at = snapshot["computed_at"]
+        else:
+            popular_shows, total_shows_found = compute_popular_shows(
+                timeframe_days, num_most_popular, genre=genre, language=language)
+            computed_at = datetime.now(timezone.utc).isoformat()
         
         return jsonify({
-            "popular_shows": result,
+            "popular_shows": popular_shows,
+            **filters,
+            "sort": sort,
             "timeframe_days": timeframe_days,
-            "total_shows_found": len(sorted_shows),
-            "num_most_popular": num_most_popular
+            "total_shows_found": total_shows_found,
+            "num_most_popular": num_most_popular,
+            "computed_at": computed_at
         }), 200
         
     except Exception as e:
         logger.error(f"Error getting popular shows: {e}")
         return jsonify({"error": str(e)}), 500
 
+def compute_followee_popular_shows(user_id, timeframe_days, num_most_popular):
+    """Rank shows by how many of a user's followees rated them in the timeframe.
+
+    Reads only the user's own feed items, which already hold every followee
+    rating, episode rating burst and import. Needs an app context. Returns
+    (popular shows, number of shows found).
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=timeframe_days)).isoformat()
+    items = db.collection("feeds").document(user_id).collection("items") \
+        .where(filter=FieldFilter("timestamp", ">=", cutoff)) \
+        .select(["user_id", "show_id", "ratings", "timestamp"]) \
+        .stream()
+
+    # show_id -> followees who rated it, and when it was last rated
+    raters = {}
+    last_rated = {}
+    for item in items:
+        item_data = item.to_dict()
+        # Import items list a sample of the shows they imported
+        show_ids = [rating["show_id"] for rating in item_data.get("ratings") or []]
+        if item_data.get("show_id"):
+            show_ids.append(item_data["show_id"])
+        for show_id in show_ids:
+            raters.setdefault(show_id, set()).add(item_data.get("user_id"))
+            last_rated[show_id] = max(last_rated.get(show_id, ""), item_data.get("timestamp") or "")
+
+    ranked = sorted(raters, key=lambda show_id: (len(raters[show_id]), last_rated[show_id]), reverse=True)
+    top_shows = ranked[:num_most_popular]
+    details_cache = {}
+    _fetch_show_details(top_shows, details_cache)
+    result = []
+    for show_id in top_shows:
+        if details_cache[show_id] is not None:
+            show_details = dict(details_cache[show_id])
+            show_details["followee_count"] = len(raters[show_id])
+            show_details["last_rated_at"] = last_rated[show_id]
+            result.append(show_details)
+    return result, len(ranked)
+
+@teli.route("/users/<user_id>/popular", methods=["GET"])
+def get_followee_popular_shows(user_id):
+    """Shows most rated by the people a user follows, from their feed"""
+    try:
+        try:
+            timeframe_days = int(request.args.get("timeframe", "7"))
+            num_most_popular = int(request.args.get("num_most_popular", "10"))
+        except ValueError:
+            return jsonify({"error": "timeframe and num_most_popular must be valid integers"}), 400
+        if timeframe_days < 1:
+            return jsonify({"error": "Timeframe must be a positive integer"}), 400
+        if num_most_popular < 1:
+            num_most_popular = 10
+        elif num_most_popular > 100:
+            num_most_popular = 100
+
+        # Cached results are dropped whenever the user's feed changes, and a
+        # cached result means the user exists
+        cache_key = (timeframe_days, num_most_popular)
+        cached = followee_popular_cache.get(user_id, cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
+        user_ref = db.collection("users").document(user_id).get()
+        if not user_ref.exists:
+            return jsonify({"error": "User not found"}), 404
+
+        popular_shows, total_shows_found = compute_followee_popular_shows(
+            user_id, timeframe_days, num_most_popular)
+        result = {
+            "user_id": user_id,
+            "popular_shows": popular_shows,
+            "timeframe_days": timeframe_days,
+            "total_shows_found": total_shows_found,
+            "num_most_popular": num_most_popular,
+            "computed_at": datetime.now(timezone.utc).isoformat()
+        }
+        followee_popular_cache.put(user_id, cache_key, result)
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"Error getting popular shows among followees: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Page size limits for the top rated leaderboard
+TOP_RATED_PAGE_SIZE = 20
+TOP_RATED_MAX_PAGE_SIZE = 100
+
+@teli.route("/shows/top_rated", methods=["GET"])
+def get_top_rated_shows():
+    """Shows ranked by Bayesian average rating, a page at a time"""
+    try:
+        try:
+            limit = int(request.args.get("limit", TOP_RATED_PAGE_SIZE))
+            offset = int(request.args.get("offset", 0))
+            min_votes = int(request.args.get("min_votes", 1))
+        except ValueError:
+            return jsonify({"error": "limit, offset and min_votes must be valid integers"}), 400
+        if limit < 1:
+            limit = TOP_RATED_PAGE_SIZE
+        elif limit > TOP_RATED_MAX_PAGE_SIZE:
+            limit = TOP_RATED_MAX_PAGE_SIZE
+        if offset < 0 or min_votes < 1:
+            return jsonify({"error": "offset must not be negative and min_votes must be at least 1"}), 400
+
+        leaderboard.start()
+        if not leaderboard.wait_until_loaded():
+            return jsonify({"error": "Leaderboard is still loading, try again shortly"}), 503
+
+        shows, has_more = leaderboard.page(offset=offset, limit=limit, min_votes=min_votes)
+        return jsonify({
+            "shows": shows,
+            "offset": offset,
+            "limit": limit,
+            "min_votes": min_votes,
+            "has_more": has_more,
+            "prior": leaderboard.prior()
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting top rated shows: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @teli.route("/delete_watch_status", methods=["POST"])
 def delete_watch_status():
     try:
@@ -818,17 +1959,16 @@ def delete_watch_status():
         return jsonify({"error": "User not found"}), 404
     
     try:
-        # Query for the watch status
-        status_query = db.collection("watch_status").where(
-            filter=FieldFilter("user_id", "==", req_data.user_id)).where(
-                filter=FieldFilter("show_id", "==", req_data.show_id)).limit(1).get()
+        # Get the watch status
+        status_ref = keyed_doc_ref("watch_status", watch_status_doc_id(req_data.user_id, req_data.show_id),
+                                   {"user_id": req_data.user_id, "show_id": req_data.show_id})
         
         # Check if status exists
-        if len(status_query) == 0:
+        if not status_ref.get().exists:
             return jsonify({"error": "No watch status found for this show"}), 404
         
         # Delete the status
-        status_query[0].reference.delete()
+        status_ref.delete()
         
         return jsonify({"message": "Watch status deleted successfully"}), 200
     
@@ -345,3 +345,193 @@ def test_get_episode_ratings_empty_result(client, user_fixture):
     data = json.loads(response.data)
     assert isinstance(data, list)
     assert len(data) == 0
+
+def test_episode_ratings_coalesce_into_one_feed_item(client, user_fixture):
+    """Test that a burst of episode ratings for a show reaches followers as a single feed item."""
+    from teli_routes import flush_episode_activity
+
+    # Arrange
+    user_id = user_fixture["id"]
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    follower_response = client.post(
+        "/add_user",
+        json={
+            "email": f"episodefollower_{timestamp}@example.com",
+            "name": "Episode Follower",
+            "username": f"episodefollower_{timestamp}"
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    follower_id = follower_response.get_json()["id"]
+    client.post(
+        "/follow",
+        json={"follower_id": follower_id, "followee_id": user_id},
+        headers={"Content-Type": "application/json"}
+    )
+    show_id = f"binge_{timestamp}"
+
+    # Act
+    for episode_number in range(1, 4):
+        client.post(
+            "/episode_ratings",
+            data=json.dumps({
+                "user_id": user_id,
+                "show_id": show_id,
+                "season_number": 1,
+                "episode_number": episode_number,
+                "rating": 8
+            }),
+            content_type="application/json"
+        )
+    flush_episode_activity(user_id, show_id)
+
+    # Assert
+    feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+    items = [item for item in feed if item["show_id"] == show_id]
+    assert len(items) == 1
+    assert items[0]["kind"] == "episode_ratings"
+    assert items[0]["episode_count"] == 3
+    assert [episode["episode_number"] for episode in items[0]["episodes"]] == [1, 2, 3]
+
+def test_failed_episode_fan_out_is_retried(client, user_fixture, monkeypatch):
+    """Test that episode activity stays pending when its fan-out fails, and a later flush delivers it."""
+    import teli_routes
+    from teli_routes import flush_episode_activity
+
+    # Arrange
+    user_id = user_fixture["id"]
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    follower_id = client.post(
+        "/add_user",
+        json={
+            "email": f"retryfollower_{timestamp}@example.com",
+            "name": "Retry Follower",
+            "username": f"retryfollower_{timestamp}"
+        },
+        headers={"Content-Type": "application/json"}
+    ).get_json()["id"]
+    client.post(
+        "/follow",
+        json={"follower_id": follower_id, "followee_id": user_id},
+        headers={"Content-Type": "application/json"}
+    )
+    show_id = f"retry_{timestamp}"
+    client.post(
+        "/episode_ratings",
+        data=json.dumps({"user_id": user_id, "show_id": show_id, "season_number": 1,
+                         "episode_number": 1, "rating": 7}),
+        content_type="application/json"
+    )
+
+    def failing_fan_out(*args, **kwargs):
+        raise RuntimeError("Firestore unavailable")
+
+    # Act
+    with monkeypatch.context() as patched:
+        patched.setattr(teli_routes, "fan_out_feed_item", failing_fan_out)
+        with pytest.raises(RuntimeError):
+            flush_episode_activity(user_id, show_id)
+
+    # Assert: still pending, and held by the failed flush's lease until it runs out
+    activity = teli_routes._episode_activity_ref(user_id, show_id).get().to_dict()
+    assert activity["pending"] is True
+    assert activity["flushed"] is False
+    assert flush_episode_activity(user_id, show_id) == 0
+
+    monkeypatch.setattr(teli_routes, "EPISODE_FLUSH_LEASE_SECONDS", 0)
+    assert flush_episode_activity(user_id, show_id) >= 1
+    feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+    assert [item["episode_count"] for item in feed if item["show_id"] == show_id] == [1]
+    activity = teli_routes._episode_activity_ref(user_id, show_id).get().to_dict()
+    assert activity["pending"] is False
+    assert activity["flushed"] is True
+
+def test_episode_heatmap(client, user_fixture):
+    """Test the show-wide heatmap of a user's episode ratings and episode averages."""
+    # Arrange
+    user_id = user_fixture["id"]
+    show_id = f"heatmap_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    for season_number, episode_number, rating in [(1, 1, 6), (1, 2, 8), (2, 1, 9), (1, 1, 7)]:
+        client.post(
+            "/episode_ratings",
+            data=json.dumps({
+                "user_id": user_id,
+                "show_id": show_id,
+                "season_number": season_number,
+                "episode_number": episode_number,
+                "rating": rating
+            }),
+            content_type="application/json"
+        )
+
+    # Act
+    response = client.get(f"/users/{user_id}/shows/{show_id}/episode_heatmap")
+
+    # Assert
+    assert response.status_code == 200
+    seasons = response.get_json()["seasons"]
+    assert [season["season_number"] for season in seasons] == [1, 2]
+    first_episode = seasons[0]["episodes"][0]
+    # The re-rating replaced the first one rather than adding to it
+    assert first_episode["rating"] == 7
+    assert first_episode["count"] == 1
+    assert first_episode["average"] == 7
+    assert [episode["episode_number"] for episode in seasons[0]["episodes"]] == [1, 2]
+    assert seasons[1]["episodes"][0]["rating"] == 9
+
+def test_episode_heatmap_user_not_found(client):
+    """Test the heatmap for a user that doesn't exist."""
+    response = client.get("/users/nonexistent_user_id/shows/some_show/episode_heatmap")
+    assert response.status_code == 404
+
+def test_add_season_episode_ratings(client, user_fixture):
+    """Test rating several episodes of a season in one request."""
+    # Arrange
+    user_id = user_fixture["id"]
+    show_id = f"season_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    payload = {
+        "user_id": user_id,
+        "show_id": show_id,
+        "season_number": 1,
+        "ratings": [
+            {"episode_number": 1, "rating": 7},
+            {"episode_number": 2, "rating": 8, "comment": "Great cliffhanger"},
+            {"episode_number": 3, "rating": 9}
+        ]
+    }
+
+    # Act
+    response = client.post("/episode_ratings/season", data=json.dumps(payload),
+                           content_type="application/json")
+
+    # Assert
+    assert response.status_code == 200
+    assert len(response.get_json()["ids"]) == 3
+    season = client.get(f"/users/{user_id}/shows/{show_id}/season/1/ratings").get_json()
+    assert sorted((rating["episode_number"], rating["rating"]) for rating in season) == [(1, 7), (2, 8), (3, 9)]
+    heatmap = client.get(f"/users/{user_id}/shows/{show_id}/episode_heatmap").get_json()
+    assert [episode["count"] for episode in heatmap["seasons"][0]["episodes"]] == [1, 1, 1]
+
+def test_add_season_episode_ratings_invalid(client, user_fixture):
+    """Test that an invalid episode rejects the whole season."""
+    payload = {
+        "user_id": user_fixture["id"],
+        "show_id": "1396",
+        "season_number": 1,
+        "ratings": [{"episode_number": 1, "rating": 7}, {"episode_number": 2, "rating": 11}]
+    }
+    response = client.post("/episode_ratings/season", data=json.dumps(payload),
+                           content_type="application/json")
+    assert response.status_code == 400
+
+def test_add_season_episode_ratings_invalid_user(client):
+    """Test rating a season for a user that doesn't exist."""
+    payload = {
+        "user_id": "nonexistent_user_id",
+        "show_id": "1396",
+        "season_number": 1,
+        "ratings": [{"episode_number": 1, "rating": 7}]
+    }
+    response = client.post("/episode_ratings/season", data=json.dumps(payload),
+                           content_type="application/json")
+    assert response.status_code == 404
@@ -483,3 +483,243 @@ class TestFeedEndpoints:
         response = client.get(f"/users/{setup_test_data['user1_id']}/feed?start_after=invalid-date")
         assert response.status_code == 400
         assert "error" in response.get_json()
+
+class TestFeedCleanup:
+    def test_clean_feed_after_unfollow(self, get_client, get_db):
+        from feed_jobs import clean_feed_after_unfollow
+        client = get_client
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        user_ids = []
+        for role in ("follower", "followee"):
+            response = client.post(
+                "/add_user",
+                json={
+                    "email": f"cleanup_{role}_{timestamp}@example.com",
+                    "name": f"Cleanup {role}",
+                    "username": f"cleanup_{role}_{timestamp}"
+                },
+                headers={"Content-Type": "application/json"}
+            )
+            user_ids.append(response.get_json()["id"])
+        follower_id, followee_id = user_ids
+
+        follow_payload = {"follower_id": follower_id, "followee_id": followee_id}
+        client.post("/follow", json=follow_payload, headers={"Content-Type": "application/json"})
+        client.post(
+            "/ratings",
+            json={"user_id": followee_id, "show_id": "the_wire", "rating": 9},
+            headers={"Content-Type": "application/json"}
+        )
+        assert len(client.get(f"/users/{follower_id}/feed").get_json()["feed"]) > 0
+
+        response = client.post("/unfollow", json=follow_payload, headers={"Content-Type": "application/json"})
+        assert response.status_code == 200
+
+        # Run the cleanup synchronously; re-running it is safe
+        clean_feed_after_unfollow(follower_id, followee_id, pause_seconds=0)
+        feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+        assert all(item["user_id"] != followee_id for item in feed)
+
+        job = get_db.collection("jobs").document(f"unfollow_cleanup_{follower_id}_{followee_id}").get()
+        assert job.to_dict()["status"] == "done"
+
+    def test_refollow_during_cleanup_aborts_it(self, get_client, get_db, monkeypatch):
+        import feed_jobs
+        from teli_routes import _unfollow_txn
+        client = get_client
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        user_ids = []
+        for role in ("follower", "followee"):
+            response = client.post(
+                "/add_user",
+                json={
+                    "email": f"refollow_{role}_{timestamp}@example.com",
+                    "name": f"Refollow {role}",
+                    "username": f"refollow_{role}_{timestamp}"
+                },
+                headers={"Content-Type": "application/json"}
+            )
+            user_ids.append(response.get_json()["id"])
+        follower_id, followee_id = user_ids
+
+        follow_payload = {"follower_id": follower_id, "followee_id": followee_id}
+        client.post("/follow", json=follow_payload, headers={"Content-Type": "application/json"})
+        for show_id in ("the_wire", "deadwood", "oz"):
+            client.post(
+                "/ratings",
+                json={"user_id": followee_id, "show_id": show_id, "rating": 8},
+                headers={"Content-Type": "application/json"}
+            )
+        # Unfollow without the route, which would start its own cleanup
+        _unfollow_txn(get_db.transaction(), follower_id, followee_id)
+
+        # The user follows again while the cleanup pauses after its first chunk
+        def refollow(seconds):
+            client.post("/follow", json=follow_payload, headers={"Content-Type": "application/json"})
+        monkeypatch.setattr(feed_jobs.time, "sleep", refollow)
+
+        assert feed_jobs.clean_feed_after_unfollow(follower_id, followee_id, chunk_size=1) == 1
+        job = get_db.collection("jobs").document(f"unfollow_cleanup_{follower_id}_{followee_id}").get()
+        assert job.to_dict()["status"] == "aborted"
+        feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+        # Only the first chunk went; the re-follow's backfill may already have restored it
+        assert len([item for item in feed if item["user_id"] == followee_id]) >= 2
+
+class TestFeedCompaction:
+    def test_compact_feed_trims_oldest_items(self, get_client, get_db, setup_test_data):
+        from feed_jobs import compact_feed
+        client = get_client
+        user_id = setup_test_data["user1_id"]
+        for show_id in ("the_sopranos", "mad_men", "true_detective"):
+            client.post(
+                "/ratings",
+                json={"user_id": setup_test_data["user2_id"], "show_id": show_id, "rating": 8},
+                headers={"Content-Type": "application/json"}
+            )
+
+        compact_feed(user_id, max_items=2)
+
+        feed = client.get(f"/users/{user_id}/feed").get_json()["feed"]
+        assert len(feed) == 2
+        meta = get_db.collection("feeds").document(user_id).get().to_dict()
+        assert meta["item_count"] == 2
+        assert "last_compacted_at" in meta
+
+    def test_retention_applies_below_the_cap(self, get_client, get_db, setup_test_data):
+        from feed_jobs import expire_old_feed_items, increment_feed_count
+        client = get_client
+        user_id = setup_test_data["user1_id"]
+        items_ref = get_db.collection("feeds").document(user_id).collection("items")
+        batch = get_db.batch()
+        batch.set(items_ref.document("expired_item"), {
+            "user_id": setup_test_data["user2_id"],
+            "rating_id": "expired_item",
+            "show_id": "deadwood",
+            "rating": 7,
+            "timestamp": "2020-01-01T00:00:00+00:00"
+        })
+        increment_feed_count(batch, user_id, 1)
+        batch.commit()
+        count_before = get_db.collection("feeds").document(user_id).get().to_dict()["item_count"]
+
+        assert expire_old_feed_items() >= 1
+
+        assert not items_ref.document("expired_item").get().exists
+        feed = client.get(f"/users/{user_id}/feed").get_json()["feed"]
+        assert all(item["id"] != "expired_item" for item in feed)
+        meta = get_db.collection("feeds").document(user_id).get().to_dict()
+        assert meta["item_count"] == count_before - 1
+
+    def test_concurrent_sweeps_count_each_item_once(self, get_db, setup_test_data):
+        from feed_jobs import _expire_chunk_txn, increment_feed_count
+        user_id = setup_test_data["user1_id"]
+        items_ref = get_db.collection("feeds").document(user_id).collection("items")
+        batch = get_db.batch()
+        batch.set(items_ref.document("raced_item"), {
+            "user_id": setup_test_data["user2_id"],
+            "rating_id": "raced_item",
+            "show_id": "deadwood",
+            "timestamp": "2020-01-01T00:00:00+00:00"
+        })
+        increment_feed_count(batch, user_id, 1)
+        batch.commit()
+        count_before = get_db.collection("feeds").document(user_id).get().to_dict()["item_count"]
+
+        # Two sweeps found the same expired item before either deleted it
+        cutoff = "2021-01-01T00:00:00+00:00"
+        assert _expire_chunk_txn(get_db.transaction(), [items_ref.document("raced_item")], cutoff) == {user_id: 1}
+        assert _expire_chunk_txn(get_db.transaction(), [items_ref.document("raced_item")], cutoff) == {}
+        meta = get_db.collection("feeds").document(user_id).get().to_dict()
+        assert meta["item_count"] == count_before - 1
+
+class TestFeedBackfill:
+    def test_backfill_is_deduplicated(self, get_client, setup_test_data):
+        from teli_routes import populate_feed_from_follow
+        client = get_client
+        follower_id = setup_test_data["user1_id"]
+        followee_id = setup_test_data["user2_id"]
+
+        # Backfilling twice (as on a re-follow) must not duplicate items
+        populate_feed_from_follow(follower_id, followee_id, depth=5, chunk_size=2)
+        populate_feed_from_follow(follower_id, followee_id, depth=5, chunk_size=2)
+
+        feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+        rating_ids = [item["id"] for item in feed if item["user_id"] == followee_id]
+        assert len(rating_ids) == len(set(rating_ids))
+
+    def test_edited_rating_updates_feed_in_place(self, get_client, setup_test_data):
+        client = get_client
+        follower_id = setup_test_data["user1_id"]
+        rating_payload = {
+            "user_id": setup_test_data["user2_id"],
+            "show_id": "fargo",
+            "rating": 6,
+            "comment": "Decent"
+        }
+        client.post("/ratings", json=rating_payload, headers={"Content-Type": "application/json"})
+        rating_payload.update({"rating": 9, "comment": "Grew on me"})
+        client.post("/ratings", json=rating_payload, headers={"Content-Type": "application/json"})
+
+        feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+        items = [item for item in feed if item["show_id"] == "fargo"]
+        assert len(items) == 1
+        assert items[0]["rating"] == 9
+        assert items[0]["comment"] == "Grew on me"
+
+class TestCompactFeedItems:
+    def test_feed_items_are_stored_compact(self, get_client, get_db, setup_test_data):
+        client = get_client
+        response = client.post(
+            "/ratings",
+            json={
+                "user_id": setup_test_data["user2_id"],
+                "show_id": "succession",
+                "rating": 10,
+                "comment": "A long comment that should not be copied into every feed"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        rating_id = response.get_json()["id"]
+
+        stored = get_db.collection("feeds").document(setup_test_data["user1_id"]) \
+            .collection("items").document(rating_id).get().to_dict()
+        assert set(stored) == {"rating_id", "user_id", "show_id", "timestamp"}
+
+        # The feed response is still fully hydrated
+        feed = client.get(f"/users/{setup_test_data['user1_id']}/feed").get_json()["feed"]
+        item = next(item for item in feed if item["id"] == rating_id)
+        assert item["rating"] == 10
+        assert item["comment"].startswith("A long comment")
+        assert item["user_name"] == "Test User 2"
+        assert "rating_id" not in item
+
+    def test_legacy_items_show_edited_rating(self, get_client, get_db, setup_test_data):
+        from feed_cache import feed_page_cache
+        from feed_stream import publish_ratings_changed
+        client = get_client
+        follower_id = setup_test_data["user1_id"]
+        rating_payload = {
+            "user_id": setup_test_data["user2_id"],
+            "show_id": "the_wire",
+            "rating": 9,
+            "comment": "Slow start"
+        }
+        rating_id = client.post("/ratings", json=rating_payload,
+                                headers={"Content-Type": "application/json"}).get_json()["id"]
+
+        # An item written before feeds went compact still carries a full copy
+        get_db.collection("feeds").document(follower_id).collection("items").document(rating_id).set({
+            **rating_payload,
+            "rating_id": rating_id,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        })
+        # The edit lands on another worker; this one only hears about it
+        get_db.collection("ratings").document(rating_id).update({"rating": 10, "comment": "Best show ever"})
+        publish_ratings_changed([rating_id])
+        feed_page_cache.invalidate(follower_id)
+
+        feed = client.get(f"/users/{follower_id}/feed").get_json()["feed"]
+        item = next(item for item in feed if item["id"] == rating_id)
+        assert item["rating"] == 10
+        assert item["comment"] == "Best show ever"
+        assert "rating_id" not in item
@@ -0,0 +1,59 @@
+from feed_cache import FeedPageCache, FolloweePopularCache, FEED_PAGE_SIZE
+
+class TestFeedPageCache:
+    def test_patch_keeps_newest_first(self):
+        cache = FeedPageCache()
+        cache.put("user_a", [{"id": "r1", "timestamp": "2024-05-01T00:00:00+00:00"}], 0)
+        cache.patch("user_a", {"id": "r2", "timestamp": "2024-05-02T00:00:00+00:00"})
+        assert [item["id"] for item in cache.get("user_a")] == ["r2", "r1"]
+
+    def test_patch_replaces_edited_item(self):
+        cache = FeedPageCache()
+        cache.put("user_a", [{"id": "r1", "rating": 5, "timestamp": "2024-05-01T00:00:00+00:00"}], 0)
+        cache.patch("user_a", {"id": "r1", "rating": 8, "timestamp": "2024-05-03T00:00:00+00:00"})
+        page = cache.get("user_a")
+        assert len(page) == 1
+        assert page[0]["rating"] == 8
+
+    def test_patch_trims_to_page_size(self):
+        cache = FeedPageCache()
+        cache.put("user_a", [{"id": f"r{i}", "timestamp": f"2024-05-01T00:00:{i:02d}+00:00"}
+                             for i in range(FEED_PAGE_SIZE)], 0)
+        cache.patch("user_a", {"id": "new", "timestamp": "2024-06-01T00:00:00+00:00"})
+        page = cache.get("user_a")
+        assert len(page) == FEED_PAGE_SIZE
+        assert page[0]["id"] == "new"
+
+    def test_patch_ignores_uncached_users(self):
+        cache = FeedPageCache()
+        cache.patch("user_a", {"id": "r1", "timestamp": "2024-05-01T00:00:00+00:00"})
+        assert cache.get("user_a") is None
+
+    def test_put_skips_page_read_before_a_change(self):
+        cache = FeedPageCache()
+        generation = cache.generation("user_a")
+        # A new item arrives while the page is being read from Firestore
+        cache.patch("user_a", {"id": "r2", "timestamp": "2024-05-02T00:00:00+00:00"})
+        cache.put("user_a", [{"id": "r1", "timestamp": "2024-05-01T00:00:00+00:00"}], generation)
+        assert cache.get("user_a") is None
+
+        cache.put("user_a", [{"id": "r1", "timestamp": "2024-05-01T00:00:00+00:00"}], cache.generation("user_a"))
+        assert cache.get("user_a") is not None
+
+    def test_memory_bound_evicts_pages(self):
+        cache = FeedPageCache(max_bytes=200)
+        for user in ("user_a", "user_b", "user_c"):
+            cache.put(user, [{"id": "r1", "comment": "x" * 50}], 0)
+        assert cache.get("user_a") is None
+        assert cache.get("user_c") is not None
+
+class TestFolloweePopularCache:
+    def test_invalidate_drops_every_query(self):
+        cache = FolloweePopularCache()
+        cache.put("user_a", (7, 10), {"popular_shows": []})
+        cache.put("user_a", (30, 10), {"popular_shows": []})
+        cache.put("user_b", (7, 10), {"popular_shows": []})
+        cache.invalidate("user_a")
+        assert cache.get("user_a", (7, 10)) is None
+        assert cache.get("user_a", (30, 10)) is None
+        assert cache.get("user_b", (7, 10)) is not None
@@ -0,0 +1,30 @@
+from feed_stream import FeedBus
+
+class TestFeedBus:
+    def test_deliver_to_subscriber(self):
+        bus = FeedBus(max_buffer=10)
+        subscription = bus.subscribe("user_a")
+        bus.deliver(["user_a", "user_b"], {"rating_id": "r1"})
+        assert subscription.get(timeout=1) == ("feed_item", {"rating_id": "r1"})
+        assert subscription.get(timeout=0.01) is None
+
+    def test_slow_consumer_is_dropped(self):
+        bus = FeedBus(max_buffer=2)
+        subscription = bus.subscribe("user_a")
+        for i in range(3):
+            bus.deliver(["user_a"], {"rating_id": f"r{i}"})
+        assert subscription.dropped
+        assert bus.subscriber_count() == 0
+
+    def test_unsubscribe(self):
+        bus = FeedBus()
+        subscription = bus.subscribe("user_a")
+        bus.unsubscribe(subscription)
+        bus.deliver(["user_a"], {"rating_id": "r1"})
+        assert subscription.get(timeout=0.01) is None
+
+class TestFeedStreamEndpoint:
+    def test_stream_user_not_found(self, get_client):
+        response = get_client.get("/users/nonexistent-user-id/feed/stream")
+        assert response.status_code == 404
+        assert response.get_json()["error"] == "User not found"
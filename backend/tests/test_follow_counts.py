@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime
+
+@pytest.fixture(scope="module")
+def follow_counts_users(get_client):
+    client = get_client
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    user_ids = []
+    for i in range(3):
+        response = client.post(
+            "/add_user",
+            json={
+                "email": f"followcounts_{i}_{timestamp}@example.com",
+                "name": f"Follow Counts User {i}",
+                "username": f"followcounts_{i}_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        user_ids.append(response.get_json()["id"])
+    return user_ids
+
+def _counts(client, user_id):
+    response = client.get(f"/users/{user_id}/follow_counts")
+    assert response.status_code == 200
+    data = response.get_json()
+    return data["followers_count"], data["following_count"]
+
+class TestFollowCounts:
+    def test_follow_and_unfollow_update_counts(self, get_client, follow_counts_users):
+        client = get_client
+        celebrity, fan_a, fan_b = follow_counts_users
+        for fan in (fan_a, fan_b):
+            response = client.post("/follow", json={"follower_id": fan, "followee_id": celebrity})
+            assert response.status_code == 200
+        # Following again is a no-op and isn't counted twice
+        response = client.post("/follow", json={"follower_id": fan_a, "followee_id": celebrity})
+        assert response.get_json()["message"] == "Already following"
+        assert _counts(client, celebrity) == (2, 0)
+        assert _counts(client, fan_a) == (0, 1)
+
+        response = client.post("/unfollow", json={"follower_id": fan_b, "followee_id": celebrity})
+        assert response.status_code == 200
+        response = client.post("/unfollow", json={"follower_id": fan_b, "followee_id": celebrity})
+        assert response.status_code == 404
+        assert _counts(client, celebrity) == (1, 0)
+        assert _counts(client, fan_b) == (0, 0)
+
+    def test_get_user_includes_counts(self, get_client, follow_counts_users):
+        client = get_client
+        celebrity, fan_a, _ = follow_counts_users
+        client.post("/follow", json={"follower_id": fan_a, "followee_id": celebrity})
+        data = client.get(f"/user/{celebrity}").get_json()
+        assert data["followers_count"] == _counts(client, celebrity)[0]
+        assert data["following_count"] == 0
+
+    def test_unknown_user(self, get_client):
+        response = get_client.get("/users/no_such_user_follow_counts/follow_counts")
+        assert response.status_code == 404
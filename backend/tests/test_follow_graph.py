@@ -0,0 +1,83 @@
+from follow_graph import FollowGraph
+
+class TestFollowGraph:
+    def test_load_and_read(self):
+        graph = FollowGraph()
+        graph.load([("alice", "carol"), ("bob", "carol"), ("alice", "bob")])
+        assert graph.is_loaded()
+        assert sorted(graph.followers("carol")) == ["alice", "bob"]
+        assert sorted(graph.following("alice")) == ["bob", "carol"]
+        assert graph.followers("alice") == []
+        assert graph.followers("nobody") == []
+
+    def test_duplicate_follows_count_once(self):
+        graph = FollowGraph()
+        graph.load([("alice", "carol")])
+        graph.add("alice", "carol")
+        assert graph.followers("carol") == ["alice"]
+        assert graph.memory_usage()["follows"] == 1
+
+    def test_remove(self):
+        graph = FollowGraph()
+        graph.load([("alice", "carol"), ("bob", "carol")])
+        graph.remove("alice", "carol")
+        graph.remove("alice", "carol")
+        graph.remove("nobody", "carol")
+        assert graph.followers("carol") == ["bob"]
+        assert graph.following("alice") == []
+        assert graph.memory_usage()["follows"] == 1
+
+    def test_memory_usage(self):
+        graph = FollowGraph()
+        graph.load((f"fan_{i}", "star") for i in range(1000))
+        usage = graph.memory_usage()
+        assert usage["users"] == 1001
+        assert usage["follows"] == 1000
+        assert usage["bytes"] > 0
+
+    def test_memory_usage_tracks_changes(self):
+        import sys
+        graph = FollowGraph()
+        graph.load((f"fan_{i}", "star") for i in range(100))
+        for i in range(50):
+            graph.remove(f"fan_{i}", "star")
+            graph.add("star", f"fan_{i}")
+        # The running total matches walking the whole graph
+        walked = sum(sys.getsizeof(user_id) for user_id in graph._user_ids) + \
+            sum(sys.getsizeof(ids) for ids in graph._followers + graph._following) + \
+            sys.getsizeof(graph._ids) + sys.getsizeof(graph._user_ids) + \
+            sys.getsizeof(graph._followers) + sys.getsizeof(graph._following)
+        assert graph.memory_usage() == {"users": 101, "follows": 100, "bytes": walked}
+
+def test_graph_endpoints_see_new_follows(get_client):
+    from datetime import datetime
+    client = get_client
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    user_ids = []
+    for i in range(2):
+        response = client.post(
+            "/add_user",
+            json={
+                "email": f"followgraph_{i}_{timestamp}@example.com",
+                "name": f"Follow Graph User {i}",
+                "username": f"followgraph_{i}_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        user_ids.append(response.get_json()["id"])
+    follower_id, followee_id = user_ids
+
+    client.post("/follow", json={"follower_id": follower_id, "followee_id": followee_id})
+    assert client.get(f"/users/{followee_id}/followers").get_json()["followers"] == [follower_id]
+    assert client.get(f"/users/{follower_id}/following").get_json()["following"] == [followee_id]
+
+    client.post("/unfollow", json={"follower_id": follower_id, "followee_id": followee_id})
+    assert client.get(f"/users/{followee_id}/followers").get_json()["followers"] == []
+
+def test_health_reports_follow_graph(get_client):
+    from follow_graph import follow_graph
+    response = get_client.get("/health")
+    assert response.status_code == 200
+    graph = response.get_json()["follow_graph"]
+    assert graph["follows"] == follow_graph.memory_usage()["follows"]
+    assert graph["bytes"] > 0
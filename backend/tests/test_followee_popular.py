@@ -0,0 +1,67 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+
+@pytest.fixture(scope="module")
+def followee_popular_data(get_client, get_db):
+    client = get_client
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    user_ids = []
+    for i in range(3):
+        response = client.post(
+            "/add_user",
+            json={
+                "email": f"followeepopular_{i}_{timestamp}@example.com",
+                "name": f"Followee Popular User {i}",
+                "username": f"followeepopular_{i}_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        user_ids.append(response.get_json()["id"])
+    user_id, followee_a, followee_b = user_ids
+
+    # Feed items as fan-out writes them: two followees rated one show, one
+    # rated another, and an old rating falls outside a one day timeframe
+    now = datetime.now(timezone.utc)
+    items = get_db.collection("feeds").document(user_id).collection("items")
+    items.document(f"{followee_a}_shared").set(
+        {"user_id": followee_a, "show_id": "shared_show", "timestamp": now.isoformat()})
+    items.document(f"{followee_b}_shared").set(
+        {"user_id": followee_b, "show_id": "shared_show", "timestamp": now.isoformat()})
+    items.document(f"{followee_b}_solo").set(
+        {"user_id": followee_b, "show_id": "solo_show", "timestamp": now.isoformat()})
+    items.document(f"{followee_a}_old").set(
+        {"user_id": followee_a, "show_id": "old_show",
+         "timestamp": (now - timedelta(days=3)).isoformat()})
+    return {"user_id": user_id}
+
+class TestFolloweePopular:
+    def test_ranks_by_followees(self, get_client, followee_popular_data):
+        from teli_routes import compute_followee_popular_shows
+        with get_client.application.app_context():
+            _, total = compute_followee_popular_shows(followee_popular_data["user_id"], 7, 10)
+            _, recent_total = compute_followee_popular_shows(followee_popular_data["user_id"], 1, 10)
+        assert total == 3
+        assert recent_total == 2
+
+    def test_endpoint_caches_until_feed_changes(self, get_client, followee_popular_data):
+        from feed_cache import followee_popular_cache
+        from feed_stream import feed_bus, FEED_RESET
+        client = get_client
+        user_id = followee_popular_data["user_id"]
+        response = client.get(f"/users/{user_id}/popular?timeframe=1")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["total_shows_found"] == 2
+        assert data["timeframe_days"] == 1
+        assert followee_popular_cache.get(user_id, (1, 10)) is not None
+
+        feed_bus.deliver([user_id], {}, FEED_RESET)
+        assert followee_popular_cache.get(user_id, (1, 10)) is None
+
+    def test_user_not_found(self, get_client):
+        assert get_client.get("/users/no_such_user_xyz/popular").status_code == 404
+
+    def test_invalid_params(self, get_client, followee_popular_data):
+        user_id = followee_popular_data["user_id"]
+        assert get_client.get(f"/users/{user_id}/popular?timeframe=0").status_code == 400
+        assert get_client.get(f"/users/{user_id}/popular?num_most_popular=x").status_code == 400
@@ -0,0 +1,113 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from leaderboard import Leaderboard, TrendingLeaderboard
+
+class TestLeaderboard:
+    def test_prior_outranks_few_votes(self):
+        board = Leaderboard(prior_votes=10, prior_mean=7)
+        board.load({"one_ten": (1, 10), "many_nines": (100, 900)})
+        shows, has_more = board.page()
+        assert [show["show_id"] for show in shows] == ["many_nines", "one_ten"]
+        assert not has_more
+
+    def test_update_moves_show(self):
+        board = Leaderboard(prior_votes=10, prior_mean=7)
+        board.load({"a": (10, 80), "b": (10, 70)})
+        board.update("b", 20, 180)
+        shows, _ = board.page()
+        assert [show["show_id"] for show in shows] == ["b", "a"]
+        assert shows[0]["count"] == 20
+        assert shows[0]["average"] == 9
+
+    def test_update_to_zero_removes_show(self):
+        board = Leaderboard(prior_votes=10, prior_mean=7)
+        board.load({"a": (10, 80)})
+        board.update("a", 0, 0)
+        assert board.page() == ([], False)
+
+    def test_pagination_and_min_votes(self):
+        board = Leaderboard(prior_votes=10, prior_mean=7)
+        board.load({"a": (50, 450), "b": (1, 10), "c": (30, 240), "d": (20, 150)})
+        shows, has_more = board.page(offset=1, limit=1, min_votes=5)
+        assert [show["show_id"] for show in shows] == ["c"]
+        assert shows[0]["rank"] == 2
+        assert has_more
+
+    def test_prior_mean_from_data(self):
+        board = Leaderboard(prior_votes=10)
+        board.load({"a": (2, 12), "b": (2, 20)})
+        assert board.prior()["mean"] == 8
+
+    def test_prior_mean_follows_updates(self):
+        # Started on an empty database, so the first mean is 0
+        board = Leaderboard(prior_votes=10)
+        board.load({})
+        board.update("few_high", 2, 18)
+        board.update("many_good", 20, 170)
+        shows, _ = board.page()
+        assert [show["show_id"] for show in shows] == ["few_high", "many_good"]
+
+        # A flood of low ratings pulls the mean down, and with it the two
+        # votes of few_high count for less than the twenty of many_good
+        board.update("many_low", 200, 200)
+        assert board.prior()["mean"] == pytest.approx(1.75, abs=0.01)
+        shows, _ = board.page()
+        assert [show["show_id"] for show in shows] == ["many_good", "few_high", "many_low"]
+
+class TestTrendingLeaderboard:
+    def test_recent_ratings_outrank_older_ones(self):
+        now = datetime.now(timezone.utc)
+        board = TrendingLeaderboard()
+        # 500 ratings six days ago against 400 today
+        board.load({
+            "last_week": (500, 500.0, (now - timedelta(days=6)).isoformat()),
+            "today": (400, 400.0, now.isoformat())
+        })
+        assert [show_id for show_id, _ in board.top(2)] == ["today", "last_week"]
+        # Two half-lives ago, so each old rating counts for a quarter
+        assert board.top(2)[1][1] == pytest.approx(125, rel=0.01)
+
+    def test_update_moves_show(self):
+        now = datetime.now(timezone.utc).isoformat()
+        board = TrendingLeaderboard()
+        board.load({"a": (2, 2.0, now), "b": (1, 1.0, now)})
+        board.update("b", 3, 3.0, now)
+        assert [show_id for show_id, _ in board.top(2)] == ["b", "a"]
+        assert len(board) == 2
+
+    def test_far_future_scores_stay_ranked(self):
+        far_future = datetime(9000, 1, 1, tzinfo=timezone.utc)
+        board = TrendingLeaderboard()
+        board.load({
+            "older": (8, 8.0, (far_future - timedelta(days=9)).isoformat()),
+            "newer": (2, 2.0, far_future.isoformat())
+        })
+        # Three half-lives ago, so the older show's 8 ratings count for 1
+        assert [show_id for show_id, _ in board.top(2)] == ["newer", "older"]
+
+def test_far_future_ratings_do_not_overflow(get_db):
+    from aggregates import apply_show_rating_delta, read_trending_shards, get_show_rating_stats, \
+        decayed_trending_score, show_rating_counter
+    show_id = f"far_future_show_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    for year in (2040, 2500, 9000):
+        rated_at = datetime(year, 1, 1, tzinfo=timezone.utc).isoformat()
+        batch = get_db.batch()
+        apply_show_rating_delta(batch, show_id, None, 8, rated_at,
+                                trending_shard=read_trending_shards([show_id])[show_id])
+        batch.commit()
+
+    stats = get_show_rating_stats(show_id)
+    assert stats["count"] == 3
+    # The earlier ratings have decayed away and the latest one counts in full
+    assert stats["trending_score"] == pytest.approx(1.0)
+    assert stats["trending_updated_at"].startswith("9000-01-01")
+    half_life_later = datetime(9000, 1, 4, tzinfo=timezone.utc)
+    assert decayed_trending_score(stats["trending_score"], stats["trending_updated_at"],
+                                  half_life_later) == pytest.approx(0.5)
+
+    for ref in show_rating_counter.shard_refs(show_id):
+        ref.delete()
+
+def test_top_rated_invalid_params(get_client):
+    assert get_client.get("/shows/top_rated?limit=abc").status_code == 400
+    assert get_client.get("/shows/top_rated?min_votes=0").status_code == 400
@@ -0,0 +1,64 @@
+import pytest
+from datetime import datetime
+from doc_ids import rating_doc_id, episode_rating_doc_id, rekey_job_id
+
+@pytest.fixture(scope="module")
+def legacy_user(get_client):
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    response = get_client.post(
+        "/add_user",
+        json={
+            "email": f"legacy_{timestamp}@example.com",
+            "name": "Legacy User",
+            "username": f"legacy_{timestamp}"
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    return {"id": response.get_json()["id"], "timestamp": timestamp}
+
+class TestRekeyMigrations:
+    def test_writes_reuse_legacy_documents(self, get_client, get_db, legacy_user):
+        user_id = legacy_user["id"]
+        show_id = f"legacy_show_{legacy_user['timestamp']}"
+        _, legacy_ref = get_db.collection("ratings").add({
+            "user_id": user_id, "show_id": show_id, "rating": 5,
+            "timestamp": "2023-01-01T00:00:00+00:00"
+        })
+
+        response = get_client.post(
+            "/ratings",
+            json={"user_id": user_id, "show_id": show_id, "rating": 8},
+            headers={"Content-Type": "application/json"}
+        )
+        # Until ratings are rekeyed the old document is updated in place
+        assert response.get_json()["id"] == legacy_ref.id
+        assert legacy_ref.get().to_dict()["rating"] == 8
+        assert not get_db.collection("ratings").document(rating_doc_id(user_id, show_id)).get().exists
+
+    def test_rekey_merges_duplicates_across_pages(self, get_db, legacy_user):
+        from migrations import rekey_episode_ratings
+        user_id = legacy_user["id"]
+        show_id = f"legacy_show_{legacy_user['timestamp']}"
+        episodes = get_db.collection("episode_ratings")
+        for episode_number, rating, timestamp in ((1, 3, "2023-01-01"), (1, 5, "2023-01-02"),
+                                                  (1, 9, "2023-01-03"), (2, 7, "2023-01-01")):
+            episodes.add({
+                "user_id": user_id, "show_id": show_id, "season_number": 1,
+                "episode_number": episode_number, "rating": rating,
+                "timestamp": f"{timestamp}T00:00:00+00:00"
+            })
+
+        # Pages smaller than the user's ratings still keep duplicates together
+        assert rekey_episode_ratings(page_size=2) >= 4
+
+        docs = list(episodes.where("user_id", "==", user_id).stream())
+        assert sorted(doc.id for doc in docs) == [episode_rating_doc_id(user_id, show_id, 1, 1),
+                                                  episode_rating_doc_id(user_id, show_id, 1, 2)]
+        assert episodes.document(episode_rating_doc_id(user_id, show_id, 1, 1)).get().to_dict()["rating"] == 9
+        # The merged duplicates are no longer counted in the user's stats
+        stats = get_db.collection("user_rating_stats").document(user_id).get().to_dict()
+        assert stats["episode_rating_count"] == 2
+
+        checkpoint = get_db.collection("jobs").document(rekey_job_id("episode_ratings")).get().to_dict()
+        assert checkpoint["status"] == "done"
+        assert checkpoint["merged"] >= 1
@@ -268,3 +268,264 @@ class TestPopularShowsEndpoints:
         data = response.get_json()
         assert 'error' in data
         assert 'Timeframe must be a positive integer' in data['error'] or 'timeframe parameter must be a positive integer' in data['error']
+
+class TestPopularBuckets:
+    def test_bucket_ids_cover_timeframe(self):
+        from aggregates import popular_bucket_ids
+        end = datetime(2024, 5, 10, 15, 30, tzinfo=timezone.utc)
+        bucket_ids = popular_bucket_ids(end - timedelta(days=2), end)
+        # The hours left on the first day, then whole days
+        assert bucket_ids[0] == "hour_2024050815"
+        assert bucket_ids[8] == "hour_2024050823"
+        assert bucket_ids[9:] == ["day_20240509", "day_20240510"]
+
+    def test_rerating_moves_between_buckets(self):
+        from aggregates import popular_bucket_deltas
+        deltas = popular_bucket_deltas([
+            ("show_a", "2024-05-09T10:15:00+00:00", "2024-05-10T10:45:00+00:00"),
+            ("show_b", None, "2024-05-10T10:05:00+00:00")
+        ])
+        assert deltas["hour_2024050910"] == {"show_a": -1}
+        assert deltas["day_20240509"] == {"show_a": -1}
+        assert deltas["hour_2024051010"] == {"show_a": 1, "show_b": 1}
+        assert deltas["day_20240510"] == {"show_a": 1, "show_b": 1}
+
+    def test_rerating_in_same_hour_changes_nothing(self):
+        from aggregates import popular_bucket_deltas
+        assert popular_bucket_deltas([
+            ("show_a", "2024-05-10T10:15:00+00:00", "2024-05-10T10:45:00+00:00")
+        ]) == {}
+
+    def test_sealed_buckets_answer_top_shows(self, get_client, get_db):
+        from aggregates import POPULAR_BUCKETS_COLLECTION, popular_bucket_counter, seal_popular_buckets, \
+            top_recent_shows
+        end = datetime(2024, 5, 10, 15, 30, tzinfo=timezone.utc)
+        batch = get_db.batch()
+        popular_bucket_counter.set(batch, "hour_2024050910", {"counts": {"sealed_a": 2, "sealed_b": 1}})
+        popular_bucket_counter.set(batch, "day_20240509", {"counts": {"sealed_a": 2, "sealed_b": 1}})
+        popular_bucket_counter.set(batch, "hour_2024051012", {"counts": {"sealed_b": 3}})
+        popular_bucket_counter.set(batch, "day_20240510", {"counts": {"sealed_b": 3}})
+        batch.commit()
+
+        seal_popular_buckets(end)
+        buckets = get_db.collection(POPULAR_BUCKETS_COLLECTION)
+        assert "sketch" in buckets.document("day_20240509").get().to_dict()
+        assert "sketch" in buckets.document("hour_2024051012").get().to_dict()
+        # Today's bucket is still open, so it's read from its shards
+        assert not buckets.document("day_20240510").get().exists
+
+        summary = top_recent_shows(end - timedelta(days=2), end)
+        assert summary.top(2) == [("sealed_b", 4), ("sealed_a", 2)]
+
+    def test_rerating_after_seal_counts_once(self, get_db):
+        from aggregates import POPULAR_BUCKETS_COLLECTION, apply_popular_bucket_deltas, seal_popular_buckets, \
+            top_recent_shows
+        show_id = f"resealed_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        first_rated_at = "2024-06-01T10:15:00+00:00"
+        batch = get_db.batch()
+        apply_popular_bucket_deltas(batch, [(show_id, None, first_rated_at)])
+        batch.commit()
+        seal_popular_buckets(datetime(2024, 6, 2, 12, tzinfo=timezone.utc))
+        assert "sketch" in get_db.collection(POPULAR_BUCKETS_COLLECTION).document("day_20240601").get().to_dict()
+
+        # The re-rating moves the rating out of buckets that are already sealed
+        batch = get_db.batch()
+        apply_popular_bucket_deltas(batch, [(show_id, first_rated_at, "2024-06-02T11:30:00+00:00")])
+        batch.commit()
+
+        end = datetime(2024, 6, 2, 12, 30, tzinfo=timezone.utc)
+        assert dict(top_recent_shows(end - timedelta(days=3), end).top(1000))[show_id] == 1
+        assert show_id not in dict(top_recent_shows(end - timedelta(days=3), end - timedelta(days=1)).top(1000))
+
+        # Sealing the new hour doesn't count it again
+        seal_popular_buckets(end)
+        assert dict(top_recent_shows(end - timedelta(days=3), end).top(1000))[show_id] == 1
+
+    def test_sealing_twice_subtracts_once(self, get_db):
+        from aggregates import apply_popular_bucket_deltas, seal_popular_buckets, top_recent_shows, \
+            _seal_bucket_txn
+        show_id = f"sealed_twice_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        batch = get_db.batch()
+        apply_popular_bucket_deltas(batch, [(show_id, None, "2024-07-01T10:15:00+00:00")])
+        batch.commit()
+
+        end = datetime(2024, 7, 2, 12, tzinfo=timezone.utc)
+        assert seal_popular_buckets(end) >= 2
+        # Workers sealing at the same time find the bucket sealed and leave it
+        assert not _seal_bucket_txn(get_db.transaction(), "day_20240701")
+        assert seal_popular_buckets(end) == 0
+        assert dict(top_recent_shows(end - timedelta(days=2), end).top(1000))[show_id] == 1
+
+    def test_reads_shards_of_unsealed_buckets_only(self, get_db, monkeypatch):
+        from aggregates import apply_popular_bucket_deltas, seal_popular_buckets, top_recent_shows, \
+            popular_bucket_counter
+        show_id = f"read_sealed_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        end = datetime(2024, 8, 2, 12, tzinfo=timezone.utc)
+        batch = get_db.batch()
+        apply_popular_bucket_deltas(batch, [(show_id, None, "2024-08-01T10:15:00+00:00"),
+                                            (show_id, None, "2024-08-02T11:45:00+00:00")], now=end)
+        batch.commit()
+        seal_popular_buckets(end)
+
+        requested = []
+        get_many = popular_bucket_counter.get_many
+        monkeypatch.setattr(popular_bucket_counter, "get_many",
+                            lambda counter_ids, cached=True: requested.extend(counter_ids) or get_many(counter_ids, cached))
+        assert dict(top_recent_shows(end - timedelta(days=2), end).top(1000))[show_id] == 2
+        # Only today's bucket is still open
+        assert requested == ["day_20240802"]
+
+class TestPopularSnapshots:
+    def test_served_from_snapshot(self, get_client):
+        from teli_routes import refresh_popular_snapshots
+        client = get_client
+        refresh_popular_snapshots(client.application)
+        response = client.get('/shows/popular?timeframe=7&num_most_popular=5')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['computed_at'] is not None
+        assert data['timeframe_days'] == 7
+        assert len(data['popular_shows']) <= 5
+
+        # A second read returns the same snapshot rather than recomputing
+        again = client.get('/shows/popular?timeframe=7').get_json()
+        assert again['computed_at'] == data['computed_at']
+
+    def test_other_timeframes_computed_live(self, get_client):
+        response = get_client.get('/shows/popular?timeframe=3')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['timeframe_days'] == 3
+        assert data['computed_at'] is not None
+
+class TestTrendingShows:
+    def test_trending_sort(self, get_client):
+        response = get_client.get('/shows/popular?sort=trending&num_most_popular=5')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['sort'] == 'trending'
+        assert data['half_life_hours'] > 0
+        assert len(data['popular_shows']) <= 5
+
+    def test_invalid_sort(self, get_client):
+        response = get_client.get('/shows/popular?sort=random')
+        assert response.status_code == 400
+        assert 'sort must be one of' in response.get_json()['error']
+
+class TestPopularFilters:
+    def test_facet_counters(self, get_client):
+        from show_metadata import show_metadata_cache, show_facets
+        from aggregates import top_recent_shows
+        client = get_client
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        user_id = client.post(
+            "/add_user",
+            json={
+                "email": f"popular_filters_{timestamp}@example.com",
+                "name": "Popular Filters User",
+                "username": f"popular_filters_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        ).get_json()["id"]
+        drama = f"filter_drama_{timestamp}"
+        comedy = f"filter_comedy_{timestamp}"
+        show_metadata_cache.record(drama, {"genres": [{"id": 18, "name": "Drama"}], "original_language": "ko"})
+        show_metadata_cache.record(comedy, {"genres": [{"id": 35, "name": "Comedy"}], "original_language": "ko"})
+        assert show_facets(show_metadata_cache.get_many([drama])[drama]) == ["genre_18", "lang_ko"]
+
+        for show_id in (drama, comedy):
+            client.post(
+                "/ratings",
+                json={"user_id": user_id, "show_id": show_id, "rating": 8},
+                headers={"Content-Type": "application/json"}
+            )
+
+        end = datetime.now(timezone.utc)
+        dramas = dict(top_recent_shows(end - timedelta(days=1), end, "genre_18").top(1000))
+        assert dramas.get(drama) == 1
+        assert comedy not in dramas
+        korean = dict(top_recent_shows(end - timedelta(days=1), end, "lang_ko").top(1000))
+        assert korean.get(drama) == 1 and korean.get(comedy) == 1
+
+    def test_facets_taken_back_match_those_counted(self, get_client, get_db, monkeypatch):
+        import teli_routes
+        from show_metadata import show_metadata_cache
+        client = get_client
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        user_id = client.post(
+            "/add_user",
+            json={
+                "email": f"facet_drift_{timestamp}@example.com",
+                "name": "Facet Drift User",
+                "username": f"facet_drift_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        ).get_json()["id"]
+        show_id = f"facet_drift_{timestamp}"
+
+        # Rated before the show's details are known, so it isn't counted under any facet
+        rating_id = client.post(
+            "/ratings",
+            json={"user_id": user_id, "show_id": show_id, "rating": 6},
+            headers={"Content-Type": "application/json"}
+        ).get_json()["id"]
+        rating_ref = get_db.collection("ratings").document(rating_id)
+        assert rating_ref.get().to_dict()["facets"] == []
+        earlier = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
+        rating_ref.update({"timestamp": earlier, "counted_at": earlier})
+
+        show_metadata_cache.record(show_id, {"genres": [{"id": 18, "name": "Drama"}], "original_language": "ko"})
+        facet_changes = []
+        apply_deltas = teli_routes.apply_popular_bucket_deltas
+
+        def record_deltas(writer, changes, facets=None, overall=True, now=None):
+            if not overall:
+                facet_changes.append((changes, facets))
+            return apply_deltas(writer, changes, facets, overall, now)
+        monkeypatch.setattr(teli_routes, "apply_popular_bucket_deltas", record_deltas)
+
+        client.post(
+            "/ratings",
+            json={"user_id": user_id, "show_id": show_id, "rating": 9},
+            headers={"Content-Type": "application/json"}
+        )
+
+        # The old buckets never gained the rating under its facets, so they don't lose it
+        rating_data = rating_ref.get().to_dict()
+        assert rating_data["facets"] == ["genre_18", "lang_ko"]
+        assert facet_changes == [([(show_id, None, rating_data["counted_at"])],
+                                  {show_id: ["genre_18", "lang_ko"]})]
+
+    def test_filtered_request(self, get_client):
+        response = get_client.get('/shows/popular?genre=18&original_language=EN')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['genre'] == 18
+        assert data['original_language'] == 'en'
+
+    def test_invalid_filters(self, get_client):
+        client = get_client
+        assert client.get('/shows/popular?genre=drama').status_code == 400
+        assert client.get('/shows/popular?original_language=english').status_code == 400
+        assert client.get('/shows/popular?genre=18&sort=trending').status_code == 400
+
+class TestScheduler:
+    def test_skips_task_still_running(self):
+        import threading
+        from scheduler import Scheduler
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def task():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+
+        scheduler = Scheduler(enabled=True)
+        scheduler.every(0, task)
+        scheduler.run_due()
+        assert started.wait(5)
+        scheduler.run_due()
+        release.set()
+        assert len(calls) == 1
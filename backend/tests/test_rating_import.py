@@ -0,0 +1,143 @@
+import io
+import json
+import pytest
+from datetime import datetime
+
+@pytest.fixture(scope="module")
+def import_users(get_client):
+    client = get_client
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    user_ids = []
+    for role in ("importer", "follower"):
+        response = client.post(
+            "/add_user",
+            json={
+                "email": f"import_{role}_{timestamp}@example.com",
+                "name": f"Import {role.title()}",
+                "username": f"import_{role}_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        user_ids.append(response.get_json()["id"])
+
+    client.post(
+        "/follow",
+        json={"follower_id": user_ids[1], "followee_id": user_ids[0]},
+        headers={"Content-Type": "application/json"}
+    )
+    return {"importer_id": user_ids[0], "follower_id": user_ids[1], "timestamp": timestamp}
+
+class TestRatingImport:
+    def test_import_json(self, get_client, import_users):
+        client = get_client
+        importer_id = import_users["importer_id"]
+        show_ids = [f"import_show_{i}_{import_users['timestamp']}" for i in range(3)]
+
+        response = client.post(
+            f"/users/{importer_id}/ratings/import",
+            json=[{"show_id": show_id, "rating": 7 + i} for i, show_id in enumerate(show_ids)],
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 201
+        assert response.get_json()["imported"] == 3
+
+        ratings = client.get(f"/users/{importer_id}/ratings").get_json()
+        assert {rating["show_id"] for rating in ratings} >= set(show_ids)
+
+        summary = client.get(f"/shows/{show_ids[2]}/ratings/summary").get_json()
+        assert summary["count"] == 1
+        assert summary["sum"] == 9
+
+        progress = client.get(
+            f"/users/{importer_id}/ratings/import/{response.get_json()['import_id']}").get_json()
+        assert progress["status"] == "done"
+        assert progress["imported"] == 3
+
+    def test_import_is_one_feed_item(self, get_client, import_users):
+        feed = get_client.get(f"/users/{import_users['follower_id']}/feed").get_json()["feed"]
+        imports = [item for item in feed if item.get("kind") == "rating_import"]
+        assert len(imports) == 1
+        assert imports[0]["rating_count"] == 3
+        assert imports[0]["ratings"][0]["rating"] == 9
+
+    def test_import_csv(self, get_client, import_users):
+        client = get_client
+        show_id = f"import_csv_show_{import_users['timestamp']}"
+        response = client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            data=f"show_id,rating,comment\n{show_id},6,\n",
+            headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == 201
+        assert response.get_json()["imported"] == 1
+
+    def test_import_json_file(self, get_client, import_users):
+        client = get_client
+        show_id = f"import_json_file_show_{import_users['timestamp']}"
+        body = json.dumps({"ratings": [{"show_id": show_id, "rating": 7}]}).encode()
+        response = client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            data={"file": (io.BytesIO(body), "ratings.json")},
+            content_type="multipart/form-data"
+        )
+        assert response.status_code == 201
+        assert response.get_json()["imported"] == 1
+
+    @pytest.mark.parametrize("body", [b'{"show_id": "not_a_list"}', b'[{"show_id": ', b'\xff\xfe\x00'])
+    def test_import_rejects_unreadable_json_file(self, get_client, import_users, body):
+        response = get_client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            data={"file": (io.BytesIO(body), "ratings.json")},
+            content_type="multipart/form-data"
+        )
+        assert response.status_code == 400
+        assert response.get_json()["error"]
+
+    def test_import_does_not_spike_popular_or_trending(self, get_client, import_users):
+        from aggregates import get_show_rating_stats, decayed_trending_score
+        client = get_client
+        show_ids = [f"import_history_show_{i}_{import_users['timestamp']}" for i in range(2)]
+        before = client.get("/shows/popular?timeframe=3").get_json()["total_shows_found"]
+
+        # One rating with its original time, one without any
+        response = client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            data=f"show_id,rating,timestamp\n{show_ids[0]},8,2021-03-14\n{show_ids[1]},9,\n",
+            headers={"Content-Type": "text/csv"}
+        )
+        assert response.status_code == 201
+
+        assert client.get("/shows/popular?timeframe=3").get_json()["total_shows_found"] == before
+        for show_id in show_ids:
+            stats = get_show_rating_stats(show_id)
+            assert stats["count"] == 1
+            assert decayed_trending_score(stats.get("trending_score"), stats.get("trending_updated_at")) < 0.01
+        ratings = {rating["show_id"]: rating for rating in
+                   client.get(f"/users/{import_users['importer_id']}/ratings").get_json()}
+        assert ratings[show_ids[0]]["timestamp"].startswith("2021-03-14")
+
+    def test_import_rejects_future_timestamps(self, get_client, import_users):
+        response = get_client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            json=[{"show_id": "from_the_future", "rating": 5, "timestamp": "2999-01-01T00:00:00Z"}],
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 400
+        assert response.get_json()["errors"][0]["loc"][:2] == [0, "timestamp"]
+
+    def test_import_rejects_invalid_rows(self, get_client, import_users):
+        response = get_client.post(
+            f"/users/{import_users['importer_id']}/ratings/import",
+            json=[{"show_id": "fine", "rating": 5}, {"show_id": "too_high", "rating": 11}],
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 400
+        assert response.get_json()["errors"][0]["loc"][0] == 1
+
+    def test_import_user_not_found(self, get_client):
+        response = get_client.post(
+            "/users/nonexistent_user_id/ratings/import",
+            json=[{"show_id": "any_show", "rating": 5}],
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 404
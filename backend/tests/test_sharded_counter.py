@@ -0,0 +1,68 @@
+from datetime import datetime
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from sharded_counter import ShardedCounter
+
+def _counter_id(name):
+    return f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+class TestShardedCounter:
+    def test_shards_are_summed(self, get_db):
+        counter = ShardedCounter("test_counters", num_shards=4)
+        counter_id = _counter_id("summed")
+        batch = get_db.batch()
+        for shard, (count, rated_at) in enumerate([(2, "2024-05-10T10:00:00+00:00"),
+                                                  (3, "2024-05-11T10:00:00+00:00")]):
+            counter.increment(batch, counter_id, {"count": firestore.Increment(count),
+                                                  "histogram": {"8": firestore.Increment(count)},
+                                                  "last_rated_at": rated_at}, shard=shard)
+        batch.commit()
+
+        totals = counter.get(counter_id)
+        assert totals["count"] == 5
+        assert totals["histogram"] == {"8": 5}
+        # Fields that aren't numbers take their largest value
+        assert totals["last_rated_at"] == "2024-05-11T10:00:00+00:00"
+
+    def test_unknown_counter(self):
+        counter = ShardedCounter("test_counters", num_shards=4)
+        assert counter.get(_counter_id("unknown")) is None
+
+    def test_increment_drops_cached_total(self, get_db):
+        counter = ShardedCounter("test_counters", num_shards=4)
+        counter_id = _counter_id("cached")
+        batch = get_db.batch()
+        counter.increment(batch, counter_id, {"count": firestore.Increment(1)})
+        batch.commit()
+        assert counter.get(counter_id)["count"] == 1
+
+        batch = get_db.batch()
+        counter.increment(batch, counter_id, {"count": firestore.Increment(1)})
+        batch.commit()
+        assert counter.get(counter_id)["count"] == 2
+
+    def test_set_replaces_every_shard(self, get_db):
+        counter = ShardedCounter("test_counters", num_shards=4)
+        counter_id = _counter_id("reset")
+        batch = get_db.batch()
+        for shard in range(4):
+            counter.increment(batch, counter_id, {"count": firestore.Increment(1)}, shard=shard)
+        batch.commit()
+
+        batch = get_db.batch()
+        counter.set(batch, counter_id, {"count": 7})
+        batch.commit()
+        assert counter.get(counter_id) == {"count": 7}
+        assert len([ref for ref in counter.shard_refs(counter_id) if ref.get().exists]) == 1
+
+    def test_query_by_label(self, get_db):
+        counter = ShardedCounter("test_counters", num_shards=4)
+        label = _counter_id("label")
+        batch = get_db.batch()
+        for shard in range(2):
+            counter.increment(batch, f"{label}_a", {"label": label, "count": firestore.Increment(2)}, shard=shard)
+        counter.increment(batch, f"{label}_b", {"label": label, "count": firestore.Increment(1)})
+        batch.commit()
+
+        totals = counter.query(FieldFilter("label", "==", label))
+        assert totals == {f"{label}_a": {"label": label, "count": 4}, f"{label}_b": {"label": label, "count": 1}}
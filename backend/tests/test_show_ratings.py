@@ -0,0 +1,116 @@
+import pytest
+from datetime import datetime
+
+@pytest.fixture(scope="module")
+def show_ratings_data(get_client):
+    client = get_client
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    user_ids = []
+    for i in range(3):
+        response = client.post(
+            "/add_user",
+            json={
+                "email": f"showratings_{i}_{timestamp}@example.com",
+                "name": f"Show Ratings User {i}",
+                "username": f"showratings_{i}_{timestamp}"
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        user_ids.append(response.get_json()["id"])
+
+    # A show id unique to this run so the aggregate starts from zero
+    show_id = f"summary_show_{timestamp}"
+    for user_id, rating in zip(user_ids, (6, 8, 10)):
+        client.post(
+            "/ratings",
+            json={"user_id": user_id, "show_id": show_id, "rating": rating},
+            headers={"Content-Type": "application/json"}
+        )
+
+    return {"user_ids": user_ids, "show_id": show_id}
+
+class TestShowRatingsSummary:
+    def test_summary(self, get_client, show_ratings_data):
+        response = get_client.get(f"/shows/{show_ratings_data['show_id']}/ratings/summary")
+        assert response.status_code == 200
+        summary = response.get_json()
+        assert summary["count"] == 3
+        assert summary["sum"] == 24
+        assert summary["average"] == 8
+        assert summary["histogram"]["6"] == 1
+        assert summary["histogram"]["8"] == 1
+        assert summary["histogram"]["10"] == 1
+        assert summary["last_rated_at"] is not None
+
+    def test_summary_applies_edit_delta(self, get_client, show_ratings_data):
+        client = get_client
+        show_id = show_ratings_data["show_id"]
+        # Change the first user's rating from 6 to 9
+        client.post(
+            "/ratings",
+            json={"user_id": show_ratings_data["user_ids"][0], "show_id": show_id, "rating": 9},
+            headers={"Content-Type": "application/json"}
+        )
+        summary = client.get(f"/shows/{show_id}/ratings/summary").get_json()
+        assert summary["count"] == 3
+        assert summary["sum"] == 27
+        assert summary["histogram"]["6"] == 0
+        assert summary["histogram"]["9"] == 1
+
+    def test_summary_for_unrated_show(self, get_client):
+        response = get_client.get("/shows/never_rated_show/ratings/summary")
+        assert response.status_code == 200
+        summary = response.get_json()
+        assert summary["count"] == 0
+        assert summary["average"] is None
+
+class TestShowRatingsListing:
+    def test_pagination_cursor(self, get_client, show_ratings_data):
+        client = get_client
+        show_id = show_ratings_data["show_id"]
+        first = client.get(f"/shows/{show_id}/ratings?limit=2")
+        assert first.status_code == 200
+        assert len(first.get_json()) == 2
+        cursor = first.headers.get("X-Next-Cursor")
+        assert cursor is not None
+
+        second = client.get(f"/shows/{show_id}/ratings?limit=2&cursor={cursor}")
+        assert second.status_code == 200
+        assert len(second.get_json()) == 1
+        assert "X-Next-Cursor" not in second.headers
+        first_ids = {rating["id"] for rating in first.get_json()}
+        assert second.get_json()[0]["id"] not in first_ids
+
+    def test_sort_highest(self, get_client, show_ratings_data):
+        response = get_client.get(f"/shows/{show_ratings_data['show_id']}/ratings?sort=highest")
+        assert response.status_code == 200
+        values = [rating["rating"] for rating in response.get_json()]
+        assert values == sorted(values, reverse=True)
+
+    def test_ndjson(self, get_client, show_ratings_data):
+        response = get_client.get(f"/shows/{show_ratings_data['show_id']}/ratings?format=ndjson")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        lines = [line for line in response.get_data(as_text=True).splitlines() if line]
+        assert len(lines) == 3
+
+    def test_rerating_keeps_one_document(self, get_client, show_ratings_data):
+        client = get_client
+        show_id = show_ratings_data["show_id"]
+        user_id = show_ratings_data["user_ids"][1]
+        ids = set()
+        for rating in (8, 5):
+            response = client.post(
+                "/ratings",
+                json={"user_id": user_id, "show_id": show_id, "rating": rating},
+                headers={"Content-Type": "application/json"}
+            )
+            ids.add(response.get_json()["id"])
+        assert len(ids) == 1
+
+        ratings = client.get(f"/shows/{show_id}/ratings").get_json()
+        assert [rating["rating"] for rating in ratings if rating["user_id"] == user_id] == [5]
+
+    def test_invalid_sort(self, get_client, show_ratings_data):
+        response = get_client.get(f"/shows/{show_ratings_data['show_id']}/ratings?sort=random")
+        assert response.status_code == 400
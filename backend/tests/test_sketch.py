@@ -0,0 +1,46 @@
+import random
+from sketch import SpaceSaving
+
+class TestSpaceSaving:
+    def test_small_counts_are_exact(self):
+        summary = SpaceSaving.from_counts({"a": 3, "b": 1}, capacity=5)
+        summary.merge(SpaceSaving.from_counts({"b": 4, "c": 2}, capacity=5))
+        assert summary.exact
+        assert summary.top(2) == [("b", 5), ("a", 3)]
+        assert len(summary) == 3
+
+    def test_merge_keeps_bounds(self):
+        rng = random.Random(3)
+        truth = {}
+        summary = SpaceSaving(capacity=20)
+        for _ in range(24):
+            counts = {}
+            for _ in range(500):
+                show_id = f"show_{int(rng.paretovariate(1.2))}"
+                counts[show_id] = counts.get(show_id, 0) + 1
+                truth[show_id] = truth.get(show_id, 0) + 1
+            summary.merge(SpaceSaving.from_counts(counts, capacity=20))
+
+        assert len(summary) == 20
+        assert not summary.exact
+        for show_id, count in summary.counts.items():
+            # Kept counts overestimate by at most their error
+            assert truth[show_id] <= count
+            assert count - summary.errors[show_id] <= truth[show_id]
+        for show_id, count in truth.items():
+            if show_id not in summary.counts:
+                assert count <= summary.floor
+        # The heaviest shows are never lost
+        heaviest = sorted(truth, key=truth.get, reverse=True)[:3]
+        assert [show_id for show_id, _ in summary.top(3)] == heaviest
+
+    def test_round_trip(self):
+        summary = SpaceSaving.from_counts({"a": 5, "b": 3, "c": 1}, capacity=2)
+        restored = SpaceSaving.from_dict(summary.to_dict())
+        assert restored.counts == {"a": 5, "b": 3}
+        assert restored.floor == 1
+
+    def test_subtract_removes_moved_counts(self):
+        summary = SpaceSaving.from_counts({"a": 3, "b": 1}, capacity=5)
+        summary.subtract({"a": 1, "b": 1, "c": 2})
+        assert summary.top(5) == [("a", 2)]
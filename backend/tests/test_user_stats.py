@@ -0,0 +1,60 @@
+import pytest
+from datetime import datetime
+
+@pytest.fixture(scope="module")
+def stats_user(get_client):
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    response = get_client.post(
+        "/add_user",
+        json={
+            "email": f"stats_{timestamp}@example.com",
+            "name": "Stats User",
+            "username": f"stats_{timestamp}"
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    return {"id": response.get_json()["id"], "timestamp": timestamp}
+
+class TestUserStats:
+    def test_stats_before_rating(self, get_client, stats_user):
+        response = get_client.get(f"/users/{stats_user['id']}/stats")
+        assert response.status_code == 200
+        stats = response.get_json()
+        assert stats["count"] == 0
+        assert stats["average"] is None
+        assert stats["episode_rating_count"] == 0
+
+    def test_stats_follow_ratings(self, get_client, stats_user):
+        client = get_client
+        user_id = stats_user["id"]
+        show_id = f"stats_show_{stats_user['timestamp']}"
+        for rating in (4, 8):
+            # The second rating replaces the first
+            client.post(
+                "/ratings",
+                json={"user_id": user_id, "show_id": show_id, "rating": rating},
+                headers={"Content-Type": "application/json"}
+            )
+        client.post(
+            "/ratings",
+            json={"user_id": user_id, "show_id": f"{show_id}_2", "rating": 6},
+            headers={"Content-Type": "application/json"}
+        )
+        client.post(
+            "/episode_ratings",
+            json={"user_id": user_id, "show_id": show_id, "season_number": 1,
+                  "episode_number": 1, "rating": 9},
+            headers={"Content-Type": "application/json"}
+        )
+
+        stats = client.get(f"/users/{user_id}/stats").get_json()
+        assert stats["count"] == 2
+        assert stats["sum"] == 14
+        assert stats["average"] == 7
+        assert stats["histogram"]["4"] == 0
+        assert stats["histogram"]["8"] == 1
+        assert stats["episode_rating_count"] == 1
+
+    def test_stats_user_not_found(self, get_client):
+        response = get_client.get("/users/nonexistent_user_id/stats")
+        assert response.status_code == 404
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 import requests
 import logging
 import os
+from show_metadata import show_metadata_cache, metadata_from_details
 
 logger = logging.getLogger(__name__)
 
@@ -284,6 +285,20 @@ def get_content_ratings(series_id):
     except Exception as e:
         return handle_tmdb_api_error(e)
 
+def fetch_show_metadata(series_id):
+    """Fetch a show from TMDB only to record its genres and language; returns them or None"""
+    try:
+        response = requests.get(f"{TMDB_BASE_URL}/tv/{series_id}", headers=get_tmdb_headers())
+        if response.status_code != 200:
+            logger.error(f"TMDB API error fetching metadata for {series_id}: {response.status_code}")
+            return None
+        details = response.json()
+    except Exception as e:
+        logger.error(f"Error fetching metadata for {series_id}: {e}")
+        return None
+    show_metadata_cache.record(series_id, details)
+    return metadata_from_details(details)
+
 @tmdb.route("/shows/<series_id>", methods=["GET"])
 def get_show_details(series_id):
     url = f"{TMDB_BASE_URL}/tv/{series_id}"
@@ -299,6 +314,11 @@ def get_show_details(series_id):
             
         response.raise_for_status()
         result = response.json()
+        # Genres and language back the popular shows filters
+        try:
+            show_metadata_cache.record(series_id, result)
+        except Exception as e:
+            logger.error(f"Error recording metadata for {series_id}: {e}")
         wanted_fields = [
             "backdrop_path",
             "created_by",